@@ -4,6 +4,138 @@ from dotenv import load_dotenv
 load_dotenv()
 
 GENAI_API_KEY = os.getenv("GENAI_API_KEY")
-BRAIN_MODEL_PATH = "models/brain_model.h5"
-LUNG_MODEL_PATH = "models/lung_tumor.h5"
-BREAST_MODEL_PATH = "models/breast_tumor.h5"
+BRAIN_MODEL_PATH = os.getenv("BRAIN_MODEL_PATH", "models/brain_model.h5")
+LUNG_MODEL_PATH = os.getenv("LUNG_MODEL_PATH", "models/lung_tumor.h5")
+BREAST_MODEL_PATH = os.getenv("BREAST_MODEL_PATH", "models/breast_tumor.h5")
+
+# Organ models kept resident on this node (comma separated, e.g. "Brain,Lung");
+# empty for pods that only serve routes without a classifier (e.g. /process-image)
+ENABLED_ORGANS = [o.strip() for o in os.getenv("ENABLED_ORGANS", "Brain,Lung,Breast").split(",") if o.strip()]
+# Run a dummy forward pass after loading so the first request doesn't pay for graph tracing
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "true").lower() == "true"
+
+# Dynamic micro-batching for the organ classifiers
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "5"))
+
+# Bulk prediction: images per inference chunk and threads used for decoding
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "32"))
+BULK_DECODE_WORKERS = int(os.getenv("BULK_DECODE_WORKERS", str(os.cpu_count() or 4)))
+
+# Inference backend per organ: "keras" (default), "tflite", "tflite-float16" or "tflite-int8"
+# e.g. MODEL_BACKENDS="Brain=tflite-int8,Lung=tflite"
+MODEL_BACKENDS = dict(
+    item.split("=", 1) for item in os.getenv("MODEL_BACKENDS", "").replace(" ", "").split(",") if "=" in item
+)
+TFLITE_MODEL_DIR = os.getenv("TFLITE_MODEL_DIR", "models/tflite")
+TFLITE_NUM_THREADS = int(os.getenv("TFLITE_NUM_THREADS", str(os.cpu_count() or 1)))
+
+# LLM client: "gemini" or "fake" (canned responses for offline load tests)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "gemini-1.5-pro")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1.0"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "20"))
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "500"))
+FAKE_LLM_RESPONSE_FILE = os.getenv("FAKE_LLM_RESPONSE_FILE")
+# Create the LLM client during warm-up rather than on the first LLM request
+LLM_PRELOAD = os.getenv("LLM_PRELOAD", "true").lower() == "true"
+
+# Image payload sent to the LLM: downscaled to LLM_IMAGE_MAX_EDGE (0 keeps the size),
+# single-channel when the scan is grayscale, re-encoded as LLM_IMAGE_FORMAT (jpeg,
+# webp or png) at LLM_IMAGE_QUALITY; uploads up to LLM_IMAGE_SKIP_BYTES are sent as is
+LLM_IMAGE_REDUCTION = os.getenv("LLM_IMAGE_REDUCTION", "true").lower() == "true"
+LLM_IMAGE_MAX_EDGE = int(os.getenv("LLM_IMAGE_MAX_EDGE", "1536"))
+LLM_IMAGE_FORMAT = os.getenv("LLM_IMAGE_FORMAT", "jpeg")
+LLM_IMAGE_QUALITY = int(os.getenv("LLM_IMAGE_QUALITY", "90"))
+LLM_IMAGE_SKIP_BYTES = int(os.getenv("LLM_IMAGE_SKIP_BYTES", str(256 * 1024)))
+LLM_IMAGE_GRAYSCALE = os.getenv("LLM_IMAGE_GRAYSCALE", "true").lower() == "true"
+
+# Stage cache limits
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "3600"))
+# Cache storage: "memory" (per process), "sqlite" (shared on-disk) or "redis" (shared across pods)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "cache/stage_cache.sqlite3")
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# Execution of CPU-bound stages (roi, parse, preprocess, predict): "thread" or "process"
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "thread")
+# Per-stage overrides, e.g. STAGE_EXECUTION_MODES="roi=process,parse=thread".
+# With predict=process, batches are still formed by the micro-batcher and each
+# batch's forward pass runs in a worker that keeps its own copy of the models
+STAGE_EXECUTION_MODES = dict(
+    item.split("=", 1) for item in os.getenv("STAGE_EXECUTION_MODES", "").replace(" ", "").split(",") if "=" in item
+)
+# Worker count per stage, e.g. STAGE_POOL_SIZES="roi=4,parse=2,preprocess=4,predict=2"
+STAGE_POOL_SIZES = {
+    stage: int(size) for stage, size in (
+        item.split("=", 1) for item in os.getenv("STAGE_POOL_SIZES", "").replace(" ", "").split(",") if "=" in item
+    )
+}
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+
+def _int_map(value):
+    # "a=1,b=2" -> {"a": 1, "b": 2}
+    return {k: int(v) for k, v in (item.split("=", 1) for item in value.replace(" ", "").split(",") if "=" in item)}
+
+
+# Admission control. Concurrent requests per endpoint (chat, analyze, predict,
+# predict-bulk for the /batch and /volume streams, process-image) and how many
+# more may wait; requests beyond that get 429, and requests waiting longer than
+# ADMISSION_TIMEOUT_SECONDS get 503, with Retry-After.
+# Settings override the defaults per name; 0 removes a limit.
+ENDPOINT_CONCURRENCY = {
+    "chat": 16, "analyze": 16, "predict": 64, "predict-bulk": 4, "process-image": 32,
+    **_int_map(os.getenv("ENDPOINT_CONCURRENCY", "")),
+}
+ENDPOINT_QUEUE_SIZES = {
+    "chat": 32, "analyze": 32, "predict": 256, "predict-bulk": 16, "process-image": 128,
+    **_int_map(os.getenv("ENDPOINT_QUEUE_SIZES", "")),
+}
+# The same for the pipeline stages (llm, roi, predict) shared by the endpoints
+STAGE_CONCURRENCY = {"llm": LLM_MAX_CONCURRENCY, "roi": 16, "predict": 64, **_int_map(os.getenv("STAGE_CONCURRENCY", ""))}
+STAGE_QUEUE_SIZES = {"llm": 64, "roi": 128, "predict": 256, **_int_map(os.getenv("STAGE_QUEUE_SIZES", ""))}
+ADMISSION_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_TIMEOUT_SECONDS", "10"))
+# Priority class per endpoint (interactive, standard, batch): waiters for a shared stage are served in class order
+ENDPOINT_PRIORITIES = {
+    "process-image": "interactive", "predict": "interactive", "predict-bulk": "batch", "analyze": "standard",
+    "chat": "standard",
+    **dict(item.split("=", 1) for item in os.getenv("ENDPOINT_PRIORITIES", "").replace(" ", "").split(",") if "=" in item),
+}
+
+# Upload size limits in bytes (0 disables a limit): each uploaded image, and the
+# whole request body, which is counted while it streams in
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(32 * 1024 * 1024)))
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(256 * 1024 * 1024)))
+
+# Volumetric scans (/api/predict/{organ_type}/volume): slices listed in the study
+# summary as the most confident; slices are classified BULK_CHUNK_SIZE at a time
+VOLUME_TOP_SLICES = int(os.getenv("VOLUME_TOP_SLICES", "5"))
+# Largest volume upload (in place of UPLOAD_MAX_FILE_BYTES) and largest voxel data
+# once decompressed (a .nii.gz, or one DICOM file of a series), checked before it
+# is written out or mapped (0 disables)
+VOLUME_MAX_BYTES = int(os.getenv("VOLUME_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Background jobs (/api/jobs): worker tasks, queue bound (0 = unbounded), store
+# ("memory", or "sqlite" to keep queued jobs across restarts), how long finished
+# jobs are kept, longest long-poll, and attempts for a job shed by admission control
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "1000"))
+JOB_STORE = os.getenv("JOB_STORE", "memory")
+JOB_SQLITE_PATH = os.getenv("JOB_SQLITE_PATH", "jobs/jobs.sqlite3")
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+JOB_CLEANUP_INTERVAL_SECONDS = float(os.getenv("JOB_CLEANUP_INTERVAL_SECONDS", "60"))
+JOB_MAX_WAIT_SECONDS = float(os.getenv("JOB_MAX_WAIT_SECONDS", "30"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Observability: Prometheus /metrics, per-request Server-Timing header and an
+# optional sampling profiler (interval in ms, 0 disables it) served at /debug/profile
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "true").lower() == "true"
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "0"))
@@ -1,14 +1,128 @@
-from fastapi import FastAPI
-from app.routers import analysis, prediction, chat, image_processing
+import time
+
+_import_started = time.perf_counter()
+
+import logging
+from functools import partial
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from app.config import (
+    METRICS_ENABLED, SERVER_TIMING_HEADER, PROFILER_INTERVAL_MS, LLM_PRELOAD, LOG_LEVEL,
+    UPLOAD_MAX_FILE_BYTES, UPLOAD_MAX_REQUEST_BYTES,
+)
+from app.routers import analysis, prediction, chat, image_processing, health, jobs as job_routes
+from app.services.admission import AdmissionMiddleware, Overloaded, admission, overloaded_response
+from app.services.llm_service import get_llm_backend
+from app.services.jobs import jobs
+from app.services.model_registry import model_registry
+from app.services.pipeline import image_cache, in_flight
+from app.services.warmup import warmup
+from app.utils.metrics import MetricsMiddleware, registry
+from app.utils.profiler import start_profiler
+from app.utils.uploads import UploadLimitMiddleware, UploadTooLarge, upload_too_large_response
+
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger(__name__)
+IMPORT_SECONDS = time.perf_counter() - _import_started
 
 app = FastAPI(title="Medical Scan Analysis API")
 
+# Cap request bodies and uploaded files while they stream in (innermost: only admitted requests are read)
+app.add_middleware(UploadLimitMiddleware, max_bytes=UPLOAD_MAX_REQUEST_BYTES, max_file_bytes=UPLOAD_MAX_FILE_BYTES)
+
+# Admit (or shed) requests per endpoint before their upload is read
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
+if METRICS_ENABLED:
+    # Request/stage histograms and the Server-Timing header; added last so it
+    # is outermost and also times requests shed by admission control
+    app.add_middleware(MetricsMiddleware, server_timing=SERVER_TIMING_HEADER)
+
+
+@app.exception_handler(Overloaded)
+async def shed_overloaded(request, exc: Overloaded):
+    # A pipeline stage's queue was full or its wait timed out
+    return overloaded_response(exc)
+
+
+@app.exception_handler(UploadTooLarge)
+async def reject_large_upload(request, exc: UploadTooLarge):
+    # An uploaded file or the request body is over its size limit
+    return upload_too_large_response(exc)
+
 # Include API endpoints
 app.include_router(analysis.router, prefix="/api")
 app.include_router(prediction.router, prefix="/api")
 app.include_router(chat.router, prefix="/api")
+app.include_router(job_routes.router, prefix="/api")
 app.include_router(image_processing.router, prefix="")
+app.include_router(health.router, prefix="")
+
+profiler = None
+
+
+@app.on_event("startup")
+async def start_warmup():
+    # Create the LLM client and load and warm the enabled organ models in the
+    # background: the server answers probes at once and /health/ready flips
+    # when everything is resident
+    logger.info("Application imported in %.2fs", IMPORT_SECONDS)
+    if LLM_PRELOAD:
+        warmup.add("llm_client", get_llm_backend)
+    for organ in model_registry.enabled_organs:
+        warmup.add(f"model:{organ}", partial(model_registry.get, organ))
+    warmup.start()
+
+
+@app.on_event("startup")
+async def start_job_workers():
+    # Background job workers; a durable job store also re-queues unfinished jobs
+    await jobs.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    await jobs.stop()
+
+
+@app.on_event("startup")
+async def start_sampling_profiler():
+    global profiler
+    profiler = start_profiler(PROFILER_INTERVAL_MS)
+
+
+@app.on_event("shutdown")
+async def stop_sampling_profiler():
+    if profiler is not None:
+        profiler.stop()
+
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to Medical Scan Analysis API"}
\ No newline at end of file
+    return {"message": "Welcome to Medical Scan Analysis API"}
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return {**image_cache.stats(), "coalescing": in_flight.stats()}
+
+
+@app.get("/api/admission/stats")
+async def admission_stats():
+    return admission.stats()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus text exposition of the service metrics."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/profile", include_in_schema=False)
+async def debug_profile(reset: bool = False):
+    """Stacks sampled by the profiler (PROFILER_INTERVAL_MS) in collapsed format, for flame graphs."""
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Profiler is disabled; set PROFILER_INTERVAL_MS")
+    return PlainTextResponse(profiler.collapsed(reset=reset))
@@ -1,27 +1,37 @@
 from fastapi import APIRouter, UploadFile, File
 from fastapi.responses import JSONResponse
-from app.services.llm_service import analyze_medical_scan_with_context
-import mimetypes
+from app.services.pipeline import run_llm
 from app.utils.ResponseParser import parse_medical_scan_result
+from app.utils.metrics import stage_timer
+from app.utils.uploads import read_image
+from app.services.admission import Overloaded
 
 router = APIRouter()
 
-@router.post("/analyze")
-async def analyze_image(file: UploadFile = File(...)):
-    # Read file contents into memory
-    contents = await file.read()
 
-    try:
-        # Detect MIME type from the filename
-        mime_type = mimetypes.guess_type(file.filename)[0] or "image/jpeg"
+async def analyze_scan(image):
+    """The /api/analyze response for a DecodedImage (also run by background jobs)."""
+    # Process the image directly from memory
+    raw_result, _ = await run_llm(image)
 
-        # Process the image directly from memory
-        raw_result = analyze_medical_scan_with_context(contents, mime_type)
-
-        # Convert the raw markdown-formatted result into structured JSON
+    # Convert the raw markdown-formatted result into structured JSON
+    with stage_timer("parse"):
         structured_result = parse_medical_scan_result(raw_result)
 
-        return {"analysis_result": structured_result}
+    return {"analysis_result": structured_result}
+
+
+@router.post("/analyze")
+async def analyze_image(file: UploadFile = File(...)):
+    # Size-checked view of the upload; MIME type is detected from the filename
+    with stage_timer("read"):
+        image = await read_image(file)
+
+    try:
+        return await analyze_scan(image)
+    except Overloaded:
+        # Answered with 429/503 and Retry-After by the app's exception handler
+        raise
     except Exception as e:
         return JSONResponse(
             content={"error": str(e)},
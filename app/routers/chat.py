@@ -1,123 +1,260 @@
-from fastapi import APIRouter, File, UploadFile, Form
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, File, UploadFile, Form, Query, Request
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
-import mimetypes
-from app.utils.cache import ImageCache
+import json
 from app.utils.image_validator import is_medical_scan
-from app.utils.RegionOfIntrest import process_mri_image
-from app.services.llm_service import analyze_medical_scan_with_context
+from app.services.llm_service import analyze_medical_scan_async, stream_medical_scan_async
 from app.utils.ResponseParser import parse_medical_scan_result
-from app.services.classification_service import predict_tumor_from_memory
+from app.services.pipeline import run_roi, run_llm, run_prediction
+from app.utils.image_encoding import DEFAULT_ENCODING, EncodingOptions
+from app.utils.responses import (
+    encoding_options, multipart_response, negotiate_response_format, negotiate_stream_type, to_base64,
+)
 from asyncio import gather
-from concurrent.futures import ThreadPoolExecutor
-from functools import partial
+from app.services.executor import stage_executor
+from app.utils.metrics import stage_timer
+from app.utils.uploads import read_image
+from app.services.admission import Overloaded, admission
 import asyncio
 
 router = APIRouter()
 
-# Initialize cache
-image_cache = ImageCache()
+STREAM_MEDIA_TYPES = ("application/x-ndjson", "text/event-stream")
 
-# Initialize thread pool for CPU-intensive tasks
-thread_pool = ThreadPoolExecutor(max_workers=4)
 
-@router.post("/chat")
-async def chat_endpoint(
-        message: str = Form(...),
-        images: Optional[List[UploadFile]] = File(None)
-):
-    response = {
-        "message": "",
-        "image_analysis": []
-    }
+async def analyze_image_events(image, message, encoding=DEFAULT_ENCODING):
+    """
+    Run the ROI, LLM, parsing, validation and classification stages for one image,
+    yielding an (event, payload) pair as soon as each stage finishes:
+    "roi", "llm_analysis", "tumor_prediction", then "done" (or "error").
+    The roi payload carries raw image bytes. The image (a DecodedImage) is
+    decoded once and shared by the ROI, LLM and classifier stages.
+    """
 
-    async def process_single_image(image, loop):
-        contents = await image.read()
-        if not contents:
-            return None
-            
-        cached_result = image_cache.get(contents)
-        if cached_result:
-            return {
-                "filename": image.filename,
-                "analysis": cached_result,
-                "source": "cache"
-            }
+    # Run CPU-intensive tasks in parallel
+    roi_future = asyncio.ensure_future(run_roi(image, encoding))
 
-        try:
-            # Run CPU-intensive tasks in parallel
-            roi_future = loop.run_in_executor(
-                thread_pool, 
-                process_mri_image, 
-                contents
-            )
-            
-            # Run LLM analysis concurrently
-            mime_type = mimetypes.guess_type(image.filename)[0] or "image/jpeg"
-            llm_future = loop.run_in_executor(
-                None,
-                analyze_medical_scan_with_context,
-                contents, 
-                mime_type, 
-                message
-            )
+    # Run LLM analysis concurrently
+    llm_future = asyncio.ensure_future(run_llm(image, message))
+
+    try:
+        roi_result, roi_cached = await roi_future
+        yield "roi", roi_result
 
-            # Wait for parallel tasks to complete
-            roi_base64, heatmap_base64 = await roi_future
-            raw_results = await llm_future
-            
-            structured_result = await loop.run_in_executor(
-                None,
+        raw_results, llm_cached = await llm_future
+        with stage_timer("parse"):
+            structured_result = await stage_executor.run(
+                "parse",
                 parse_medical_scan_result,
                 raw_results
             )
 
-            if not is_medical_scan(contents, structured_result):
-                return {
-                    "filename": image.filename,
-                    "error": "Not a medical scan"
-                }
-
-            organ_type = structured_result.get("organ", "").strip()
-            if not organ_type or organ_type.lower() not in ["brain", "lung", "breast"]:
-                organ_type = "Brain"
-
-            prediction_result = None
-            if organ_type in ["Brain", "Lung", "Breast"]:
-                prediction_result = await loop.run_in_executor(
-                    thread_pool,
-                    predict_tumor_from_memory,
-                    contents,
-                    organ_type
-                )
-
-            analysis_result = {
-                "llm_analysis": structured_result,
-                "tumor_prediction": prediction_result,
-                "heatmap": heatmap_base64,
-                "roi": roi_base64
-            }
+        with stage_timer("is_medical_scan"):
+            is_scan = is_medical_scan(image, structured_result)
+        if not is_scan:
+            yield "error", {"error": "Not a medical scan"}
+            return
 
-            image_cache.set(contents, analysis_result)
+        yield "llm_analysis", structured_result
+
+        organ_type = structured_result.get("organ", "").strip()
+        if not organ_type or organ_type.lower() not in ["brain", "lung", "breast"]:
+            organ_type = "Brain"
+
+        prediction_result = None
+        prediction_cached = True
+        if organ_type in ["Brain", "Lung", "Breast"]:
+            prediction_result, prediction_cached = await run_prediction(
+                image,
+                organ_type
+            )
+
+        yield "tumor_prediction", prediction_result
+        yield "done", {"source": "cache" if roi_cached and llm_cached and prediction_cached else "processed"}
+
+    except Overloaded:
+        # Shed the whole request (429/503 with Retry-After) rather than report a per-image failure
+        raise
+    except Exception as e:
+        yield "error", {"error": str(e)}
+    finally:
+        # Don't leave stage tasks running if the client went away or a stage failed
+        for future in (roi_future, llm_future):
+            if not future.done():
+                future.cancel()
+
+
+async def analyze_image(image, message, encoding=DEFAULT_ENCODING, binary=False):
+    """
+    Collect the stage events of one image into the /api/chat JSON shape.
+    Images are base64 encoded unless binary is True.
+    """
+    analysis_result = {}
+    source = "processed"
+    filename = image.filename
+    encode = (lambda data: data) if binary else to_base64
+    async for event, payload in analyze_image_events(image, message, encoding):
+        if event == "error":
             return {
-                "filename": image.filename,
-                "analysis": analysis_result,
-                "source": "processed"
+                "filename": filename,
+                "error": payload["error"]
             }
+        if event == "roi":
+            analysis_result["heatmap"] = encode(payload["heatmap"])
+            analysis_result["roi"] = encode(payload["roi"])
+            analysis_result["mime_type"] = payload["mime_type"]
+        elif event == "llm_analysis":
+            analysis_result["llm_analysis"] = payload
+        elif event == "tumor_prediction":
+            analysis_result["tumor_prediction"] = payload
+        elif event == "done":
+            source = payload["source"]
 
+    result = {
+        "filename": filename,
+        "analysis": {
+            "llm_analysis": analysis_result.get("llm_analysis"),
+            "tumor_prediction": analysis_result.get("tumor_prediction"),
+            "heatmap": analysis_result.get("heatmap"),
+            "roi": analysis_result.get("roi")
+        },
+        "source": source
+    }
+    if binary:
+        # Needed to label the binary parts
+        result["mime_type"] = analysis_result.get("mime_type")
+    return result
+
+
+def _format_event(event: dict, media_type: str) -> str:
+    if media_type == "text/event-stream":
+        return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    return json.dumps(event) + "\n"
+
+
+async def stream_chat_events(uploads, message, encoding=DEFAULT_ENCODING):
+    """
+    Merge the per-image stage events and the streamed text answer into one
+    event stream, emitting each event as soon as it is ready.
+    """
+    queue = asyncio.Queue()
+
+    async def pump_image(index, image):
+        filename = image.filename
+        try:
+            async for event, payload in analyze_image_events(image, message, encoding):
+                if event == "roi":
+                    payload = dict(payload, heatmap=to_base64(payload["heatmap"]), roi=to_base64(payload["roi"]))
+                await queue.put({"event": event, "index": index, "filename": filename, "data": payload})
+        except Overloaded as e:
+            # The status line is already sent; report the shed stage as an event
+            data = {"error": str(e), "retry_after": e.retry_after}
+            await queue.put({"event": "error", "index": index, "filename": filename, "data": data})
+
+    async def pump_message():
+        try:
+            async with admission.stage("llm"):
+                async for chunk in stream_medical_scan_async(None, None, message):
+                    await queue.put({"event": "message_delta", "data": chunk})
+            await queue.put({"event": "message_done"})
         except Exception as e:
-            return {
-                "filename": image.filename,
-                "error": str(e)
-            }
+            await queue.put({"event": "message_error", "data": {"error": str(e)}})
+
+    producers = [pump_image(i, image) for i, image in enumerate(uploads)]
+    if message:
+        producers.append(pump_message())
+    tasks = [asyncio.ensure_future(p) for p in producers]
+
+    async def close_when_done():
+        await gather(*tasks, return_exceptions=True)
+        await queue.put(None)
+
+    closer = asyncio.ensure_future(close_when_done())
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield event
+        yield {"event": "end"}
+    finally:
+        for task in tasks + [closer]:
+            if not task.done():
+                task.cancel()
+
+
+@router.post("/chat")
+async def chat_endpoint(
+        request: Request,
+        message: str = Form(...),
+        images: Optional[List[UploadFile]] = File(None),
+        stream: bool = Form(False),
+        response_format: Optional[str] = Query(None, description="json (default) or multipart"),
+        encoding: EncodingOptions = Depends(encoding_options)
+):
+    """
+    Analyze optional images and answer the message. Returns one JSON document by
+    default; with stream=true (or Accept: application/x-ndjson / text/event-stream)
+    events are streamed as each stage of each image finishes. With multipart/mixed
+    the heatmaps and ROIs are sent as raw binary parts instead of base64.
+    """
+    # Take size-checked views of the uploads up front: FastAPI closes them as soon
+    # as this function returns, but the views (shared buffers or mmaps) stay valid
+    uploads = []
+    with stage_timer("read"):
+        for upload in images or []:
+            image = await read_image(upload)
+            if len(image.data):
+                uploads.append(image)
+
+    stream_type = negotiate_stream_type(request, STREAM_MEDIA_TYPES)
+    if stream or stream_type:
+        media_type = stream_type or "application/x-ndjson"
 
-    if images and len(images) > 0:
-        loop = asyncio.get_event_loop()
-        tasks = [process_single_image(image, loop) for image in images]
-        results = await gather(*tasks)
-        response["image_analysis"] = [r for r in results if r is not None]
+        async def body():
+            async for event in stream_chat_events(uploads, message, encoding):
+                yield _format_event(event, media_type)
+
+        return StreamingResponse(body(), media_type=media_type)
+
+    binary = negotiate_response_format(request, response_format) == "multipart"
+    response = await chat_response(uploads, message, encoding, binary)
+
+    if binary:
+        return _multipart_chat_response(response)
+
+    return response
+
+
+async def chat_response(uploads, message, encoding=DEFAULT_ENCODING, binary=False):
+    """The /api/chat JSON response for DecodedImages and a message (also run by background jobs)."""
+    response = {
+        "message": "",
+        "image_analysis": []
+    }
+
+    if uploads:
+        tasks = [analyze_image(image, message, encoding, binary) for image in uploads]
+        response["image_analysis"] = await gather(*tasks)
 
     if message and not response["message"]:
-        response["message"] = analyze_medical_scan_with_context(None, None, message)
+        async with admission.stage("llm"):
+            response["message"] = await analyze_medical_scan_async(None, None, message)
 
     return response
+
+
+def _multipart_chat_response(response):
+    # Move every heatmap/ROI out of the JSON into named binary parts ("heatmap-0", "roi-0", ...)
+    parts = []
+    for index, result in enumerate(response["image_analysis"]):
+        analysis = result.get("analysis")
+        if not analysis:
+            continue
+        mime_type = result.pop("mime_type")
+        for kind in ("heatmap", "roi"):
+            data = analysis.pop(kind)
+            name = f"{kind}-{index}"
+            analysis[f"{kind}_part"] = name if data is not None else None
+            parts.append((name, data, mime_type))
+    return multipart_response(response, parts)
@@ -0,0 +1,18 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.services.warmup import warmup
+
+router = APIRouter()
+
+
+@router.get("/health/live")
+async def liveness():
+    """The process is up and serving requests (models may still be loading)."""
+    return {"status": "alive"}
+
+
+@router.get("/health/ready")
+async def readiness():
+    """200 once every warm-up step (models, LLM client) has finished, 503 before that or if one failed."""
+    report = warmup.report()
+    return JSONResponse(content=report, status_code=200 if warmup.ready else 503)
@@ -1,32 +1,72 @@
-from fastapi import APIRouter, File, UploadFile
-from fastapi.responses import JSONResponse
-from app.utils.RegionOfIntrest import process_mri_image
+from typing import Optional
+from fastapi import APIRouter, Depends, File, Query, Request, UploadFile
+from fastapi.responses import JSONResponse, Response
+from app.services.pipeline import run_roi
+from app.utils.image_encoding import EncodingOptions
+from app.utils.metrics import stage_timer
+from app.utils.uploads import read_image
+from app.utils.responses import encoding_options, multipart_response, negotiate_response_format, to_base64
+from app.services.admission import Overloaded
 
 router = APIRouter()
 
 @router.post("/process-image")
-async def process_image(file: UploadFile = File(...)):
+async def process_image(
+        request: Request,
+        file: UploadFile = File(...),
+        response_format: Optional[str] = Query(None, description="json (default), multipart or image"),
+        part: str = Query("heatmap", description="Image returned when response_format=image: heatmap or roi"),
+        encoding: EncodingOptions = Depends(encoding_options)
+):
     """
-    Process uploaded MRI image and return ROI and heatmap as base64 encoded strings.
-    No files are stored on the server.
+    Process uploaded MRI image and return ROI and heatmap as base64 encoded strings,
+    plus the bounding box, area and centroid of every significant region.
+    With multipart/mixed or image/* (Accept header or response_format) the images
+    are returned as raw bytes instead. No files are stored on the server.
     """
-    # Read file contents into memory
-    contents = await file.read()
+    response_format = negotiate_response_format(request, response_format)
+
+    # Size-checked view of the upload
+    with stage_timer("read"):
+        image = await read_image(file)
 
     try:
         # Process the image directly from memory
-        roi_base64, heatmap_base64 = process_mri_image(contents)
+        roi_result, _ = await run_roi(image, encoding)
+        no_tumor = roi_result["roi"] is None
+
+        if response_format == "image":
+            if part not in ("heatmap", "roi"):
+                return JSONResponse(content={"error": "part must be heatmap or roi"}, status_code=400)
+            if roi_result[part] is None:
+                return JSONResponse(content={"message": "No tumor detected"}, status_code=404)
+            return Response(roi_result[part], media_type=roi_result["mime_type"])
+
+        if response_format == "multipart":
+            metadata = {"regions": roi_result["regions"]}
+            if no_tumor:
+                metadata["message"] = "No tumor detected"
+            return multipart_response(
+                metadata,
+                [("heatmap", roi_result["heatmap"], roi_result["mime_type"]),
+                 ("roi", roi_result["roi"], roi_result["mime_type"])],
+                status_code=404 if no_tumor else 200
+            )
 
-        response = {"heatmap": heatmap_base64, "regionofintrest": roi_base64}
+        roi_base64 = to_base64(roi_result["roi"])
+        response = {"heatmap": to_base64(roi_result["heatmap"]), "regionofintrest": roi_base64, "regions": roi_result["regions"]}
 
-        if roi_base64 is None:
+        if no_tumor:
             response["message"] = "No tumor detected"
             return JSONResponse(content=response, status_code=404)
 
         response["roi"] = roi_base64
         return JSONResponse(content=response)
+    except Overloaded:
+        # Answered with 429/503 and Retry-After by the app's exception handler
+        raise
     except Exception as e:
         return JSONResponse(
             content={"error": str(e)},
             status_code=500
-        )
\ No newline at end of file
+        )
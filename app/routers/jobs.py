@@ -0,0 +1,93 @@
+from typing import List
+from fastapi import APIRouter, File, Form, Query, UploadFile
+from fastapi.responses import JSONResponse
+from app.config import JOB_MAX_WAIT_SECONDS
+from app.routers.analysis import analyze_scan
+from app.routers.chat import chat_response
+from app.services.jobs import jobs
+from app.utils.decoded_image import DecodedImage
+from app.utils.metrics import stage_timer
+from app.utils.uploads import read_image
+
+router = APIRouter()
+
+
+def _images(payload):
+    return [DecodedImage(data, filename) for filename, data in payload["images"]]
+
+
+async def _run_analyze(payload):
+    return await analyze_scan(_images(payload)[0])
+
+
+async def _run_chat(payload):
+    return await chat_response(_images(payload), payload["message"])
+
+
+jobs.register("analyze", _run_analyze)
+jobs.register("chat", _run_chat)
+
+
+def _job_view(job) -> dict:
+    view = {
+        "job_id": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "expires_at": job["expires_at"],
+    }
+    if job["status"] == "succeeded":
+        view["result"] = job["result"]
+    elif job["status"] == "failed":
+        view["error"] = job["error"]
+    return view
+
+
+async def _submit(kind, images, message):
+    job, deduplicated = await jobs.submit(
+        kind, [image.digest for image in images], message,
+        {"message": message, "images": [(image.filename, image.data) for image in images]},
+    )
+    url = f"/api/jobs/{job['id']}"
+    return JSONResponse(
+        content={**_job_view(job), "deduplicated": deduplicated, "url": url},
+        status_code=202,
+        headers={"Location": url},
+    )
+
+
+@router.post("/jobs/analyze")
+async def submit_analyze_job(file: UploadFile = File(...)):
+    """Queue an /api/analyze run and return its job id at once."""
+    with stage_timer("read"):
+        image = await read_image(file)
+    return await _submit("analyze", [image], None)
+
+
+@router.post("/jobs/chat")
+async def submit_chat_job(message: str = Form(...), images: List[UploadFile] = File(None)):
+    """Queue an /api/chat run (JSON response) and return its job id at once."""
+    uploads = []
+    with stage_timer("read"):
+        for upload in images or []:
+            image = await read_image(upload)
+            if len(image.data):
+                uploads.append(image)
+    return await _submit("chat", uploads, message)
+
+
+@router.get("/jobs/stats")
+async def job_stats():
+    """Worker, queue and per-status job counts."""
+    return jobs.stats()
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0, ge=0, description="Seconds to wait for the job to finish")):
+    """Job status and, once finished, its result or error. With wait, long-polls until then."""
+    job = await jobs.get(job_id, min(wait, JOB_MAX_WAIT_SECONDS))
+    if job is None:
+        return JSONResponse(content={"error": "Job not found or expired"}, status_code=404)
+    return _job_view(job)
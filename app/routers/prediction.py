@@ -1,22 +1,127 @@
-from fastapi import APIRouter, UploadFile, File
-from fastapi.responses import JSONResponse
-from app.services.classification_service import predict_tumor_from_memory
+import asyncio
+import json
+import shutil
+import tempfile
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.config import VOLUME_MAX_BYTES, VOLUME_TOP_SLICES
+from app.services.classification_service import predict_tumor_bulk
+from app.services.pipeline import run_prediction
+from app.services.batching import batch_stats
+from app.services.volume_service import analyze_volume
+from app.utils.archive import iter_uploaded_images
+from app.utils.metrics import stage_timer
+from app.utils.uploads import UploadTooLarge, read_image, upload_buffer
+from app.utils.volume import VolumeTooLarge, open_volume
+from app.services.admission import Overloaded
 
 router = APIRouter()
 
 
 @router.post("/predict/{organ_type}")
 async def predict_tumor_endpoint(organ_type: str, file: UploadFile = File(...)):
-    try:
-        # Read file into memory
-        contents = await file.read()
+    # Size-checked view of the upload
+    with stage_timer("read"):
+        image = await read_image(file)
 
-        # Process image and make prediction directly from memory
-        result = predict_tumor_from_memory(contents, organ_type)
+    try:
+        # Reuse a cached prediction or run one through the organ's batching queue
+        result, _ = await run_prediction(image, organ_type)
 
         return result
+    except Overloaded:
+        # Answered with 429/503 and Retry-After by the app's exception handler
+        raise
     except Exception as e:
         return JSONResponse(
             content={"error": str(e)},
             status_code=500
         )
+
+
+def _spool_upload(upload_file):
+    # FastAPI closes form uploads when the endpoint returns, before a streaming
+    # response is consumed, so copy each upload into a temp file we own.
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    upload_file.seek(0)
+    shutil.copyfileobj(upload_file, spool)
+    spool.seek(0)
+    return spool
+
+
+@router.post("/predict/{organ_type}/batch")
+async def predict_tumor_batch_endpoint(organ_type: str, files: List[UploadFile] = File(...)):
+    """
+    Classify many scans for one organ. Accepts any number of image files and/or
+    zip/tar archives of images, and streams one NDJSON line per image in input order.
+    """
+    loop = asyncio.get_running_loop()
+    spooled = []
+    for file in files:
+        spooled.append((file.filename, await loop.run_in_executor(None, _spool_upload, file.file)))
+
+    async def results():
+        try:
+            async for result in predict_tumor_bulk(iter_uploaded_images(spooled), organ_type):
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            for _, spool in spooled:
+                spool.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.post("/predict/{organ_type}/volume")
+async def predict_volume_endpoint(
+    organ_type: str,
+    file: UploadFile = File(...),
+    window_center: Optional[float] = Query(None, description="Window center in scanner units (e.g. HU)"),
+    window_width: Optional[float] = Query(None, gt=0, description="Window width in scanner units"),
+    top_k: int = Query(VOLUME_TOP_SLICES, ge=0, le=100, description="Most confident slices listed in the study"),
+):
+    """
+    Analyze a volumetric scan slice by slice: a NIfTI-1 (.nii, .nii.gz) or
+    .npy volume, or a DICOM series as a zip/tar archive. Streams one NDJSON
+    line per slice (prediction and tumor regions), then a {"study": ...} line.
+    """
+    if (window_center is None) != (window_width is None):
+        return JSONResponse(content={"error": "Give both window_center and window_width, or neither"},
+                            status_code=400)
+    window = (window_center, window_width) if window_center is not None else None
+
+    try:
+        with stage_timer("read"):
+            # The voxel data stays in the spool file; the mapping outlives the upload. A study is
+            # held to the volume limit rather than the per-image one
+            volume = await asyncio.get_running_loop().run_in_executor(
+                None, lambda: open_volume(upload_buffer(file.file, VOLUME_MAX_BYTES), file.filename),
+            )
+    except UploadTooLarge:
+        # Answered with 413 by the app's exception handler
+        raise
+    except VolumeTooLarge as e:
+        return JSONResponse(content={"error": str(e)}, status_code=413)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse(content={"error": str(e)}, status_code=500)
+
+    async def results():
+        try:
+            async for result in analyze_volume(volume, organ_type, window, top_k):
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            volume.close()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.get("/predict/stats")
+async def prediction_stats():
+    """Queue depth and batch-size statistics for each organ's batching queue."""
+    return batch_stats()
@@ -0,0 +1,268 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import math
+import re
+import time
+from contextlib import asynccontextmanager, contextmanager
+from fastapi.responses import JSONResponse
+from app.config import (
+    ENDPOINT_CONCURRENCY, ENDPOINT_QUEUE_SIZES, ENDPOINT_PRIORITIES,
+    STAGE_CONCURRENCY, STAGE_QUEUE_SIZES, ADMISSION_TIMEOUT_SECONDS,
+)
+from app.utils.metrics import registry
+
+# Lower value = served first when several requests wait for the same stage
+PRIORITY_CLASSES = {"interactive": 0, "standard": 1, "batch": 2}
+
+# (method, path pattern) -> endpoint name used in the limit and priority settings.
+# Patterns match the whole path; other routes (stats, health, jobs) are not limited.
+ENDPOINT_ROUTES = (
+    ("POST", re.compile(r"/api/chat"), "chat"),
+    ("POST", re.compile(r"/api/analyze"), "analyze"),
+    ("POST", re.compile(r"/api/predict/[^/]+"), "predict"),
+    # Long-running bulk and volume streams get their own slots, so they can't starve single predictions
+    ("POST", re.compile(r"/api/predict/[^/]+/(?:batch|volume)"), "predict-bulk"),
+    ("POST", re.compile(r"/process-image"), "process-image"),
+)
+
+# Priority class of the request being handled; stage limiters order their waiters by it
+_priority = contextvars.ContextVar("admission_priority", default=PRIORITY_CLASSES["standard"])
+
+
+@contextmanager
+def priority(name):
+    """Run the enclosed work at priority class name (e.g. "batch" for background jobs)."""
+    token = _priority.set(PRIORITY_CLASSES[name])
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "scansage_admission_wait_seconds", "Time spent queued before admission.", ("limiter",),
+)
+
+
+class Overloaded(Exception):
+    """A request could not be admitted: the wait queue was full (429) or the wait timed out (503)."""
+
+    def __init__(self, limiter, reason, status_code, retry_after):
+        super().__init__(f"{limiter} is overloaded ({reason}), retry after {retry_after}s")
+        self.limiter = limiter
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def overloaded_response(error: Overloaded) -> JSONResponse:
+    return JSONResponse(
+        content={"error": str(error), "retry_after": error.retry_after},
+        status_code=error.status_code,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+class AdmissionLimiter:
+    """
+    At most max_concurrency holders at a time, and at most max_queue callers
+    waiting for a slot. Waiters are served by priority class, then in arrival
+    order; a freed slot is handed straight to the next waiter. Callers that
+    find the queue full or wait longer than timeout get Overloaded.
+    """
+
+    def __init__(self, name, max_concurrency, max_queue=0, timeout=ADMISSION_TIMEOUT_SECONDS):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.in_flight = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        # Moving average of how long a slot is held, for Retry-After
+        self._avg_hold = None
+        # Statistics
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "timeout": 0}
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """Seconds until a slot is likely free: queue ahead of us times the average hold, spread over the slots"""
+        hold = self._avg_hold if self._avg_hold is not None else 1.0
+        return min(120, max(1, math.ceil(hold * (self.queued + 1) / self.max_concurrency)))
+
+    def _reject(self, reason, status_code):
+        self.rejected[reason] += 1
+        return Overloaded(self.name, reason, status_code, self.retry_after())
+
+    async def acquire(self, priority=None):
+        if priority is None:
+            priority = _priority.get()
+        if self.in_flight < self.max_concurrency and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject("queue_full", 429)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), future)
+        heapq.heappush(self._waiters, entry)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(future, self.timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self.release()
+            elif entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            raise self._reject("timeout", 503)
+        finally:
+            ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, limiter=self.name)
+        self.admitted += 1
+
+    def release(self, held_seconds=None):
+        if held_seconds is not None:
+            self._avg_hold = held_seconds if self._avg_hold is None else 0.8 * self._avg_hold + 0.2 * held_seconds
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # The slot moves to the waiter; in_flight is unchanged
+                future.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, priority=None):
+        await self.acquire(priority)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "avg_hold_seconds": self._avg_hold,
+        }
+
+
+class AdmissionController:
+    """
+    Per-endpoint limiters, applied before a request body is read, and per-stage
+    limiters (llm, roi, predict) applied around the pipeline stages. Endpoints
+    and stages without a positive limit are not limited.
+    """
+
+    def __init__(self, endpoint_limits=None, endpoint_queues=None, stage_limits=None, stage_queues=None,
+                 priorities=None, timeout=ADMISSION_TIMEOUT_SECONDS):
+        endpoint_queues = endpoint_queues or {}
+        stage_queues = stage_queues or {}
+        self.endpoints = {
+            name: AdmissionLimiter(f"endpoint:{name}", limit, endpoint_queues.get(name, 0), timeout)
+            for name, limit in (endpoint_limits or {}).items() if limit > 0
+        }
+        self.stages = {
+            name: AdmissionLimiter(f"stage:{name}", limit, stage_queues.get(name, 0), timeout)
+            for name, limit in (stage_limits or {}).items() if limit > 0
+        }
+        self.priorities = {name: PRIORITY_CLASSES[cls] for name, cls in (priorities or {}).items()}
+
+    @staticmethod
+    def endpoint_for(path: str, method: str = "POST"):
+        for route_method, pattern, name in ENDPOINT_ROUTES:
+            if method == route_method and pattern.fullmatch(path.rstrip("/") or "/"):
+                return name
+        return None
+
+    @asynccontextmanager
+    async def stage(self, name):
+        """Hold a slot of the stage's limiter, if it has one, at the current request's priority."""
+        limiter = self.stages.get(name)
+        if limiter is None:
+            yield
+            return
+        async with limiter.slot():
+            yield
+
+    def stats(self) -> dict:
+        return {
+            "endpoints": {name: limiter.stats() for name, limiter in self.endpoints.items()},
+            "stages": {name: limiter.stats() for name, limiter in self.stages.items()},
+        }
+
+    def limiters(self):
+        return list(self.endpoints.values()) + list(self.stages.values())
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware that admits each request to its endpoint's limiter before
+    the application reads the (possibly large) request body, and sets the
+    request's priority class for the stage limiters.
+    """
+
+    def __init__(self, app, controller: AdmissionController = None):
+        self.app = app
+        self.controller = controller or admission
+
+    async def __call__(self, scope, receive, send):
+        endpoint = self.controller.endpoint_for(scope["path"], scope["method"]) if scope["type"] == "http" else None
+        if endpoint is None:
+            await self.app(scope, receive, send)
+            return
+
+        priority = self.controller.priorities.get(endpoint, PRIORITY_CLASSES["standard"])
+        token = _priority.set(priority)
+        try:
+            limiter = self.controller.endpoints.get(endpoint)
+            if limiter is None:
+                await self.app(scope, receive, send)
+                return
+            try:
+                await limiter.acquire(priority)
+            except Overloaded as e:
+                await overloaded_response(e)(scope, receive, send)
+                return
+            start = time.perf_counter()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                limiter.release(time.perf_counter() - start)
+        finally:
+            _priority.reset(token)
+
+
+admission = AdmissionController(
+    ENDPOINT_CONCURRENCY, ENDPOINT_QUEUE_SIZES, STAGE_CONCURRENCY, STAGE_QUEUE_SIZES, ENDPOINT_PRIORITIES,
+)
+
+registry.gauge(
+    "scansage_admission_in_flight", "Requests holding an admission slot.", ("limiter",),
+    func=lambda: {(limiter.name,): limiter.in_flight for limiter in admission.limiters()},
+)
+registry.gauge(
+    "scansage_admission_queued", "Requests waiting for an admission slot.", ("limiter",),
+    func=lambda: {(limiter.name,): limiter.queued for limiter in admission.limiters()},
+)
+registry.counter(
+    "scansage_admission_rejected_total", "Requests shed by admission control.", ("limiter", "reason"),
+    func=lambda: {
+        (limiter.name, reason): count for limiter in admission.limiters() for reason, count in limiter.rejected.items()
+    },
+)
@@ -0,0 +1,139 @@
+import asyncio
+import contextvars
+import functools
+from collections import Counter
+import numpy as np
+from app.config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+from app.services.executor import stage_executor
+from app.services.model_registry import model_registry, resolve_organ
+from app.utils.metrics import registry, stage_timer
+
+BATCH_SIZE = registry.histogram(
+    "scansage_batch_size", "Images per classifier forward pass.", ("organ",), buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+
+class BatchPredictor:
+    """
+    Collects concurrent prediction requests for one organ model and runs them
+    as a single (B, H, W, 3) batch. A batch is dispatched when it reaches
+    max_batch_size images or when the oldest request has waited max_wait_ms.
+    The forward pass runs on executor, or through run_batch(inputs), an async
+    callable, when given (e.g. in a process worker of the predict stage).
+    """
+
+    def __init__(self, organ, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, executor=None,
+                 run_batch=None):
+        self.organ = organ
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.executor = executor
+        self.run_batch = run_batch
+        self._queue = None
+        self._worker = None
+        self._loop = None
+        # Statistics
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = Counter()
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            # Fresh context: the worker outlives the request that happened to start it
+            self._worker = loop.create_task(self._run(), context=contextvars.Context())
+
+    async def predict(self, img_array: np.ndarray) -> np.ndarray:
+        """Queue a preprocessed (1, H, W, 3) array and wait for its (1, n_classes) prediction."""
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self.requests += 1
+        await self._queue.put((img_array, future))
+        return await future
+
+    def _predict_batch(self, inputs):
+        model = model_registry.get(self.organ)
+        return model.predict(inputs, verbose=0)
+
+    async def _collect(self):
+        # Block for the first request, then gather more until full or the wait window closes
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Skip requests whose callers already gave up
+            batch = [(arr, fut) for arr, fut in batch if not fut.cancelled()]
+            if not batch:
+                continue
+
+            self.batches += 1
+            self.batch_sizes[len(batch)] += 1
+            BATCH_SIZE.observe(len(batch), organ=self.organ)
+
+            try:
+                inputs = np.concatenate([arr for arr, _ in batch], axis=0)
+                with stage_timer("model_predict", self.organ):
+                    if self.run_batch is not None:
+                        predictions = await self.run_batch(inputs)
+                    else:
+                        predictions = await self._loop.run_in_executor(self.executor, self._predict_batch, inputs)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+
+            for i, (_, fut) in enumerate(batch):
+                if not fut.done():
+                    fut.set_result(predictions[i:i + 1])
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "requests": self.requests,
+            "batches": self.batches,
+            "avg_batch_size": (sum(s * n for s, n in self.batch_sizes.items()) / self.batches) if self.batches else 0.0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batch_size_histogram": {str(s): n for s, n in sorted(self.batch_sizes.items())},
+        }
+
+
+_batchers = {}
+
+
+def get_batcher(organ_type: str) -> BatchPredictor:
+    organ = resolve_organ(organ_type)
+    if organ not in _batchers:
+        run_batch = None
+        if stage_executor.mode("predict") == "process":
+            # Batches are still formed here; their forward pass runs in a worker with resident models
+            run_batch = functools.partial(stage_executor.run_predict_batch, organ_type=organ)
+        _batchers[organ] = BatchPredictor(organ, run_batch=run_batch)
+    return _batchers[organ]
+
+
+def batch_stats() -> dict:
+    return {organ: batcher.stats() for organ, batcher in _batchers.items()}
+
+
+registry.gauge(
+    "scansage_batch_queue_depth", "Preprocessed images waiting for a classifier batch.", ("organ",),
+    func=lambda: {(organ,): stats["queue_depth"] for organ, stats in batch_stats().items()},
+)
@@ -1,19 +1,33 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import numpy as np
-import tensorflow as tf
-from io import BytesIO
 from PIL import Image
+from app.utils.decoded_image import DecodedImage, open_buffer
+from app.services.model_registry import model_registry, MODEL_SPECS, resolve_organ
+from app.services.batching import get_batcher
+from app.config import BULK_CHUNK_SIZE, BULK_DECODE_WORKERS
+from app.utils.metrics import stage_timer
+
+# Threads used to decode and resize bulk uploads in parallel (PIL releases the GIL)
+_decode_pool = ThreadPoolExecutor(max_workers=BULK_DECODE_WORKERS)
 
 
 def load_model(model_path):
+    import tensorflow as tf
     return tf.keras.models.load_model(model_path)
 
-def preprocess_image_from_memory(img_data, img_size):
+def decode_and_resize(img_data, img_size):
     """
-    Process image data from memory into the format expected by the model.
-    Ensures correct dimensions (height, width, channels).
+    Decode image bytes and resize them to the model's input size.
+    Accepts a DecodedImage to reuse its cached resized variant.
+    Returns a uint8 array with shape (height, width, 3).
     """
+    if isinstance(img_data, DecodedImage):
+        return img_data.resized(img_size)
+
     # Open image from binary data using PIL
-    img = Image.open(BytesIO(img_data))
+    img = Image.open(open_buffer(img_data))
 
     # Convert to RGB mode to ensure 3 channels
     if img.mode != 'RGB':
@@ -22,64 +36,170 @@ def preprocess_image_from_memory(img_data, img_size):
     # Resize the image to expected dimensions
     img = img.resize(img_size)
 
-    # Convert to numpy array with correct shape (height, width, channels)
-    img_array = np.array(img)
+    return np.asarray(img, dtype=np.uint8)
+
+
+def normalize_batch(pixels, out=None):
+    """Scale a stacked uint8 (B, H, W, 3) array to float32 values in [0, 1] in a single pass."""
+    return np.divide(pixels, np.float32(255.0), out=out, dtype=np.float32)
+
 
+def preprocess_image_from_memory(img_data, img_size):
+    """
+    Process image data from memory into the format expected by the model.
+    Ensures correct dimensions (height, width, channels).
+    """
     # Ensure we have a 4D tensor (batch_size, height, width, channels)
-    img_array = np.expand_dims(img_array, axis=0)
+    img_array = decode_and_resize(img_data, img_size)[np.newaxis]
 
     # Normalize pixel values to [0, 1]
-    img_array = img_array / 255.0
+    return normalize_batch(img_array)
+
+
+def format_prediction(prediction, class_labels):
+    """Turn a (1, n_classes) model output into the API prediction dict."""
+    predicted_class = class_labels[np.argmax(prediction)]
 
-    return img_array
+    # Check if the highest probability is below a threshold
+    confidence = float(np.max(prediction))  # Convert to Python float
+    confidence_threshold = 0.5  # You can adjust this threshold
+
+    if confidence < confidence_threshold:
+        prediction_status = "Low Confidence"
+    else:
+        prediction_status = "High Confidence"
+
+    return {
+        "predicted_class": predicted_class,
+        "confidence_scores": prediction.tolist()[0],  # Convert to list and extract from batch
+        "confidence_level": confidence,
+        "prediction_status": prediction_status
+    }
+
+
+def _prediction_error(e, img_array=None):
+    # Add more diagnostic information to the error
+    error_message = f"Error during prediction: {str(e)}"
+    if img_array is not None:
+        error_message += f"\nImage array shape: {img_array.shape}"
+    return Exception(error_message)
 
 
 def predict_tumor_from_memory(img_data, organ_type):
-    # Import here to avoid circular imports
-    from app.config import BRAIN_MODEL_PATH, LUNG_MODEL_PATH, BREAST_MODEL_PATH
-
-    if organ_type == "Brain":
-        model = load_model(BRAIN_MODEL_PATH)
-        img_size = (299, 299)
-        class_labels = ["Glioma", "Meningioma", "Pituitary Tumor", "Normal"]
-    elif organ_type == "Lung":
-        model = load_model(LUNG_MODEL_PATH)
-        img_size = (224, 224)
-        class_labels = ["Benign", "Malignant", "Normal"]
-    else:  # Breast
-        model = load_model(BREAST_MODEL_PATH)
-        img_size = (244, 244)
-        class_labels = ["Benign", "Malignant"]
+    organ = resolve_organ(organ_type)
+    model = model_registry.get(organ)
+    img_size = MODEL_SPECS[organ]["img_size"]
+    class_labels = MODEL_SPECS[organ]["class_labels"]
 
+    img_array = None
     try:
         # Process image directly from memory
-        img_array = preprocess_image_from_memory(img_data, img_size)
-
-        # Print shape for debugging
-        print(f"Processed image shape: {img_array.shape}")
+        with stage_timer("preprocess", organ):
+            img_array = preprocess_image_from_memory(img_data, img_size)
 
         # Make prediction
-        prediction = model.predict(img_array)
-        predicted_class = class_labels[np.argmax(prediction)]
-
-        # Check if the highest probability is below a threshold
-        confidence = float(np.max(prediction))  # Convert to Python float
-        confidence_threshold = 0.5  # You can adjust this threshold
-
-        if confidence < confidence_threshold:
-            prediction_status = "Low Confidence"
-        else:
-            prediction_status = "High Confidence"
-
-        return {
-            "predicted_class": predicted_class,
-            "confidence_scores": prediction.tolist()[0],  # Convert to list and extract from batch
-            "confidence_level": confidence,
-            "prediction_status": prediction_status
-        }
+        with stage_timer("model_predict", organ):
+            prediction = model.predict(img_array, verbose=0)
+        return format_prediction(prediction, class_labels)
+    except Exception as e:
+        raise _prediction_error(e, img_array)
+
+
+async def predict_tumor_async(img_data, organ_type, executor=None, preprocess=None):
+    """
+    Same as predict_tumor_from_memory, but the forward pass goes through the
+    organ's micro-batching queue so concurrent requests share one model.predict call.
+    preprocess, if given, is an async callable (img_data, img_size) -> uint8 pixels
+    used instead of decoding on executor.
+    """
+    organ = resolve_organ(organ_type)
+    img_size = MODEL_SPECS[organ]["img_size"]
+    class_labels = MODEL_SPECS[organ]["class_labels"]
+    loop = asyncio.get_running_loop()
+
+    img_array = None
+    try:
+        with stage_timer("preprocess", organ):
+            if preprocess is not None:
+                img_array = normalize_batch((await preprocess(img_data, img_size))[np.newaxis])
+            else:
+                img_array = await loop.run_in_executor(executor, preprocess_image_from_memory, img_data, img_size)
+        prediction = await get_batcher(organ).predict(img_array)
+        return format_prediction(prediction, class_labels)
     except Exception as e:
-        # Add more diagnostic information to the error
-        error_message = f"Error during prediction: {str(e)}"
-        if 'img_array' in locals():
-            error_message += f"\nImage array shape: {img_array.shape}"
-        raise Exception(error_message)
\ No newline at end of file
+        raise _prediction_error(e, img_array)
+
+
+def _read_chunk(items, chunk_size):
+    # Pull the next chunk of (name, data-or-error) pairs off the upload iterator
+    chunk = []
+    for name, read in items:
+        try:
+            chunk.append((name, read()))
+        except Exception as e:
+            chunk.append((name, e))
+        if len(chunk) >= chunk_size:
+            break
+    return chunk
+
+
+def _decode_chunk(chunk, img_size, pixels):
+    # Decode and resize every image of the chunk in parallel straight into the shared uint8 buffer
+    def decode(i):
+        data = chunk[i][1]
+        if isinstance(data, Exception):
+            return f"Unable to read file: {data}"
+        try:
+            pixels[i] = decode_and_resize(data, img_size)
+        except Exception as e:
+            return f"Unable to decode image: {e}"
+        return None
+
+    return list(_decode_pool.map(decode, range(len(chunk))))
+
+
+async def predict_tumor_bulk(items, organ_type, chunk_size=BULK_CHUNK_SIZE, executor=None):
+    """
+    Classify many images for one organ, yielding one result dict per image in input order.
+    items is an iterable of (name, read) pairs. Images are decoded, normalized and
+    predicted chunk_size at a time, so peak memory is bounded by the chunk size.
+    """
+    organ = resolve_organ(organ_type)
+    width, height = MODEL_SPECS[organ]["img_size"]
+    class_labels = MODEL_SPECS[organ]["class_labels"]
+    loop = asyncio.get_running_loop()
+
+    # Buffers reused for every chunk
+    pixels = np.empty((chunk_size, height, width, 3), dtype=np.uint8)
+    batch = np.empty((chunk_size, height, width, 3), dtype=np.float32)
+
+    items = iter(items)
+    index = 0
+    while True:
+        chunk = await loop.run_in_executor(executor, _read_chunk, items, chunk_size)
+        if not chunk:
+            break
+
+        errors = await loop.run_in_executor(executor, _decode_chunk, chunk, (width, height), pixels)
+        decoded = [i for i, error in enumerate(errors) if error is None]
+
+        predictions = None
+        if decoded:
+            normalize_batch(pixels[:len(chunk)], out=batch[:len(chunk)])
+            inputs = batch[:len(chunk)] if len(decoded) == len(chunk) else batch[decoded]
+            try:
+                model = model_registry.get(organ)
+                predictions = await loop.run_in_executor(executor, partial(model.predict, inputs, verbose=0))
+            except Exception as e:
+                errors = [error or f"Error during prediction: {e}" for error in errors]
+
+        row = 0
+        for (name, _), error in zip(chunk, errors):
+            result = {"index": index, "filename": name}
+            if error is not None:
+                result["error"] = error
+            else:
+                result.update(format_prediction(predictions[row:row + 1], class_labels))
+                row += 1
+            index += 1
+            yield result
@@ -0,0 +1,198 @@
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from app.config import EXECUTION_MODE, STAGE_EXECUTION_MODES, STAGE_POOL_SIZES
+from app.utils.metrics import registry
+
+# CPU-bound pipeline stages and their default worker counts
+DEFAULT_POOL_SIZES = {
+    "roi": 4,
+    "parse": 2,
+    "preprocess": 4,
+    "predict": 2,
+}
+
+
+# --- Worker side --------------------------------------------------------------
+# These run inside pool processes. Heavy modules are imported lazily so a worker
+# only pays for the state its stage needs, and keeps it for its whole lifetime.
+
+def _init_worker(stage):
+    if stage == "roi":
+        # Builds the tumor LUT once per worker
+        import app.utils.RegionOfIntrest  # noqa: F401
+    elif stage == "predict":
+        from app.services.model_registry import model_registry
+        model_registry.preload()
+
+
+class _SharedImage:
+    """Attach to an image buffer placed in shared memory by the parent process."""
+
+    def __init__(self, name, size):
+        self.shm = shared_memory.SharedMemory(name=name)
+        self.view = self.shm.buf[:size]
+
+    def __enter__(self):
+        return self.view
+
+    def __exit__(self, *exc):
+        self.view.release()
+        self.shm.close()
+
+
+def _roi_worker(name, size, filename, digest, encoding):
+    from app.utils.decoded_image import DecodedImage
+    from app.utils.RegionOfIntrest import render_mri_image
+    with _SharedImage(name, size) as view:
+        return render_mri_image(DecodedImage(view, filename, digest), encoding)
+
+
+def _preprocess_worker(name, size, img_size):
+    from app.services.classification_service import decode_and_resize
+    with _SharedImage(name, size) as view:
+        # uint8 is 4x smaller than float32 to send back; the parent normalizes
+        return decode_and_resize(view, img_size)
+
+
+def _predict_batch_worker(name, size, shape, organ_type):
+    import numpy as np
+    from app.services.model_registry import model_registry
+    with _SharedImage(name, size) as view:
+        inputs = np.frombuffer(view, dtype=np.float32).reshape(shape)
+        try:
+            return model_registry.get(organ_type).predict(inputs, verbose=0)
+        finally:
+            # Drop the array before the shared buffer is released
+            del inputs
+
+
+# --- Parent side --------------------------------------------------------------
+
+class StageExecutor:
+    """
+    Runs CPU-bound stages on per-stage pools. In "thread" mode a stage uses a
+    ThreadPoolExecutor; in "process" mode it uses a ProcessPoolExecutor whose
+    workers keep their state (models, LUTs) resident, escaping the GIL. Image
+    bytes are handed to process workers through shared memory instead of being
+    pickled.
+    """
+
+    def __init__(self, default_mode=EXECUTION_MODE, stage_modes=None, pool_sizes=None):
+        self.modes = {stage: (stage_modes or {}).get(stage, default_mode) for stage in DEFAULT_POOL_SIZES}
+        for stage, mode in self.modes.items():
+            if mode not in ("thread", "process"):
+                raise ValueError(f"Unknown execution mode '{mode}' for stage '{stage}'")
+        self.pool_sizes = dict(DEFAULT_POOL_SIZES, **(pool_sizes or {}))
+        self._pools = {}
+        # Calls submitted to each stage that haven't finished (running + queued)
+        self.in_flight = {stage: 0 for stage in DEFAULT_POOL_SIZES}
+        # Their futures, to count the ones no worker has picked up yet
+        self._pending = {stage: set() for stage in DEFAULT_POOL_SIZES}
+
+    def mode(self, stage: str) -> str:
+        return self.modes[stage]
+
+    def pool(self, stage: str):
+        """The executor for a stage, created on first use."""
+        if stage not in self._pools:
+            size = self.pool_sizes[stage]
+            if self.modes[stage] == "process":
+                # spawn: forking a process that already initialized TensorFlow/OpenCV threads is unsafe
+                self._pools[stage] = ProcessPoolExecutor(
+                    max_workers=size,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(stage,),
+                )
+            else:
+                self._pools[stage] = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"{stage}-stage")
+        return self._pools[stage]
+
+    async def run(self, stage: str, func, *args):
+        """Run func(*args) on the stage's pool. In process mode func and args must be picklable."""
+        loop = asyncio.get_running_loop()
+        if self.modes[stage] == "thread":
+            # Carry the request context into the worker thread so its stage timings are attributed
+            func = functools.partial(contextvars.copy_context().run, func)
+        future = self.pool(stage).submit(func, *args)
+        pending = self._pending[stage]
+        pending.add(future)
+        # Called on the worker side; set.discard is atomic
+        future.add_done_callback(pending.discard)
+        self.in_flight[stage] += 1
+        try:
+            return await asyncio.wrap_future(future, loop=loop)
+        finally:
+            self.in_flight[stage] -= 1
+
+    def queued(self, stage: str) -> int:
+        """Calls submitted to a stage that no worker has started yet."""
+        return sum(1 for future in list(self._pending[stage]) if not future.running() and not future.done())
+
+    async def _run_shared(self, stage, worker, data, *args):
+        # Copy the image into shared memory once; the worker maps it instead of unpickling bytes
+        size = len(data)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, size))
+        try:
+            shm.buf[:size] = data
+            return await self.run(stage, worker, shm.name, size, *args)
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def run_roi(self, image, encoding):
+        from app.utils.RegionOfIntrest import render_mri_image
+        if self.modes["roi"] == "process":
+            return await self._run_shared("roi", _roi_worker, image.data, image.filename, image.digest, encoding)
+        return await self.run("roi", render_mri_image, image, encoding)
+
+    async def run_preprocess(self, image, img_size):
+        """uint8 (H, W, 3) pixels of the image resized for a model input."""
+        if self.modes["preprocess"] == "process":
+            return await self._run_shared("preprocess", _preprocess_worker, image.data, img_size)
+        from app.services.classification_service import decode_and_resize
+        return await self.run("preprocess", decode_and_resize, image, img_size)
+
+    async def run_predict_batch(self, inputs, organ_type):
+        """
+        Forward pass of a stacked float32 batch inside a process worker holding
+        its own resident models. Used by the micro-batcher in process mode.
+        """
+        inputs = np.ascontiguousarray(inputs, dtype=np.float32)
+        return await self._run_shared(
+            "predict", _predict_batch_worker, memoryview(inputs).cast("B"), inputs.shape, organ_type,
+        )
+
+    def stats(self) -> dict:
+        stats = {}
+        for stage in DEFAULT_POOL_SIZES:
+            stats[stage] = {
+                "mode": self.modes[stage],
+                "workers": self.pool_sizes[stage],
+                "started": stage in self._pools,
+                "in_flight": self.in_flight[stage],
+                "queued": self.queued(stage),
+            }
+        return stats
+
+    def shutdown(self):
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+
+
+stage_executor = StageExecutor(EXECUTION_MODE, STAGE_EXECUTION_MODES, STAGE_POOL_SIZES)
+
+registry.gauge(
+    "scansage_executor_queue_depth", "Stage calls waiting for a free worker.", ("stage",),
+    func=lambda: {(stage,): s["queued"] for stage, s in stage_executor.stats().items()},
+)
+registry.gauge(
+    "scansage_executor_in_flight", "Stage calls running or waiting.", ("stage",),
+    func=lambda: {(stage,): s["in_flight"] for stage, s in stage_executor.stats().items()},
+)
@@ -0,0 +1,276 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+from app.utils import serialization
+
+# Job states; a job moves queued -> running -> succeeded or failed
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+# Fields of a job record
+JOB_FIELDS = (
+    "id", "kind", "dedup_key", "status", "payload", "result", "error", "owner",
+    "created_at", "started_at", "finished_at", "expires_at",
+)
+
+
+class JobStore:
+    """
+    Storage behind JobManager. Records are plain dicts with JOB_FIELDS; the
+    payload (uploaded images and message) is kept until the job finishes so
+    that queued work can be recovered after a restart by a durable store.
+    """
+
+    name = "base"
+
+    def add(self, job: dict) -> Optional[dict]:
+        """
+        Store job unless a live job (as find() would return) already holds its
+        dedup_key; that job is returned instead, and None once job was added.
+        The check and the insert are atomic.
+        """
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def find(self, dedup_key: str) -> Optional[dict]:
+        """The newest job with this key that is queued, running or succeeded and not expired."""
+        raise NotImplementedError
+
+    def claim(self, job_id: str, owner: str) -> Optional[dict]:
+        """Atomically mark a queued job as running by owner; None if it was already taken."""
+        raise NotImplementedError
+
+    def finish(self, job_id: str, status: str, result=None, error: str = None, ttl: float = 3600) -> None:
+        raise NotImplementedError
+
+    def requeue(self, job_id: str) -> None:
+        raise NotImplementedError
+
+    def pending(self) -> list:
+        """Queued and running jobs, oldest first (used to recover work on start-up)."""
+        raise NotImplementedError
+
+    def delete_expired(self, now: float = None) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"store": self.name}
+
+
+class MemoryJobStore(JobStore):
+    """Jobs held in this process only; lost on restart."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, job: dict) -> Optional[dict]:
+        with self._lock:
+            existing = self._live(job["dedup_key"])
+            if existing is not None:
+                return dict(existing)
+            self._jobs[job["id"]] = dict(job)
+        return None
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def find(self, dedup_key: str) -> Optional[dict]:
+        with self._lock:
+            job = self._live(dedup_key)
+            return dict(job) if job is not None else None
+
+    def _live(self, dedup_key):
+        # Caller holds the lock
+        now = time.time()
+        matches = [
+            job for job in self._jobs.values()
+            if job["dedup_key"] == dedup_key and job["status"] != FAILED
+            and (job["expires_at"] is None or job["expires_at"] > now)
+        ]
+        return max(matches, key=lambda job: job["created_at"]) if matches else None
+
+    def claim(self, job_id: str, owner: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != QUEUED:
+                return None
+            job.update(status=RUNNING, owner=owner, started_at=time.time())
+            return dict(job)
+
+    def finish(self, job_id, status, result=None, error=None, ttl=3600):
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(status=status, result=result, error=error, payload=None,
+                           finished_at=now, expires_at=now + ttl)
+
+    def requeue(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(status=QUEUED, owner=None, started_at=None)
+
+    def pending(self) -> list:
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values() if job["status"] not in FINISHED]
+        return sorted(jobs, key=lambda job: job["created_at"])
+
+    def delete_expired(self, now=None) -> int:
+        now = now or time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["expires_at"] is not None and job["expires_at"] <= now]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return {"store": self.name, "jobs": counts}
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Durable store: queued jobs and their uploads survive a restart and are
+    picked up again on start-up. Payloads and results use the compact binary
+    codec of the cache. Safe to share between the uvicorn workers of a host.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, dedup_key TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload BLOB, result BLOB, error TEXT, owner TEXT, created_at REAL NOT NULL, "
+            "started_at REAL, finished_at REAL, expires_at REAL)"
+        )
+        # At most one job that is not failed per key, so concurrent submissions cannot both insert
+        conn.execute("DROP INDEX IF EXISTS jobs_dedup")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Tables written before the unique index existed may hold duplicates: keep the newest
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = 'Duplicate job', payload = NULL "
+                "WHERE status != ? AND rowid NOT IN (SELECT MAX(rowid) FROM jobs WHERE status != ? GROUP BY dedup_key)",
+                (FAILED, FAILED, FAILED),
+            )
+            conn.execute(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS jobs_dedup_live ON jobs (dedup_key) WHERE status != '{FAILED}'"
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _connect(self):
+        # One connection per thread; WAL lets several processes read while one writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row(row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(zip(JOB_FIELDS, row))
+        for field in ("payload", "result"):
+            if job[field] is not None:
+                job[field] = serialization.loads(job[field])
+        return job
+
+    def _select(self, where, params):
+        return self._connect().execute(f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE {where}", params)
+
+    def add(self, job: dict) -> Optional[dict]:
+        values = dict(job, payload=serialization.dumps(job["payload"]) if job["payload"] is not None else None,
+                      result=serialization.dumps(job["result"]) if job["result"] is not None else None)
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # An expired result still holds the key until it is cleaned up
+            conn.execute("DELETE FROM jobs WHERE dedup_key = ? AND expires_at <= ?", (job["dedup_key"], time.time()))
+            added = conn.execute(
+                f"INSERT INTO jobs ({', '.join(JOB_FIELDS)}) VALUES ({', '.join('?' * len(JOB_FIELDS))}) "
+                "ON CONFLICT DO NOTHING",
+                [values[field] for field in JOB_FIELDS],
+            ).rowcount
+            existing = None if added else self.find(job["dedup_key"])
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return existing
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._row(self._select("id = ?", (job_id,)).fetchone())
+
+    def find(self, dedup_key: str) -> Optional[dict]:
+        return self._row(self._select(
+            "dedup_key = ? AND status != ? AND (expires_at IS NULL OR expires_at > ?) ORDER BY created_at DESC LIMIT 1",
+            (dedup_key, FAILED, time.time()),
+        ).fetchone())
+
+    def claim(self, job_id: str, owner: str) -> Optional[dict]:
+        updated = self._connect().execute(
+            "UPDATE jobs SET status = ?, owner = ?, started_at = ? WHERE id = ? AND status = ?",
+            (RUNNING, owner, time.time(), job_id, QUEUED),
+        ).rowcount
+        return self.get(job_id) if updated else None
+
+    def finish(self, job_id, status, result=None, error=None, ttl=3600):
+        now = time.time()
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, payload = NULL, finished_at = ?, expires_at = ? "
+            "WHERE id = ?",
+            (status, serialization.dumps(result) if result is not None else None, error, now, now + ttl, job_id),
+        )
+
+    def requeue(self, job_id: str) -> None:
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, owner = NULL, started_at = NULL WHERE id = ?", (QUEUED, job_id),
+        )
+
+    def pending(self) -> list:
+        rows = self._select("status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)).fetchall()
+        return [self._row(row) for row in rows]
+
+    def delete_expired(self, now=None) -> int:
+        return self._connect().execute("DELETE FROM jobs WHERE expires_at <= ?", (now or time.time(),)).rowcount
+
+    def stats(self) -> dict:
+        rows = self._connect().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {"store": self.name, "path": self.path, "jobs": dict(rows)}
+
+
+def create_job_store(name: str, sqlite_path: str = None) -> JobStore:
+    """Build the store selected by JOB_STORE."""
+    if name == "memory":
+        return MemoryJobStore()
+    if name == "sqlite":
+        return SQLiteJobStore(sqlite_path)
+    raise ValueError(f"Unknown job store '{name}'")
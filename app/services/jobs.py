@@ -0,0 +1,226 @@
+"""
+Background jobs for long-running analyses.
+
+A client submits the same inputs as /api/analyze or /api/chat and gets a job
+id back at once; a bounded pool of worker tasks runs the usual pipeline at the
+"batch" priority, and the result is kept for JOB_RESULT_TTL_SECONDS for the
+client to poll (or long-poll). Identical submissions (same kind, images and
+normalized message) are attached to the existing job instead of queued again.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import time
+import uuid
+from app.config import (
+    JOB_WORKERS, JOB_QUEUE_SIZE, JOB_STORE, JOB_SQLITE_PATH, JOB_RESULT_TTL_SECONDS,
+    JOB_CLEANUP_INTERVAL_SECONDS, JOB_MAX_ATTEMPTS,
+)
+from app.services.admission import Overloaded, priority
+from app.services.job_store import QUEUED, RUNNING, SUCCEEDED, FAILED, FINISHED, create_job_store
+from app.services.pipeline import normalize_message
+from app.utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+def dedup_key(kind, digests, message) -> str:
+    """Key shared by submissions of the same kind, image digests (in order) and normalized message"""
+    parts = [kind, normalize_message(message), *digests]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
+class JobManager:
+    """
+    Queue and worker pool for background jobs. Runners are registered per job
+    kind: runner(payload) -> JSON-serializable result. Submissions beyond
+    max_queue raise Overloaded (429); a job shed by admission control while it
+    runs is retried after the suggested delay, up to max_attempts times.
+    """
+
+    def __init__(self, store, workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE, ttl=JOB_RESULT_TTL_SECONDS,
+                 cleanup_interval=JOB_CLEANUP_INTERVAL_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.store = store
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self.max_attempts = max(1, max_attempts)
+        # host:pid:boot token; the token tells this process from an earlier one that had the
+        # same pid (PID 1 in a container after every restart)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:12]}"
+        self._runners = {}
+        self._queue = None
+        self._tasks = []
+        # Set when a job run by this process finishes, for long-polls
+        self._done = {}
+        # Serializes the queue-capacity check with the insert and enqueue of a submission
+        self._submit_lock = asyncio.Lock()
+        # Statistics
+        self.submitted = 0
+        self.deduplicated = 0
+        self.running = 0
+
+    def register(self, kind, runner):
+        self._runners[kind] = runner
+
+    @property
+    def queued(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        """Start the workers and the cleanup loop, and queue work left over by a previous run."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue) if self.max_queue > 0 else asyncio.Queue()
+        for job in await asyncio.to_thread(self.store.pending):
+            if job["status"] == RUNNING and not self._owner_gone(job["owner"]):
+                # Still being run by another live worker process
+                continue
+            await asyncio.to_thread(self.store.requeue, job["id"])
+            self._queue.put_nowait(job["id"])
+        if self._queue.qsize():
+            logger.info("Recovered %d queued jobs", self._queue.qsize())
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._cleanup()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _owner_gone(self, owner) -> bool:
+        # The store is local to the host: a "running" job belongs to a live worker
+        # only if its owner is a process on this host that still exists
+        host, _, rest = (owner or "").partition(":")
+        pid, _, _ = rest.partition(":")
+        if host != socket.gethostname() or not pid.isdigit():
+            return True
+        if int(pid) == os.getpid():
+            # Ours only if claimed by this very manager; otherwise left by an earlier run with our pid
+            return owner != self.owner
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        return False
+
+    async def submit(self, kind, digests, message, payload):
+        """(job, deduplicated) for a submission, reusing a live or finished job with the same inputs."""
+        if kind not in self._runners:
+            raise ValueError(f"Unknown job kind '{kind}'")
+        key = dedup_key(kind, digests, message)
+        async with self._submit_lock:
+            existing = await asyncio.to_thread(self.store.find, key)
+            if existing is None:
+                if self._queue is None or self._queue.full():
+                    raise Overloaded("jobs", "queue_full", 429, max(1, round(self.queued / self.workers)))
+                job = {
+                    "id": uuid.uuid4().hex, "kind": kind, "dedup_key": key, "status": QUEUED, "payload": payload,
+                    "result": None, "error": None, "owner": None, "created_at": time.time(), "started_at": None,
+                    "finished_at": None, "expires_at": None,
+                }
+                # The store adds the job only if no other worker process got there first
+                existing = await asyncio.to_thread(self.store.add, job)
+                if existing is None:
+                    self._queue.put_nowait(job["id"])
+                    self.submitted += 1
+                    return job, False
+        self.deduplicated += 1
+        return existing, True
+
+    async def get(self, job_id, wait=0.0):
+        """The job, waiting up to wait seconds for it to finish; None if unknown or expired."""
+        deadline = time.monotonic() + max(0.0, wait)
+        while True:
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is not None and job["expires_at"] is not None and job["expires_at"] <= time.time():
+                # Expired but not cleaned up yet
+                return None
+            if job is None or job["status"] in FINISHED:
+                self._done.pop(job_id, None)
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            # Woken at once when this process finishes the job; re-check the shared store now and then
+            event = self._done.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, 1.0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception("Job %s crashed", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id):
+        job = await asyncio.to_thread(self.store.claim, job_id, self.owner)
+        if job is None:
+            # Taken by another worker process, or expired
+            return
+        self.running += 1
+        try:
+            status, result, error = FAILED, None, None
+            for attempt in range(self.max_attempts):
+                try:
+                    # Interactive requests go first when jobs and requests wait for the same stage
+                    with priority("batch"):
+                        result = await self._runners[job["kind"]](job["payload"])
+                    status = SUCCEEDED
+                    break
+                except Overloaded as e:
+                    error = str(e)
+                    if attempt + 1 < self.max_attempts:
+                        await asyncio.sleep(e.retry_after)
+                except Exception as e:
+                    error = str(e)
+                    break
+            await asyncio.to_thread(self.store.finish, job_id, status, result, error, self.ttl)
+        finally:
+            self.running -= 1
+            event = self._done.pop(job_id, None)
+            if event is not None:
+                event.set()
+
+    async def _cleanup(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                removed = await asyncio.to_thread(self.store.delete_expired)
+                if removed:
+                    logger.info("Removed %d expired jobs", removed)
+            except Exception:
+                logger.exception("Job cleanup failed")
+
+    def stats(self) -> dict:
+        return {
+            **self.store.stats(),
+            "workers": self.workers,
+            "running": self.running,
+            "queued": self.queued,
+            "max_queue": self.max_queue,
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+        }
+
+
+jobs = JobManager(create_job_store(JOB_STORE, JOB_SQLITE_PATH))
+
+registry.gauge("scansage_jobs_queued", "Background jobs waiting for a worker.", func=lambda: jobs.queued)
+registry.gauge("scansage_jobs_running", "Background jobs being run.", func=lambda: jobs.running)
+registry.counter(
+    "scansage_jobs_submitted_total", "Background job submissions.", ("result",),
+    func=lambda: {("queued",): jobs.submitted, ("deduplicated",): jobs.deduplicated},
+)
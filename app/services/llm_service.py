@@ -1,20 +1,29 @@
-import google.generativeai as genai
+import asyncio
 import base64
-from app.config import GENAI_API_KEY
+import random
+import time
+from contextlib import asynccontextmanager
+from app.utils.decoded_image import DecodedImage
+from app.utils.llm_payload import PayloadOptions
+from app.utils.metrics import registry
+from app.config import (
+    GENAI_API_KEY, LLM_BACKEND, LLM_MODEL_NAME, LLM_MAX_CONCURRENCY, LLM_TIMEOUT_SECONDS,
+    LLM_MAX_RETRIES, LLM_BACKOFF_BASE_SECONDS, LLM_BACKOFF_MAX_SECONDS,
+    FAKE_LLM_LATENCY_MS, FAKE_LLM_RESPONSE_FILE, LLM_IMAGE_REDUCTION, LLM_IMAGE_MAX_EDGE, LLM_IMAGE_FORMAT,
+    LLM_IMAGE_QUALITY, LLM_IMAGE_SKIP_BYTES, LLM_IMAGE_GRAYSCALE,
+)
 
-genai.configure(api_key=GENAI_API_KEY)
+# Bump whenever the prompts below change so cached LLM answers are not reused
+PROMPT_VERSION = "1"
 
+# How uploads are shrunk before being sent; part of the LLM cache key
+LLM_PAYLOAD = PayloadOptions(
+    enabled=LLM_IMAGE_REDUCTION, max_edge=LLM_IMAGE_MAX_EDGE, image_format=LLM_IMAGE_FORMAT,
+    quality=LLM_IMAGE_QUALITY, skip_bytes=LLM_IMAGE_SKIP_BYTES, grayscale=LLM_IMAGE_GRAYSCALE,
+)
 
-def analyze_medical_scan_with_context(image_data: bytes = None, mime_type: str = None, message: str = None):
-    """
-    Unified function that analyzes a medical scan and optionally incorporates user message context.
-    This eliminates redundant API calls by combining analysis and chat in one request.
-    """
-    # Choose Gemini model
-    model = genai.GenerativeModel(model_name="gemini-1.5-pro")
-
-    # Base analysis prompt
-    base_prompt = """You are analyzing a medical scan image. Provide structured output with EXACTLY these fields:
+# Base analysis prompt
+BASE_PROMPT = """You are analyzing a medical scan image. Provide structured output with EXACTLY these fields:
     - Scan Type (MRI, CT Scan, X-ray)
     - Organ (Brain, Lung, Heart, Breast)
     - Tumor Type (Specify if detected)
@@ -25,15 +34,7 @@ def analyze_medical_scan_with_context(image_data: bytes = None, mime_type: str =
     Format your response using these EXACT field names with a colon after each field name.
     """
 
-    # If a message is provided, add it to the prompt for context
-    if message:
-        full_prompt = f"{base_prompt}\n\nAdditionally, the user has asked: {message}\n\nFirst provide the structured analysis, then answer their question."
-    else:
-        full_prompt = base_prompt
-
-    # Handle text-only queries
-    if image_data is None:
-        system_prompt = """You are a medical imaging assistant specializing in MRI, CT scans, and other medical imaging technologies.
+SYSTEM_PROMPT = """You are a medical imaging assistant specializing in MRI, CT scans, and other medical imaging technologies.
         Your primary focus is helping users understand medical scans, tumor detection, and related medical concepts.
         Guidelines:
         1. Provide accurate, helpful information about medical imaging, tumors, and scan interpretation.
@@ -42,17 +43,230 @@ def analyze_medical_scan_with_context(image_data: bytes = None, mime_type: str =
         4. When discussing scan results, emphasize that these are computational analyses and not medical diagnoses.
         5. Always recommend consulting healthcare professionals for actual medical advice.
         """
-        full_prompt = f"{system_prompt}\n\nUser: {message}"
-        response = model.generate_content(full_prompt)
-        return response.text
 
-    # Generate response with image
-    response = model.generate_content(
-        [{
-            "mime_type": mime_type,
-            "data": base64.b64encode(image_data).decode("utf-8"),
-        },
+_retryable_errors = None
+
+
+def retryable_errors() -> tuple:
+    """Errors worth retrying with backoff (rate limits and transient server failures)."""
+    global _retryable_errors
+    if _retryable_errors is None:
+        # Imported on first use: the Google client libraries are slow to import
+        from google.api_core import exceptions as google_exceptions
+        _retryable_errors = (
+            google_exceptions.ResourceExhausted,
+            google_exceptions.TooManyRequests,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded,
+        )
+    return _retryable_errors
+
+
+def build_contents(image_data: bytes = None, mime_type: str = None, message: str = None):
+    """Build the Gemini request contents for an image analysis or a text-only query."""
+    # Handle text-only queries
+    if image_data is None:
+        return f"{SYSTEM_PROMPT}\n\nUser: {message}"
+
+    # If a message is provided, add it to the prompt for context
+    if message:
+        full_prompt = f"{BASE_PROMPT}\n\nAdditionally, the user has asked: {message}\n\nFirst provide the structured analysis, then answer their question."
+    else:
+        full_prompt = BASE_PROMPT
+
+    if isinstance(image_data, DecodedImage):
+        # Reuse the payload already reduced and encoded for this upload
+        data, mime_type = image_data.llm_payload(LLM_PAYLOAD)
+    else:
+        data = base64.b64encode(image_data).decode("utf-8")
+
+    return [{
+        "mime_type": mime_type,
+        "data": data,
+    },
         full_prompt]
-    )
 
-    return response.text
+
+class GeminiBackend:
+    """Gemini client shared by every request in the process."""
+
+    def __init__(self, model_name=LLM_MODEL_NAME):
+        # The SDK takes most of a second to import, so only pods that call Gemini pay for it
+        import google.generativeai as genai
+        genai.configure(api_key=GENAI_API_KEY)
+        self.model = genai.GenerativeModel(model_name=model_name)
+
+    def generate(self, contents) -> str:
+        return self.model.generate_content(contents).text
+
+    async def generate_async(self, contents) -> str:
+        response = await self.model.generate_content_async(contents)
+        return response.text
+
+    async def stream_async(self, contents):
+        response = await self.model.generate_content_async(contents, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeBackend:
+    """
+    Offline stand-in for Gemini that returns a canned response after a fixed
+    latency, so the whole pipeline can be load-tested without API quota.
+    """
+
+    DEFAULT_RESPONSE = """**Scan Type:** MRI
+**Organ:** Brain
+**Tumor Type:** Glioma
+**Tumor Subclass:** Low-grade astrocytoma
+**Detailed Description:** A 2.1 cm hyperintense lesion in the left frontal lobe with irregular margins.
+**Possible Causes:** Genetic mutations, prior radiation exposure.
+**Clinical Insights:** Findings warrant contrast-enhanced follow-up imaging and specialist review.
+
+**Disclaimer:** This is a computational analysis and not a medical diagnosis."""
+
+    DEFAULT_TEXT_RESPONSE = "This is a computational analysis and not a medical diagnosis. Please consult a healthcare professional."
+
+    def __init__(self, latency_ms=FAKE_LLM_LATENCY_MS, response_file=FAKE_LLM_RESPONSE_FILE):
+        self.latency = latency_ms / 1000.0
+        self.response = self.DEFAULT_RESPONSE
+        if response_file:
+            with open(response_file) as f:
+                self.response = f.read()
+
+    def _respond(self, contents) -> str:
+        return self.DEFAULT_TEXT_RESPONSE if isinstance(contents, str) else self.response
+
+    def generate(self, contents) -> str:
+        time.sleep(self.latency)
+        return self._respond(contents)
+
+    async def generate_async(self, contents) -> str:
+        await asyncio.sleep(self.latency)
+        return self._respond(contents)
+
+    async def stream_async(self, contents):
+        # Spread the latency over word-sized chunks to mimic token streaming
+        words = self._respond(contents).split(" ")
+        delay = self.latency / max(1, len(words))
+        for i, word in enumerate(words):
+            await asyncio.sleep(delay)
+            yield word if i == len(words) - 1 else word + " "
+
+
+LLM_BACKENDS = {
+    "gemini": GeminiBackend,
+    "fake": FakeBackend,
+}
+
+_backend = None
+# Caps in-flight LLM calls per process
+_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+_in_flight = 0
+
+registry.gauge("scansage_llm_in_flight", "LLM calls currently holding a concurrency slot.", func=lambda: _in_flight)
+registry.gauge("scansage_llm_max_concurrency", "Concurrency slots for LLM calls.", func=lambda: LLM_MAX_CONCURRENCY)
+LLM_RETRIES = registry.counter("scansage_llm_retries_total", "LLM calls retried after a failure.", ("reason",))
+
+
+@asynccontextmanager
+async def _llm_slot():
+    # Concurrency slot for one LLM call, counted for the in-flight gauge
+    global _in_flight
+    async with _semaphore:
+        _in_flight += 1
+        try:
+            yield
+        finally:
+            _in_flight -= 1
+
+
+def get_llm_backend():
+    """Return the process-wide LLM backend, creating it on first use."""
+    global _backend
+    if _backend is None:
+        if LLM_BACKEND not in LLM_BACKENDS:
+            raise ValueError(f"Unknown LLM backend '{LLM_BACKEND}'")
+        _backend = LLM_BACKENDS[LLM_BACKEND]()
+    return _backend
+
+
+def set_llm_backend(backend):
+    """Replace the process-wide LLM backend (e.g. with a FakeBackend for load tests)."""
+    global _backend
+    _backend = backend
+
+
+def _backoff_delay(attempt: int) -> float:
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+async def analyze_medical_scan_async(image_data: bytes = None, mime_type: str = None, message: str = None) -> str:
+    """
+    Async version of analyze_medical_scan_with_context. Runs on the event loop without
+    blocking it, limits concurrent calls, times out slow calls and retries rate-limit errors.
+    """
+    contents = build_contents(image_data, mime_type, message)
+    backend = get_llm_backend()
+
+    attempt = 0
+    while True:
+        try:
+            async with _llm_slot():
+                return await asyncio.wait_for(backend.generate_async(contents), LLM_TIMEOUT_SECONDS)
+        except retryable_errors():
+            if attempt >= LLM_MAX_RETRIES:
+                raise
+            LLM_RETRIES.inc(reason="error")
+        except asyncio.TimeoutError:
+            if attempt >= LLM_MAX_RETRIES:
+                raise TimeoutError(f"LLM call timed out after {LLM_TIMEOUT_SECONDS}s")
+            LLM_RETRIES.inc(reason="timeout")
+        # Sleep outside the semaphore so waiting retries don't hold a slot
+        await asyncio.sleep(_backoff_delay(attempt))
+        attempt += 1
+
+
+async def stream_medical_scan_async(image_data: bytes = None, mime_type: str = None, message: str = None):
+    """
+    Stream the model's answer as text chunks as they arrive. Holds a concurrency
+    slot for the whole stream; only failures before the first chunk are retried.
+    """
+    contents = build_contents(image_data, mime_type, message)
+    backend = get_llm_backend()
+
+    attempt = 0
+    while True:
+        started = False
+        try:
+            async with _llm_slot():
+                stream = backend.stream_async(contents).__aiter__()
+                first = await asyncio.wait_for(stream.__anext__(), LLM_TIMEOUT_SECONDS)
+                started = True
+                yield first
+                async for chunk in stream:
+                    yield chunk
+            return
+        except StopAsyncIteration:
+            return
+        except retryable_errors():
+            if started or attempt >= LLM_MAX_RETRIES:
+                raise
+            LLM_RETRIES.inc(reason="error")
+        except asyncio.TimeoutError:
+            if attempt >= LLM_MAX_RETRIES:
+                raise TimeoutError(f"LLM call timed out after {LLM_TIMEOUT_SECONDS}s")
+            LLM_RETRIES.inc(reason="timeout")
+        await asyncio.sleep(_backoff_delay(attempt))
+        attempt += 1
+
+
+def analyze_medical_scan_with_context(image_data: bytes = None, mime_type: str = None, message: str = None):
+    """
+    Unified function that analyzes a medical scan and optionally incorporates user message context.
+    This eliminates redundant API calls by combining analysis and chat in one request.
+    """
+    return get_llm_backend().generate(build_contents(image_data, mime_type, message))
@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+import numpy as np
+from app.config import BRAIN_MODEL_PATH, LUNG_MODEL_PATH, BREAST_MODEL_PATH, ENABLED_ORGANS, MODEL_WARMUP, MODEL_BACKENDS
+from app.utils.metrics import registry, record_stage
+
+# Model path, native input size and class labels for each organ classifier
+MODEL_SPECS = {
+    "Brain": {
+        "path": BRAIN_MODEL_PATH,
+        "img_size": (299, 299),
+        "class_labels": ["Glioma", "Meningioma", "Pituitary Tumor", "Normal"],
+    },
+    "Lung": {
+        "path": LUNG_MODEL_PATH,
+        "img_size": (224, 224),
+        "class_labels": ["Benign", "Malignant", "Normal"],
+    },
+    "Breast": {
+        "path": BREAST_MODEL_PATH,
+        "img_size": (244, 244),
+        "class_labels": ["Benign", "Malignant"],
+    },
+}
+
+
+def resolve_organ(organ_type: str) -> str:
+    """Map a requested organ onto a known model. Unknown organs fall back to Breast."""
+    return organ_type if organ_type in MODEL_SPECS else "Breast"
+
+
+class ModelRegistry:
+    """
+    Keeps each organ classifier resident after its first load.
+    Loading is guarded per organ, so concurrent callers from the thread pool
+    wait for a single load instead of deserializing the model twice.
+    """
+
+    def __init__(self, enabled_organs=None, warmup=True, backends=None):
+        # None enables every organ; an empty list none (the pod serves no classifier routes)
+        self.enabled_organs = [resolve_organ(o) for o in (MODEL_SPECS if enabled_organs is None else enabled_organs)]
+        self.backends = backends or {}
+        self.warmup_enabled = warmup
+        self._models = {}
+        self._load_locks = {organ: threading.Lock() for organ in MODEL_SPECS}
+
+    def get(self, organ_type: str):
+        """Return the resident model for the organ, loading it on first use."""
+        organ = resolve_organ(organ_type)
+        model = self._models.get(organ)
+        if model is not None:
+            return model
+
+        if organ not in self.enabled_organs:
+            raise ValueError(f"Model for organ '{organ}' is not enabled on this node")
+
+        with self._load_locks[organ]:
+            # Another thread may have finished loading while we waited
+            model = self._models.get(organ)
+            if model is None:
+                start = time.perf_counter()
+                model = self._load(organ)
+                if self.warmup_enabled:
+                    self._warmup(model, MODEL_SPECS[organ]["img_size"])
+                record_stage("model_load", time.perf_counter() - start, organ)
+                self._models[organ] = model
+        return model
+
+    def backend(self, organ_type: str) -> str:
+        return self.backends.get(resolve_organ(organ_type), "keras")
+
+    def model_path(self, organ_type: str) -> str:
+        organ = resolve_organ(organ_type)
+        backend = self.backend(organ)
+        if backend == "keras":
+            return MODEL_SPECS[organ]["path"]
+        from app.services.tflite_backend import TFLITE_VARIANTS, tflite_model_path
+        return tflite_model_path(organ, TFLITE_VARIANTS.get(backend, backend))
+
+    def model_version(self, organ_type: str) -> str:
+        """Backend and file timestamp of the organ model, used to key cached predictions."""
+        path = self.model_path(organ_type)
+        mtime = int(os.path.getmtime(path)) if os.path.exists(path) else 0
+        return f"{self.backend(organ_type)}:{mtime}"
+
+    def _load(self, organ):
+        backend = self.backend(organ)
+        if backend == "keras":
+            # TensorFlow is imported on first model load, not when the app starts
+            import tensorflow as tf
+            return tf.keras.models.load_model(MODEL_SPECS[organ]["path"])
+        from app.services.tflite_backend import load_tflite_model
+        return load_tflite_model(organ, backend)
+
+    def _warmup(self, model, img_size):
+        # Dummy forward pass at the model's native input size
+        dummy = np.zeros((1, img_size[1], img_size[0], 3), dtype=np.float32)
+        model.predict(dummy, verbose=0)
+
+    def preload(self):
+        """Load and warm every enabled organ model."""
+        for organ in self.enabled_organs:
+            self.get(organ)
+
+    def is_loaded(self, organ_type: str) -> bool:
+        return resolve_organ(organ_type) in self._models
+
+    def loaded_organs(self):
+        return list(self._models)
+
+    def memory_bytes(self) -> dict:
+        """Approximate memory held by each loaded model: weights for Keras, the flatbuffer for TFLite."""
+        sizes = {}
+        for organ, model in list(self._models.items()):
+            if hasattr(model, "weights"):
+                sizes[organ] = sum(
+                    int(np.prod(w.shape)) * np.dtype(getattr(w.dtype, "as_numpy_dtype", w.dtype)).itemsize
+                    for w in model.weights
+                )
+            else:
+                path = self.model_path(organ)
+                sizes[organ] = os.path.getsize(path) if os.path.exists(path) else 0
+        return sizes
+
+
+model_registry = ModelRegistry(ENABLED_ORGANS, warmup=MODEL_WARMUP, backends=MODEL_BACKENDS)
+
+registry.gauge(
+    "scansage_model_memory_bytes", "Approximate memory held by each loaded classifier.", ("organ",),
+    func=lambda: {(organ,): size for organ, size in model_registry.memory_bytes().items()},
+)
@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import re
+from app.config import (
+    CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL_SECONDS, CACHE_BACKEND, CACHE_SQLITE_PATH, CACHE_REDIS_URL,
+)
+from app.utils.cache import ImageCache
+from app.utils.cache_backends import create_cache_backend
+from app.utils.decoded_image import DecodedImage
+from app.utils.image_encoding import DEFAULT_ENCODING, EncodingOptions
+from app.utils.metrics import registry, stage_timer
+from app.utils.singleflight import SingleFlight
+from app.services.llm_service import analyze_medical_scan_async, LLM_PAYLOAD, PROMPT_VERSION
+from app.services.classification_service import predict_tumor_async
+from app.services.model_registry import model_registry, resolve_organ
+from app.services.executor import stage_executor
+from app.services.admission import admission
+
+# Stage-level cache shared by /api/chat, /api/analyze, /process-image and /api/predict.
+# Each stage is keyed by the image digest plus whatever else changes its output,
+# so a follow-up question about the same scan only pays for the LLM call.
+image_cache = ImageCache(
+    expiration_time=CACHE_TTL_SECONDS,
+    backend=create_cache_backend(
+        CACHE_BACKEND, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES,
+        sqlite_path=CACHE_SQLITE_PATH, redis_url=CACHE_REDIS_URL,
+    ),
+)
+
+
+def _cache_lookups():
+    stages = image_cache.stats()["stages"]
+    lookups = {(stage, "hit"): s["hits"] for stage, s in stages.items()}
+    lookups.update({(stage, "miss"): s["misses"] for stage, s in stages.items()})
+    return lookups
+
+
+def _cache_backend_stat(name):
+    # Not every backend can report its size (e.g. Redis)
+    stats = image_cache.stats()
+    return {(): stats[name]} if name in stats else {}
+
+
+registry.counter("scansage_cache_lookups_total", "Stage cache lookups.", ("stage", "result"), func=_cache_lookups)
+registry.gauge(
+    "scansage_cache_hit_ratio", "Stage cache hit ratio since start.", ("stage",),
+    func=lambda: {(stage,): s["hit_ratio"] for stage, s in image_cache.stats()["stages"].items()},
+)
+registry.counter("scansage_cache_errors_total", "Cache backend failures.", func=lambda: image_cache.stats()["errors"])
+registry.gauge("scansage_cache_entries", "Entries in the stage cache.", func=lambda: _cache_backend_stat("entries"))
+registry.gauge("scansage_cache_bytes", "Estimated size of the stage cache.", func=lambda: _cache_backend_stat("bytes"))
+
+# Identical uploads that arrive while the first one is still being processed
+# (UI retries, several users opening the same study) wait for that run instead
+# of repeating it. Keyed like the stage cache.
+in_flight = SingleFlight()
+
+registry.counter(
+    "scansage_coalesced_total", "Stage runs shared with an identical in-flight request.",
+    func=lambda: in_flight.shared,
+)
+registry.gauge("scansage_coalescing_in_flight", "Distinct stage runs in progress.", func=lambda: in_flight.in_flight)
+
+
+async def _run_once(stage, digest, *parts, compute):
+    """
+    Cached stage result, or the result of compute() shared with identical
+    in-flight calls and stored in the cache. Returns (result, reused) where
+    reused is True for cache hits and for runs started by another request.
+    """
+    cached = await image_cache.get_stage_async(stage, digest, *parts)
+    if cached is not None:
+        return cached, True
+
+    async def run():
+        result = await compute()
+        await image_cache.set_stage_async(stage, digest, *parts, result=result)
+        return result
+
+    return await in_flight.do(image_cache.stage_key(stage, digest, *parts), run)
+
+
+# Bump when the shape of cached ROI results changes
+ROI_RESULT_VERSION = "3"
+
+
+def normalize_message(message: str) -> str:
+    """Collapse case and whitespace so trivially different questions share a cache entry"""
+    return re.sub(r"\s+", " ", message or "").strip().lower()
+
+
+def _message_key(message: str) -> str:
+    return hashlib.sha256(normalize_message(message).encode("utf-8")).hexdigest()[:16]
+
+
+async def run_roi(image: DecodedImage, encoding: EncodingOptions = DEFAULT_ENCODING):
+    """
+    ROI, heatmap and tumor regions for the image, encoded as raw image bytes.
+    Cached per encoding options.
+    Returns ({"roi": bytes or None, "heatmap": bytes, "regions": [...], "mime_type": str}, from_cache).
+    """
+    async def compute():
+        async with admission.stage("roi"):
+            with stage_timer("roi"):
+                return await stage_executor.run_roi(image, encoding)
+
+    return await _run_once("roi", image.digest, ROI_RESULT_VERSION, encoding.cache_key(), compute=compute)
+
+
+async def run_prediction(image: DecodedImage, organ_type: str):
+    """Classifier output for the image, keyed by organ and model version. Returns (result, from_cache)."""
+    organ = resolve_organ(organ_type)
+    version = model_registry.model_version(organ)
+
+    async def compute():
+        async with admission.stage("predict"):
+            with stage_timer("predict", organ):
+                # In process mode the batcher sends each batch to a worker with resident models
+                return await predict_tumor_async(image, organ, preprocess=stage_executor.run_preprocess)
+
+    return await _run_once("predict", image.digest, organ, version, compute=compute)
+
+
+async def run_llm(image: DecodedImage, message: str = None):
+    """
+    Raw LLM analysis, keyed by image digest, prompt version, payload options and
+    normalized message. Returns (text, from_cache).
+    """
+    async def compute():
+        # Shrink the image off the event loop, before taking an LLM slot
+        await asyncio.to_thread(image.llm_payload, LLM_PAYLOAD)
+        async with admission.stage("llm"):
+            with stage_timer("llm"):
+                return await analyze_medical_scan_async(image, image.mime_type, message)
+
+    return await _run_once(
+        "llm", image.digest, PROMPT_VERSION, LLM_PAYLOAD.cache_key(), _message_key(message), compute=compute,
+    )
@@ -0,0 +1,82 @@
+import os
+import threading
+import numpy as np
+from app.config import TFLITE_MODEL_DIR, TFLITE_NUM_THREADS
+
+# Backend name -> file suffix produced by scripts/convert_models.py
+TFLITE_VARIANTS = {
+    "tflite": "float32",
+    "tflite-float32": "float32",
+    "tflite-float16": "float16",
+    "tflite-int8": "int8",
+}
+
+
+def tflite_model_path(organ: str, variant: str, model_dir: str = TFLITE_MODEL_DIR) -> str:
+    return os.path.join(model_dir, f"{organ.lower()}_{variant}.tflite")
+
+
+def _interpreter_class():
+    # The standalone tflite-runtime package is far lighter to import than
+    # TensorFlow; use it when installed
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter
+
+
+class TFLiteModel:
+    """
+    Wraps a TFLite interpreter (XNNPACK on CPU) behind the same predict()
+    interface as a Keras model, so the registry and batching code can use either.
+    The interpreter is not thread-safe, so calls are serialized with a lock.
+    """
+
+    def __init__(self, model_path, num_threads=TFLITE_NUM_THREADS):
+        self.model_path = model_path
+        self.interpreter = _interpreter_class()(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size):
+        if batch_size != self._batch_size:
+            shape = list(self._input["shape"])
+            shape[0] = batch_size
+            self.interpreter.resize_tensor_input(self._input["index"], shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = batch_size
+
+    def _quantize(self, inputs):
+        # int8 models converted with integer I/O need their inputs rescaled
+        dtype = self._input["dtype"]
+        if dtype == np.float32:
+            return inputs.astype(np.float32, copy=False)
+        scale, zero_point = self._input["quantization"]
+        return np.clip(np.round(inputs / scale + zero_point), np.iinfo(dtype).min, np.iinfo(dtype).max).astype(dtype)
+
+    def _dequantize(self, outputs):
+        if self._output["dtype"] == np.float32:
+            return outputs
+        scale, zero_point = self._output["quantization"]
+        return (outputs.astype(np.float32) - zero_point) * scale
+
+    def predict(self, inputs, verbose=0):
+        with self._lock:
+            self._resize(len(inputs))
+            self.interpreter.set_tensor(self._input["index"], self._quantize(np.asarray(inputs)))
+            self.interpreter.invoke()
+            return self._dequantize(self.interpreter.get_tensor(self._output["index"]).copy())
+
+
+def load_tflite_model(organ: str, backend: str) -> TFLiteModel:
+    if backend not in TFLITE_VARIANTS:
+        raise ValueError(f"Unknown inference backend '{backend}' for organ '{organ}'")
+    path = tflite_model_path(organ, TFLITE_VARIANTS[backend])
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"TFLite model not found at {path}; run scripts/convert_models.py first")
+    return TFLiteModel(path)
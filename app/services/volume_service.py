@@ -0,0 +1,157 @@
+"""
+Slice-by-slice analysis of a volumetric scan.
+
+Slices are read, windowed to uint8, run through tumor ROI extraction and
+resized into a reused pixel buffer chunk_size at a time, then classified with
+one model.predict call per chunk, as in bulk prediction. Peak memory depends
+on the chunk size and the slice size, not on the number of slices; the study
+aggregate keeps running sums and the top_k slices only.
+"""
+import asyncio
+import base64
+import heapq
+from functools import partial
+import cv2
+import numpy as np
+from app.config import BULK_CHUNK_SIZE, VOLUME_TOP_SLICES
+from app.services.classification_service import _decode_pool, format_prediction, normalize_batch
+from app.services.model_registry import model_registry, MODEL_SPECS, resolve_organ
+from app.utils.RegionOfIntrest import find_regions, tumor_mask
+from app.utils.image_encoding import DEFAULT_ENCODING
+from app.utils.metrics import registry, stage_timer
+from app.utils.volume import auto_window, window_slice
+
+VOLUME_SLICES = registry.counter(
+    "scansage_volume_slices_total", "Volume slices analyzed.", ("result",),
+)
+
+
+def _prepare_chunk(volume, indices, window, img_size, pixels):
+    # Window, segment and resize every slice of the chunk in parallel straight into the shared buffer;
+    # volume.slice() is thread-safe (a DICOM archive is read one member at a time)
+    def prepare(row):
+        try:
+            gray = window_slice(volume.slice(indices[row]), *window)
+            regions = find_regions(tumor_mask(gray))
+            # Grayscale to the classifier's 3-channel input by broadcasting
+            pixels[row] = cv2.resize(gray, img_size, interpolation=cv2.INTER_AREA)[:, :, np.newaxis]
+        except Exception as e:
+            return None, f"Unable to read slice: {e}"
+        return regions, None
+
+    return list(_decode_pool.map(prepare, range(len(indices))))
+
+
+def _roi_crop(volume, index, window, bbox):
+    # Re-read the one slice holding the study's largest region and encode its crop
+    x, y, w, h = bbox
+    gray = window_slice(volume.slice(index), *window)
+    return base64.b64encode(DEFAULT_ENCODING.encode(gray[y:y + h, x:x + w])).decode("utf-8")
+
+
+async def analyze_volume(volume, organ_type, window=None, top_k=VOLUME_TOP_SLICES,
+                         chunk_size=BULK_CHUNK_SIZE, executor=None):
+    """
+    Yield one result dict per slice in order, then {"study": aggregate}.
+    window is (center, width) in scanner units; by default the file's own
+    window, else one picked from a sample of the volume.
+    """
+    organ = resolve_organ(organ_type)
+    width, height = MODEL_SPECS[organ]["img_size"]
+    class_labels = MODEL_SPECS[organ]["class_labels"]
+    loop = asyncio.get_running_loop()
+
+    if window is None:
+        window = volume.window or await loop.run_in_executor(executor, auto_window, volume)
+
+    # Buffers reused for every chunk
+    chunk_size = max(1, min(chunk_size, volume.count))
+    pixels = np.empty((chunk_size, height, width, 3), dtype=np.uint8)
+    batch = np.empty((chunk_size, height, width, 3), dtype=np.float32)
+
+    # Study aggregate: running score sums, class counts, a min-heap of the top_k slices and the largest region
+    score_sums = np.zeros(len(class_labels), dtype=np.float64)
+    class_counts = dict.fromkeys(class_labels, 0)
+    top = []
+    largest = None
+    with_regions = failed = 0
+
+    for start in range(0, volume.count, chunk_size):
+        indices = list(range(start, min(start + chunk_size, volume.count)))
+        with stage_timer("volume_slices", organ):
+            prepared = await loop.run_in_executor(
+                executor, _prepare_chunk, volume, indices, window, (width, height), pixels,
+            )
+        errors = [error for _, error in prepared]
+        ready = [row for row, error in enumerate(errors) if error is None]
+
+        predictions = None
+        if ready:
+            with stage_timer("predict", organ):
+                normalize_batch(pixels[:len(indices)], out=batch[:len(indices)])
+                inputs = batch[:len(indices)] if len(ready) == len(indices) else batch[ready]
+                try:
+                    model = model_registry.get(organ)
+                    predictions = await loop.run_in_executor(executor, partial(model.predict, inputs, verbose=0))
+                except Exception as e:
+                    errors = [error or f"Error during prediction: {e}" for error in errors]
+
+        row = 0
+        for index, (regions, _), error in zip(indices, prepared, errors):
+            result = {"index": index}
+            if error is not None:
+                result["error"] = error
+                failed += 1
+                VOLUME_SLICES.inc(result="error")
+                if regions is not None:
+                    # The prediction failed but the slice was read
+                    result["regions"] = regions
+                yield result
+                continue
+
+            result.update(format_prediction(predictions[row:row + 1], class_labels))
+            result["regions"] = regions
+            row += 1
+            VOLUME_SLICES.inc(result="ok")
+
+            score_sums += result["confidence_scores"]
+            class_counts[result["predicted_class"]] += 1
+            summary = (result["confidence_level"], -index, result["predicted_class"])
+            if len(top) < top_k:
+                heapq.heappush(top, summary)
+            elif top_k and summary > top[0]:
+                heapq.heapreplace(top, summary)
+            if regions:
+                with_regions += 1
+                if largest is None or regions[0]["area"] > largest[1]["area"]:
+                    largest = (index, regions[0], result["predicted_class"])
+            yield result
+
+    analyzed = volume.count - failed
+    study = {
+        "organ": organ,
+        "slices": volume.count,
+        "slice_shape": list(volume.shape),
+        "window": {"center": float(window[0]), "width": float(window[1])},
+        "analyzed": analyzed,
+        "errors": failed,
+        "slices_with_regions": with_regions,
+        "class_counts": class_counts,
+        "top_slices": [
+            {"index": -index, "predicted_class": predicted_class, "confidence_level": confidence}
+            for confidence, index, predicted_class in sorted(top, reverse=True)
+        ],
+        "largest_roi": None,
+    }
+    if analyzed:
+        mean_scores = score_sums / analyzed
+        study["mean_confidence_scores"] = mean_scores.tolist()
+        study["predicted_class"] = class_labels[int(np.argmax(mean_scores))]
+    if largest is not None:
+        index, region, predicted_class = largest
+        roi = await loop.run_in_executor(executor, _roi_crop, volume, index, window, region["bbox"])
+        study["largest_roi"] = {
+            "index": index, "region": region, "predicted_class": predicted_class,
+            "roi": roi, "mime_type": DEFAULT_ENCODING.mime_type,
+        }
+    yield {"study": study}
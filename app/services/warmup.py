@@ -0,0 +1,76 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """
+    Runs the slow start-up work (loading classifier models, creating the LLM
+    client) in the background after the server starts accepting connections,
+    and records the state and duration of each step for the readiness probe
+    and the start-up log.
+    """
+
+    def __init__(self):
+        self.steps = {}
+        self._funcs = []
+        self._task = None
+        self.started_at = None
+        self.finished_at = None
+
+    def add(self, name, func):
+        """Register a blocking step; steps run one after another in a worker thread."""
+        if name in self.steps:
+            return
+        self._funcs.append((name, func))
+        self.steps[name] = {"status": "pending", "seconds": None}
+
+    def start(self):
+        """Schedule the steps on the running event loop and return immediately."""
+        if self._task is None:
+            self.started_at = time.perf_counter()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        for name, func in self._funcs:
+            step = self.steps[name]
+            step["status"] = "running"
+            start = time.perf_counter()
+            try:
+                await loop.run_in_executor(None, func)
+                step["status"] = "ready"
+            except Exception as e:
+                step["status"] = "failed"
+                step["error"] = str(e)
+                logger.exception("Warm-up step %s failed", name)
+            step["seconds"] = round(time.perf_counter() - start, 3)
+        self.finished_at = time.perf_counter()
+        logger.info(
+            "Warm-up finished in %.2fs: %s",
+            self.finished_at - self.started_at,
+            ", ".join(f"{name} {step['status']} {step['seconds']:.2f}s" for name, step in self.steps.items())
+            or "nothing to load",
+        )
+
+    @property
+    def ready(self) -> bool:
+        return all(step["status"] == "ready" for step in self.steps.values())
+
+    def report(self) -> dict:
+        if self.ready:
+            status = "ready"
+        elif any(step["status"] == "failed" for step in self.steps.values()):
+            status = "failed"
+        else:
+            status = "starting"
+        report = {"status": status, "steps": self.steps}
+        if self.finished_at is not None:
+            report["warmup_seconds"] = round(self.finished_at - self.started_at, 3)
+        return report
+
+
+warmup = Warmup()
@@ -1,76 +1,168 @@
 import cv2
 import numpy as np
 import base64
+from app.utils.decoded_image import DecodedImage
+from app.utils.image_encoding import DEFAULT_ENCODING, EncodingOptions, render_heatmap
 
-def process_mri_image(image_data):
-    """
-    Processes an MRI image to detect tumors and generate a heatmap.
-    Returns the ROI and heatmap as encoded images.
-
-    Parameters:
-        image_data (bytes): Raw image data.
-
-    Returns:
-        tuple: (roi_base64, heatmap_base64), where:
-            - roi_base64 (str or None): Base64 encoded ROI image, None if no tumor detected.
-            - heatmap_base64 (str): Base64 encoded heatmap image.
-    """
-    # Convert bytes to numpy array
-    nparr = np.frombuffer(image_data, np.uint8)
+# Minimum contour area (in pixels) for a region to count as significant
+MIN_REGION_AREA = 50
 
-    # Decode the image
-    mri_image = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-    if mri_image is None:
-        raise ValueError("Error: Image not found or unable to load.")
+# Kernel for morphological noise reduction
+_KERNEL = np.ones((5, 5), np.uint8)
 
-    # Apply the JET colormap
-    jet_colored = cv2.applyColorMap(mri_image, cv2.COLORMAP_JET)
 
-    # Convert to HSV to isolate the orange and red colors
+def _build_tumor_lut():
+    """
+    The orange/red tumor mask is a pure function of the grayscale intensity:
+    intensity -> JET colour -> HSV -> orange/red ranges. Run that chain once on
+    all 256 levels so every image needs a single table lookup instead of a
+    colormap, an HSV conversion, three inRange passes and two bitwise_ors.
+    """
+    levels = np.arange(256, dtype=np.uint8).reshape(1, 256)
+    jet_colored = cv2.applyColorMap(levels, cv2.COLORMAP_JET)
     hsv_image = cv2.cvtColor(jet_colored, cv2.COLOR_BGR2HSV)
 
     # Define color ranges for tumor detection
-    lower_orange = np.array([10, 100, 100])
-    upper_orange = np.array([25, 255, 255])
-    lower_red1 = np.array([0, 100, 100])
-    upper_red1 = np.array([10, 255, 255])
-    lower_red2 = np.array([170, 100, 100])
-    upper_red2 = np.array([180, 255, 255])
-
-    # Create masks for the tumor regions
-    mask_orange = cv2.inRange(hsv_image, lower_orange, upper_orange)
-    mask_red1 = cv2.inRange(hsv_image, lower_red1, upper_red1)
-    mask_red2 = cv2.inRange(hsv_image, lower_red2, upper_red2)
+    mask_orange = cv2.inRange(hsv_image, np.array([10, 100, 100]), np.array([25, 255, 255]))
+    mask_red1 = cv2.inRange(hsv_image, np.array([0, 100, 100]), np.array([10, 255, 255]))
+    mask_red2 = cv2.inRange(hsv_image, np.array([170, 100, 100]), np.array([180, 255, 255]))
     mask_red = cv2.bitwise_or(mask_red1, mask_red2)
-    combined_mask = cv2.bitwise_or(mask_orange, mask_red)
+    return cv2.bitwise_or(mask_orange, mask_red).reshape(256)
 
-    # Apply morphological operations for noise reduction
-    kernel = np.ones((5, 5), np.uint8)
-    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
-    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
 
-    # Find contours to detect the largest region
-    contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    max_area = 0
-    max_contour = None
+TUMOR_LUT = _build_tumor_lut()
 
+
+def _load_grayscale(image_data):
+    if isinstance(image_data, DecodedImage):
+        # Reuse the grayscale view shared with the other stages
+        return image_data.gray
+
+    # Convert bytes to numpy array and decode the image
+    mri_image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if mri_image is None:
+        raise ValueError("Error: Image not found or unable to load.")
+    return mri_image
+
+
+def tumor_mask(mri_image):
+    """Binary (0/255) tumor mask of a grayscale image, after morphological noise reduction."""
+    mask = cv2.LUT(mri_image, TUMOR_LUT)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, _KERNEL)
+    return cv2.morphologyEx(mask, cv2.MORPH_OPEN, _KERNEL)
+
+
+def find_regions(mask, min_area=MIN_REGION_AREA):
+    """
+    All significant regions of a mask, largest first. Each region has its
+    bounding box (x, y, width, height), contour area and centroid (x, y).
+    """
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    regions = []
     for contour in contours:
         area = cv2.contourArea(contour)
-        if area > max_area:
-            max_area = area
-            max_contour = contour
+        if area <= min_area:
+            continue
+        x, y, w, h = cv2.boundingRect(contour)
+        moments = cv2.moments(contour)
+        if moments["m00"]:
+            centroid = [moments["m10"] / moments["m00"], moments["m01"] / moments["m00"]]
+        else:
+            centroid = [x + w / 2.0, y + h / 2.0]
+        regions.append({
+            "bbox": [int(x), int(y), int(w), int(h)],
+            "area": float(area),
+            "centroid": [float(centroid[0]), float(centroid[1])],
+        })
+    # Stable sort keeps the first of equally large contours first, as before
+    regions.sort(key=lambda r: r["area"], reverse=True)
+    return regions
+
+
+def analyze_mri_image(image_data, min_area=MIN_REGION_AREA):
+    """
+    Detect tumor regions in an MRI image.
+
+    Returns:
+        dict with:
+            - gray (ndarray): The grayscale image.
+            - regions (list): Significant regions, largest first (see find_regions).
+            - roi (ndarray or None): Crop of the largest region, None if no tumor detected.
+    """
+    mri_image = _load_grayscale(image_data)
+    regions = find_regions(tumor_mask(mri_image), min_area)
 
-    roi_base64 = None
-    if max_contour is not None and max_area > 50:  # Minimum area threshold to avoid noise
-        x, y, w, h = cv2.boundingRect(max_contour)
+    roi = None
+    if regions:
+        x, y, w, h = regions[0]["bbox"]
         roi = mri_image[y:y + h, x:x + w]
 
-        # Encode ROI as base64
-        _, buffer = cv2.imencode('.png', roi)
-        roi_base64 = base64.b64encode(buffer).decode('utf-8')
+    return {
+        "gray": mri_image,
+        "regions": regions,
+        "roi": roi,
+    }
+
+
+def _encode_base64_png(image):
+    _, buffer = cv2.imencode('.png', image)
+    return base64.b64encode(buffer).decode('utf-8')
+
+
+def process_mri_image_regions(image_data):
+    """
+    Like process_mri_image, but also returns every significant region.
+
+    Returns:
+        tuple: (roi_base64, heatmap_base64, regions)
+    """
+    analysis = analyze_mri_image(image_data)
+    roi_base64 = _encode_base64_png(analysis["roi"]) if analysis["roi"] is not None else None
+    heatmap_base64 = _encode_base64_png(render_heatmap(analysis["gray"]))
+    return roi_base64, heatmap_base64, analysis["regions"]
+
+
+def render_mri_image(image_data, options: EncodingOptions = DEFAULT_ENCODING):
+    """
+    Detect tumor regions and encode the ROI and heatmap as raw image bytes.
+
+    Returns:
+        dict with roi (bytes or None), heatmap (bytes), regions (list) and mime_type (str).
+    """
+    analysis = analyze_mri_image(image_data)
+    return {
+        "roi": options.encode(analysis["roi"]) if analysis["roi"] is not None else None,
+        "heatmap": options.encode(render_heatmap(analysis["gray"], options)),
+        "regions": analysis["regions"],
+        "mime_type": options.mime_type,
+    }
 
-    # Encode heatmap as base64
-    _, buffer = cv2.imencode('.png', jet_colored)
-    heatmap_base64 = base64.b64encode(buffer).decode('utf-8')
 
-    return roi_base64, heatmap_base64
\ No newline at end of file
+def process_mri_image(image_data):
+    """
+    Processes an MRI image to detect tumors and generate a heatmap.
+    Returns the ROI and heatmap as encoded images.
+
+    Parameters:
+        image_data (bytes or DecodedImage): Raw image data, or an already decoded image.
+
+    Returns:
+        tuple: (roi_base64, heatmap_base64), where:
+            - roi_base64 (str or None): Base64 encoded ROI image, None if no tumor detected.
+            - heatmap_base64 (str): Base64 encoded heatmap image.
+    """
+    roi_base64, heatmap_base64, _ = process_mri_image_regions(image_data)
+    return roi_base64, heatmap_base64
+
+
+def process_mri_images(images, include_regions=False):
+    """
+    Batch API: process a list of images (bytes or DecodedImage) in one call.
+    Returns a list of (roi_base64, heatmap_base64) tuples, or
+    (roi_base64, heatmap_base64, regions) when include_regions is True.
+    """
+    results = []
+    for image_data in images:
+        result = process_mri_image_regions(image_data)
+        results.append(result if include_regions else result[:2])
+    return results
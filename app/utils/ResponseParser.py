@@ -1,62 +1,116 @@
 import re
 
+# Define the expected fields
+EXPECTED_FIELDS = [
+    "Scan Type",
+    "Organ",
+    "Tumor Type",
+    "Tumor Subclass",
+    "Detailed Description",
+    "Possible Causes",
+    "Clinical Insights"
+]
+
+# snake_case JSON key for each field
+FIELD_KEYS = {field: field.lower().replace(' ', '_') for field in EXPECTED_FIELDS}
+
+USER_RESPONSE_PHRASES = ["To answer your question", "In response to your question", "Regarding your question"]
+
+# One scanner for every marker the parser cares about, compiled once at import.
+# None of the markers can occur inside another, so a single non-overlapping
+# sweep finds every occurrence.
+_MARKER_RE = re.compile(
+    "(?P<field>" + "|".join(re.escape(f) for f in EXPECTED_FIELDS) + ")"
+    "|(?P<disclaimer>Disclaimer)"
+    "|(?P<question>" + "|".join(re.escape(p) for p in USER_RESPONSE_PHRASES) + ")"
+)
+# What may follow a field name before its value: optional colon and bold markers
+_HEADER_TAIL_RE = re.compile(r"\s*:?\*?\*?\s*")
+# A field name only ends the previous value when a colon follows it
+_COLON_AFTER_RE = re.compile(r"\s*:")
+_DISCLAIMER_TAIL_RE = re.compile(r"\s*:?\s*")
+
+# Mark-down bold/italic markers and whitespace collapse to a single space in one pass
+_MARKDOWN_RE = re.compile(r'[\s*]+')
+_WHITESPACE_RE = re.compile(r'\s+')
+_TRAILING_HYPHENS_RE = re.compile(r'\s*-+\s*$')
+
+
+def _clean(value: str) -> str:
+    # Remove mark-down formatting and extra whitespace
+    value = _MARKDOWN_RE.sub(' ', value.strip()).strip()
+    # Remove trailing hyphens and any surrounding whitespace; the search is only
+    # worth running when there is a hyphen at the end
+    if value.endswith('-'):
+        value = _TRAILING_HYPHENS_RE.sub('', value)
+    return value
+
+
+def _value_end(raw_result: str, start: int, terminators) -> int:
+    """
+    End of a field value starting at start: just before the first following
+    field header (including the whitespace and up to two '*' in front of it),
+    or the end of the text.
+    """
+    for position in terminators:
+        if position < start:
+            continue
+        # Back up over whitespace, then up to two '*', in front of the header
+        end = position
+        while end > start and raw_result[end - 1].isspace():
+            end -= 1
+        for _ in range(2):
+            if end > start and raw_result[end - 1] == '*':
+                end -= 1
+        return end
+    return len(raw_result)
+
 
 def parse_medical_scan_result(raw_result: str) -> dict:
     """
     Parse the raw markdown-formatted LLM response into a structured JSON.
     Removes trailing hyphens and other inconsistencies.
+
+    All field headers, the disclaimer and the answer to the user's question are
+    located in a single sweep over the text; values are then sliced out between
+    consecutive headers.
     """
-    # Define the expected fields
-    expected_fields = [
-        "Scan Type",
-        "Organ",
-        "Tumor Type",
-        "Tumor Subclass",
-        "Detailed Description",
-        "Possible Causes",
-        "Clinical Insights"
-    ]
+    first_field = {}
+    terminators = []
+    disclaimer_end = None
+    question_end = None
 
-    result_dict = {}
+    for match in _MARKER_RE.finditer(raw_result):
+        kind = match.lastgroup
+        if kind == "field":
+            first_field.setdefault(match.group(), match.end())
+            if _COLON_AFTER_RE.match(raw_result, match.end()):
+                terminators.append(match.start())
+        elif kind == "disclaimer":
+            if disclaimer_end is None:
+                disclaimer_end = match.end()
+        elif question_end is None:
+            question_end = match.end()
 
-    # Try to extract information using regex patterns
-    for field in expected_fields:
-        # Look for field name followed by colon and any text until the next field or end
-        pattern = rf"\*?\*?\s*{re.escape(field)}\s*:?\*?\*?\s*(.*?)(?=\*?\*?\s*(?:{"|".join([re.escape(f) for f in expected_fields])})\s*:|\Z)"
-        match = re.search(pattern, raw_result, re.DOTALL)
-        if match:
-            # Clean up the extracted text
-            value = match.group(1).strip()
-            # Remove mark-down formatting and extra whitespace
-            value = re.sub(r'\*\*|\*|\n+', ' ', value)
-            value = re.sub(r'\s+', ' ', value).strip()
-            # Remove trailing hyphens and any surrounding whitespace
-            value = re.sub(r'\s*-+\s*$', '', value)
-            # Convert field name to snake_case for JSON
-            field_key = field.lower().replace(' ', '_')
-            result_dict[field_key] = value
-        else:
+    result_dict = {}
+    for field in EXPECTED_FIELDS:
+        header_end = first_field.get(field)
+        if header_end is None:
             # If field not found, include it as empty
-            field_key = field.lower().replace(' ', '_')
-            result_dict[field_key] = ""
+            result_dict[FIELD_KEYS[field]] = ""
+            continue
+        start = _HEADER_TAIL_RE.match(raw_result, header_end).end()
+        result_dict[FIELD_KEYS[field]] = _clean(raw_result[start:_value_end(raw_result, start, terminators)])
 
     # Add a disclaimer field if present in the original text
-    disclaimer_pattern = r"(?:Disclaimer|Important\s+Disclaimer)\s*:?\s*(.*?)(?=\Z)"
-    disclaimer_match = re.search(disclaimer_pattern, raw_result, re.DOTALL)
-    if disclaimer_match:
-        disclaimer_text = disclaimer_match.group(1).strip()
-        disclaimer_text = re.sub(r'\*\*|\*|\n+', ' ', disclaimer_text)
-        disclaimer_text = re.sub(r'\s+', ' ', disclaimer_text).strip()
-        # Remove trailing hyphens here too
-        disclaimer_text = re.sub(r'\s*-+\s*$', '', disclaimer_text)
-        result_dict["disclaimer"] = disclaimer_text
+    if disclaimer_end is not None:
+        start = _DISCLAIMER_TAIL_RE.match(raw_result, disclaimer_end).end()
+        result_dict["disclaimer"] = _clean(raw_result[start:])
 
     # Extract any additional response to the user's question (after the structured analysis)
-    user_response_pattern = r"(?:To answer your question|In response to your question|Regarding your question).*?:(.*?)(?=\Z)"
-    user_response_match = re.search(user_response_pattern, raw_result, re.DOTALL)
-    if user_response_match:
-        response_text = user_response_match.group(1).strip()
-        response_text = re.sub(r'\s+', ' ', response_text).strip()
-        result_dict["llm_response"] = response_text
+    if question_end is not None:
+        colon = raw_result.find(":", question_end)
+        if colon != -1:
+            result_dict["llm_response"] = _WHITESPACE_RE.sub(' ', raw_result[colon + 1:].strip()).strip()
 
     return result_dict
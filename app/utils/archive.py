@@ -0,0 +1,54 @@
+import os
+import tarfile
+import zipfile
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def is_archive(filename: str) -> bool:
+    return bool(filename) and filename.lower().endswith(ARCHIVE_EXTENSIONS)
+
+
+def _skip_member(name: str) -> bool:
+    # Ignore macOS resource forks and hidden files packed alongside the scans
+    base = os.path.basename(name)
+    return not base or base.startswith(".") or "__MACOSX" in name
+
+
+def iter_archive(fileobj, filename: str):
+    """
+    Yield (member_name, read) pairs for every file in a zip or tar archive.
+    Members are only read when read() is called, so the archive is never
+    fully extracted into memory.
+    """
+    fileobj.seek(0)
+    if filename.lower().endswith(".zip") or zipfile.is_zipfile(fileobj):
+        fileobj.seek(0)
+        with zipfile.ZipFile(fileobj) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or _skip_member(info.filename):
+                    continue
+                yield info.filename, lambda info=info: archive.read(info)
+        return
+
+    fileobj.seek(0)
+    with tarfile.open(fileobj=fileobj, mode="r:*") as archive:
+        for member in archive:
+            if not member.isfile() or _skip_member(member.name):
+                continue
+            yield member.name, lambda member=member: archive.extractfile(member).read()
+
+
+def iter_uploaded_images(named_files):
+    """
+    Expand a list of (filename, fileobj) uploads into (name, read) pairs,
+    descending into zip/tar archives and keeping the input order.
+    """
+    for filename, fileobj in named_files:
+        if is_archive(filename):
+            yield from iter_archive(fileobj, filename)
+        else:
+            def read(fileobj=fileobj):
+                fileobj.seek(0)
+                return fileobj.read()
+            yield filename, read
@@ -1,48 +1,126 @@
+import asyncio
 import hashlib
-import time
-from typing import Dict, Tuple, Any, Optional, List
+from typing import Any, Optional, List
 from concurrent.futures import ThreadPoolExecutor
 from threading import Lock
+from app.utils.cache_backends import CacheBackend, MemoryBackend
+
 
 class ImageCache:
-    def __init__(self, max_size=100, expiration_time=3600, max_workers=4):
-        self.cache: Dict[str, Tuple[float, Any]] = {}
-        self.max_size = max_size
+    """
+    Digest-keyed cache for pipeline results. Storage is delegated to a
+    CacheBackend (in-process LRU, SQLite on disk, or Redis) so several workers
+    can share results; this class owns key building and hit/miss counters.
+    """
+
+    def __init__(self, max_size=100, expiration_time=3600, max_workers=4, max_bytes=256 * 1024 * 1024,
+                 backend: CacheBackend = None):
+        self.backend = backend or MemoryBackend(max_entries=max_size, max_bytes=max_bytes)
         self.expiration_time = expiration_time
         self.lock = Lock()
         self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        # Per-stage lookups: {stage: [hits, misses]}
+        self.stage_lookups = {}
 
     def _generate_key(self, image_data: bytes) -> str:
         """Generate a unique key for the image data using SHA-256"""
+        return self.digest(image_data)
+
+    @staticmethod
+    def digest(image_data: bytes) -> str:
+        """SHA-256 hex digest of the image data, shared by every stage key"""
         return hashlib.sha256(image_data).hexdigest()
 
+    @staticmethod
+    def stage_key(stage: str, digest: str, *parts) -> str:
+        """Key for one pipeline stage of one image, e.g. ("predict", digest, "Brain", "keras:v1")"""
+        return ":".join([stage, digest, *[str(p) for p in parts]])
+
+    def get_stage(self, stage: str, digest: str, *parts) -> Optional[Any]:
+        """Retrieve a cached stage result for the image digest"""
+        result = self._get_key(self.stage_key(stage, digest, *parts))
+        with self.lock:
+            counts = self.stage_lookups.setdefault(stage, [0, 0])
+            counts[0 if result is not None else 1] += 1
+        return result
+
+    def set_stage(self, stage: str, digest: str, *parts, result: Any) -> None:
+        """Cache a stage result for the image digest"""
+        self._set_key(self.stage_key(stage, digest, *parts), result)
+
+    async def get_stage_async(self, stage: str, digest: str, *parts) -> Optional[Any]:
+        """get_stage for the event loop: a disk or network backend is queried on a thread"""
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.get_stage, stage, digest, *parts)
+        return self.get_stage(stage, digest, *parts)
+
+    async def set_stage_async(self, stage: str, digest: str, *parts, result: Any) -> None:
+        """set_stage for the event loop: a disk or network backend is written on a thread"""
+        if self.backend.blocking:
+            await asyncio.to_thread(self.set_stage, stage, digest, *parts, result=result)
+        else:
+            self.set_stage(stage, digest, *parts, result=result)
+
     def get(self, image_data: bytes) -> Optional[Any]:
         """Retrieve cached result if it exists and hasn't expired"""
         if image_data is None:
             return None
 
-        key = self._generate_key(image_data)
-        if key in self.cache:
-            timestamp, result = self.cache[key]
-            if time.time() - timestamp < self.expiration_time:
-                return result
-            else:
-                # Remove expired entry
-                del self.cache[key]
-        return None
+        return self._get_key(self._generate_key(image_data))
 
     def set(self, image_data: bytes, result: Any) -> None:
         """Cache the result with current timestamp"""
         if image_data is None:
             return
 
-        key = self._generate_key(image_data)
-        self.cache[key] = (time.time(), result)
+        self._set_key(self._generate_key(image_data), result)
+
+    def _get_key(self, key: str) -> Optional[Any]:
+        try:
+            result = self.backend.get(key)
+        except Exception:
+            # A shared store being unavailable must never fail the request
+            result = None
+            with self.lock:
+                self.errors += 1
+
+        with self.lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def _set_key(self, key: str, result: Any) -> None:
+        try:
+            self.backend.set(key, result, self.expiration_time)
+        except Exception:
+            with self.lock:
+                self.errors += 1
+
+    def clear(self) -> None:
+        self.backend.clear()
 
-        # If cache exceeds max size, remove oldest entries
-        if len(self.cache) > self.max_size:
-            oldest_key = min(self.cache.keys(), key=lambda k: self.cache[k][0])
-            del self.cache[oldest_key]
+    def stats(self) -> dict:
+        """Counters for monitoring"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "errors": self.errors,
+                "stages": {
+                    stage: {"hits": hits, "misses": misses, "hit_ratio": hits / (hits + misses)}
+                    for stage, (hits, misses) in self.stage_lookups.items()
+                },
+            }
+        stats.update(self.backend.stats())
+        return stats
 
     def process_batch(self, images: List[bytes], process_func) -> List[Any]:
         """
@@ -0,0 +1,299 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+from app.utils import serialization
+
+
+def estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a cached value in bytes (dominated by the base64 images)"""
+    if isinstance(value, (str, bytes, bytearray)):
+        return sys.getsizeof(value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+class CacheBackend:
+    """
+    Storage behind ImageCache. Backends store values under string keys with a
+    time-to-live and return None for missing or expired keys.
+    """
+
+    name = "base"
+    # Calls do disk or network I/O and are run off the event loop
+    blocking = True
+
+    def get(self, key: str) -> Optional[Any]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class MemoryBackend(CacheBackend):
+    """
+    In-process LRU with O(1) get/set/evict, bounded by entry count and by the
+    estimated size of its entries in bytes. Expired entries are dropped lazily.
+    """
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self, max_entries=1000, max_bytes=256 * 1024 * 1024, sizeof=None):
+        # key -> (expires_at, size, value), least recently used first
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or estimate_size
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, value = entry
+            if time.time() >= expires_at:
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            # Never let a single oversized entry flush the whole cache
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + ttl, size, value)
+            self.current_bytes += size
+
+            # Evict least recently used entries until both budgets are respected
+            while len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes:
+                oldest_key, (expires_at, _, _) = next(iter(self._entries.items()))
+                self._remove(oldest_key)
+                if time.time() >= expires_at:
+                    self.expirations += 1
+                else:
+                    self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        # Caller must hold the lock
+        _, size, _ = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.name,
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    On-disk store that survives restarts and can be shared by every uvicorn
+    worker on the same host. Values are stored with the compact binary codec.
+    Inserts are tallied in running totals; once a limit may be exceeded the
+    real totals are read and the least recently used rows are evicted in one
+    statement, down to EVICT_TO of the limits.
+    """
+
+    name = "sqlite"
+    # Fraction of the limits kept after an eviction, so the next one is many inserts away
+    EVICT_TO = 0.9
+    # Re-read the totals at least this often, to notice rows added by other workers
+    RECOUNT_EVERY = 256
+
+    def __init__(self, path, max_entries=10000, max_bytes=1024 * 1024 * 1024):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self.evictions = 0
+        # Estimated totals: the last counted values plus every insert since (replaced rows count twice)
+        self._totals_lock = threading.Lock()
+        self._count = self._bytes = self._inserts = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+            self._count, self._bytes = self._totals(conn)
+
+    def _connect(self):
+        # One connection per thread; WAL lets several processes read while one writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        conn = self._connect()
+        row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, expires_at = row
+        now = time.time()
+        if now >= expires_at:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return serialization.loads(value)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        data = serialization.dumps(value)
+        if len(data) > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), now + ttl, now),
+        )
+        with self._totals_lock:
+            self._count += 1
+            self._bytes += len(data)
+            self._inserts += 1
+            due = (self._count > self.max_entries or self._bytes > self.max_bytes
+                   or self._inserts >= self.RECOUNT_EVERY)
+            if due:
+                self._inserts = 0
+        if due:
+            self._evict(conn, now)
+
+    @staticmethod
+    def _totals(conn):
+        return conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache").fetchone()
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        count, total = self._totals(conn)
+        if count > self.max_entries or total > self.max_bytes:
+            # Keep the most recently used rows that fit in EVICT_TO of both limits; drop the rest at once
+            evicted = conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM ("
+                "SELECT key, ROW_NUMBER() OVER recent AS rank, SUM(size) OVER recent AS kept FROM cache "
+                "WINDOW recent AS (ORDER BY accessed_at DESC ROWS UNBOUNDED PRECEDING)"
+                ") WHERE rank > ? OR kept > ?)",
+                (int(self.max_entries * self.EVICT_TO), int(self.max_bytes * self.EVICT_TO)),
+            ).rowcount
+            self.evictions += evicted
+            count, total = self._totals(conn)
+        with self._totals_lock:
+            self._count, self._bytes = count, total
+
+    def delete(self, key: str) -> None:
+        self._connect().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM cache")
+        with self._totals_lock:
+            self._count = self._bytes = 0
+
+    def stats(self) -> dict:
+        count, total = self._totals(self._connect())
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "entries": count,
+            "bytes": total,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+        }
+
+
+class RedisBackend(CacheBackend):
+    """
+    Redis-protocol store shared by every worker and pod. Expiry is handled by
+    Redis TTLs and the memory budget by the server's maxmemory policy.
+    Any client with redis-py's get/set/delete interface can be passed in
+    (e.g. a local stand-in for tests).
+    """
+
+    name = "redis"
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="scansage:", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("The redis cache backend requires the 'redis' package (pip install redis)")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[Any]:
+        data = self.client.get(self.prefix + key)
+        return serialization.loads(data) if data is not None else None
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self.client.set(self.prefix + key, serialization.dumps(value), px=max(1, int(ttl * 1000)))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+    def clear(self) -> None:
+        keys = list(self.client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "prefix": self.prefix}
+
+
+def create_cache_backend(name: str, max_entries: int, max_bytes: int, sqlite_path: str = None, redis_url: str = None):
+    """Build the backend selected by CACHE_BACKEND."""
+    if name == "memory":
+        return MemoryBackend(max_entries=max_entries, max_bytes=max_bytes)
+    if name == "sqlite":
+        return SQLiteBackend(sqlite_path, max_entries=max_entries, max_bytes=max_bytes)
+    if name == "redis":
+        return RedisBackend(redis_url)
+    raise ValueError(f"Unknown cache backend '{name}'")
@@ -0,0 +1,199 @@
+import base64
+import hashlib
+import io
+import mimetypes
+import threading
+import cv2
+import numpy as np
+from PIL import Image
+from app.utils.llm_payload import reduce_payload
+from app.utils.metrics import stage_timer
+
+
+def _weighted_gray(rgb, coeffs, shift, rounding):
+    # Integer luma (r*cr + g*cg + b*cb + rounding) >> shift, computed in int32
+    cr, cg, cb = coeffs
+    acc = rgb[..., 0].astype(np.int32) * cr
+    acc += rgb[..., 1].astype(np.int32) * cg
+    acc += rgb[..., 2].astype(np.int32) * cb
+    acc += rounding
+    return (acc >> shift).astype(np.uint8)
+
+
+def _png_gray(rgb):
+    # libpng's png_set_rgb_to_gray(0.299, 0.587) fixed point, which truncates
+    return _weighted_gray(rgb, (9797, 19234, 3737), 15, 0)
+
+
+def _opencv_gray(rgb):
+    # OpenCV's own BGR->gray used by its BMP/TIFF decoders
+    return _weighted_gray(rgb, (4899, 9617, 1868), 14, 1 << 13)
+
+
+def _cvt_gray(rgb):
+    return cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+
+
+# (format, source mode) -> conversion that reproduces cv2.imread(..., IMREAD_GRAYSCALE)
+# bit for bit. Anything else (e.g. colour JPEG, where libjpeg emits luma directly,
+# or high bit-depth files) falls back to letting OpenCV decode the grayscale view.
+_GRAY_FROM_RGB = {
+    ("PNG", "RGB"): _png_gray,
+    ("PNG", "RGBA"): _png_gray,
+    ("PNG", "P"): _png_gray,
+    ("BMP", "RGB"): _opencv_gray,
+    ("TIFF", "RGB"): _opencv_gray,
+    ("WEBP", "RGB"): _cvt_gray,
+}
+
+
+class _BufferReader(io.RawIOBase):
+    """Seekable file over a memoryview (shared memory, mmap) that reads from it without copying it whole."""
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast("B")
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), len(self._view) - self._pos))
+        buffer[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def open_buffer(data):
+    """Binary file object over image bytes; BytesIO shares bytes objects, other buffers are read in place."""
+    if isinstance(data, bytes):
+        return io.BytesIO(data)
+    return _BufferReader(data)
+
+
+class DecodedImage:
+    """
+    One uploaded image, decoded at most once and shared by every pipeline stage.
+    Views (RGB pixels, grayscale, per-model resized variants, base64 payload and
+    SHA-256 digest) are computed lazily on first use and then reused, so cache
+    hits never pay for decoding at all. Safe to share across worker threads.
+    """
+
+    def __init__(self, data, filename: str = None, digest: str = None):
+        # bytes or any buffer (memoryview of an mmapped upload or of shared memory)
+        self.data = data
+        self.filename = filename
+        self._digest = digest
+        self._lock = threading.RLock()
+        self._pil = None
+        self._mode = None
+        self._format = None
+        self._source = None
+        self._rgb = None
+        self._gray = None
+        self._resized = {}
+        self._base64 = None
+        self._payloads = {}
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            self._digest = hashlib.sha256(self.data).hexdigest()
+        return self._digest
+
+    @property
+    def mime_type(self) -> str:
+        return (mimetypes.guess_type(self.filename)[0] if self.filename else None) or "image/jpeg"
+
+    @property
+    def pil(self) -> Image.Image:
+        """Decoded RGB PIL image (what the classifiers were trained on)"""
+        with self._lock:
+            if self._pil is None:
+                with stage_timer("decode"):
+                    img = Image.open(open_buffer(self.data))
+                    # Decode now rather than on first pixel access, so it is timed here
+                    img.load()
+                    self._mode = img.mode
+                    self._format = img.format
+                    self._source = img if img.mode == "L" else None
+                    # Convert to RGB mode to ensure 3 channels
+                    if img.mode != 'RGB':
+                        img = img.convert('RGB')
+                    self._pil = img
+            return self._pil
+
+    @property
+    def mode(self) -> str:
+        """PIL mode of the uploaded file before conversion to RGB (e.g. "L", "I;16", "RGB")"""
+        with self._lock:
+            self.pil  # decoding records the source mode
+            return self._mode
+
+    @property
+    def rgb(self) -> np.ndarray:
+        """uint8 (height, width, 3) RGB pixels"""
+        with self._lock:
+            if self._rgb is None:
+                self._rgb = np.asarray(self.pil, dtype=np.uint8)
+            return self._rgb
+
+    @property
+    def gray(self) -> np.ndarray:
+        """uint8 (height, width) grayscale pixels, as cv2.IMREAD_GRAYSCALE would return"""
+        with self._lock:
+            if self._gray is None:
+                try:
+                    rgb = self.rgb
+                except Exception:
+                    rgb = None
+                convert = _GRAY_FROM_RGB.get((self._format, self._mode))
+                if rgb is not None and self._mode == "L":
+                    # Grayscale file: the decoded pixels already are the view
+                    self._gray = np.asarray(self._source, dtype=np.uint8)
+                elif rgb is not None and convert is not None:
+                    self._gray = convert(rgb)
+                else:
+                    # High bit-depth or exotic formats: let OpenCV do its own 8-bit conversion
+                    self._gray = cv2.imdecode(np.frombuffer(self.data, np.uint8), cv2.IMREAD_GRAYSCALE)
+                    if self._gray is None:
+                        raise ValueError("Error: Image not found or unable to load.")
+            return self._gray
+
+    def resized(self, img_size) -> np.ndarray:
+        """uint8 (height, width, 3) RGB pixels resized to img_size=(width, height), cached per size"""
+        img_size = tuple(img_size)
+        with self._lock:
+            if img_size not in self._resized:
+                self._resized[img_size] = np.asarray(self.pil.resize(img_size), dtype=np.uint8)
+            return self._resized[img_size]
+
+    @property
+    def base64(self) -> str:
+        """Base64 of the original bytes, as sent to the LLM"""
+        with self._lock:
+            if self._base64 is None:
+                self._base64 = base64.b64encode(self.data).decode("utf-8")
+            return self._base64
+
+    def llm_payload(self, options):
+        """(base64 payload, MIME type) sent to the LLM, reduced according to PayloadOptions and cached per options"""
+        key = options.cache_key()
+        with self._lock:
+            if key not in self._payloads:
+                with stage_timer("llm_payload"):
+                    data, mime_type, reduced = reduce_payload(self, options)
+                payload = self.base64 if not reduced else base64.b64encode(data).decode("utf-8")
+                self._payloads[key] = (payload, mime_type)
+            return self._payloads[key]
@@ -0,0 +1,83 @@
+import cv2
+
+# Output format -> (OpenCV extension, MIME type)
+IMAGE_FORMATS = {
+    "png": (".png", "image/png"),
+    "webp": (".webp", "image/webp"),
+    "jpeg": (".jpg", "image/jpeg"),
+}
+
+# "colormap": JET coloured BGR heatmap (default)
+# "intensity": single-channel intensity map the client colours itself (much smaller)
+HEATMAP_MODES = ("colormap", "intensity")
+
+
+class EncodingOptions:
+    """
+    How heatmap and ROI images are encoded in responses. The defaults reproduce
+    the original output exactly: default-compression PNG, JET heatmap, full size.
+    """
+
+    def __init__(self, image_format="png", quality=None, png_compression=None,
+                 heatmap_mode="colormap", heatmap_max_edge=None):
+        image_format = (image_format or "png").lower()
+        if image_format == "jpg":
+            image_format = "jpeg"
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format '{image_format}', expected one of {', '.join(IMAGE_FORMATS)}")
+        if heatmap_mode not in HEATMAP_MODES:
+            raise ValueError(f"Unsupported heatmap mode '{heatmap_mode}', expected one of {', '.join(HEATMAP_MODES)}")
+        if quality is not None and not 1 <= quality <= (101 if image_format == "webp" else 100):
+            raise ValueError("quality must be between 1 and 100" + (" (101 selects lossless WebP)" if image_format == "webp" else ""))
+        if png_compression is not None and not 0 <= png_compression <= 9:
+            raise ValueError("png_compression must be between 0 and 9")
+        if heatmap_max_edge is not None and heatmap_max_edge < 1:
+            raise ValueError("heatmap_max_edge must be positive")
+
+        self.image_format = image_format
+        self.quality = quality
+        self.png_compression = png_compression
+        self.heatmap_mode = heatmap_mode
+        self.heatmap_max_edge = heatmap_max_edge
+
+    @property
+    def mime_type(self) -> str:
+        return IMAGE_FORMATS[self.image_format][1]
+
+    @property
+    def extension(self) -> str:
+        return IMAGE_FORMATS[self.image_format][0]
+
+    def cache_key(self) -> str:
+        """Short string identifying these options, used in stage cache keys"""
+        return "-".join(str(v) for v in (
+            self.image_format, self.quality, self.png_compression, self.heatmap_mode, self.heatmap_max_edge
+        ))
+
+    def _params(self):
+        if self.image_format == "png":
+            return [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression] if self.png_compression is not None else []
+        if self.image_format == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, self.quality] if self.quality is not None else []
+        return [cv2.IMWRITE_JPEG_QUALITY, self.quality] if self.quality is not None else []
+
+    def encode(self, image) -> bytes:
+        ok, buffer = cv2.imencode(self.extension, image, self._params())
+        if not ok:
+            raise ValueError(f"Unable to encode image as {self.image_format}")
+        return buffer.tobytes()
+
+
+DEFAULT_ENCODING = EncodingOptions()
+
+
+def render_heatmap(gray, options: EncodingOptions = DEFAULT_ENCODING):
+    """Heatmap image for a grayscale scan, coloured and/or downscaled according to options."""
+    heatmap = gray if options.heatmap_mode == "intensity" else cv2.applyColorMap(gray, cv2.COLORMAP_JET)
+    if options.heatmap_max_edge:
+        height, width = heatmap.shape[:2]
+        scale = options.heatmap_max_edge / float(max(height, width))
+        if scale < 1.0:
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            heatmap = cv2.resize(heatmap, size, interpolation=cv2.INTER_AREA)
+    return heatmap
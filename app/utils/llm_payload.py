@@ -0,0 +1,105 @@
+"""
+Shrinks the image sent to the LLM. Uploads are often much larger than the model
+needs (high resolution, uncompressed BMP/TIFF, 16-bit PNG, grayscale scans
+stored as RGB), and every byte is base64 encoded and uploaded on each call.
+"""
+import cv2
+import numpy as np
+from app.utils.image_encoding import IMAGE_FORMATS
+from app.utils.metrics import registry
+
+LLM_PAYLOAD_BYTES = registry.counter(
+    "scansage_llm_payload_bytes_total", "Image bytes before and after payload reduction.", ("kind",),
+)
+LLM_PAYLOAD_SAVED = registry.counter(
+    "scansage_llm_payload_bytes_saved_total", "Image bytes not sent to the LLM thanks to payload reduction.",
+)
+LLM_PAYLOADS = registry.counter(
+    "scansage_llm_payloads_total", "Images prepared for the LLM, by outcome.", ("result",),
+)
+
+# PIL modes that only carry one channel of information
+GRAY_MODES = ("1", "L", "LA", "I", "I;16", "F")
+
+
+class PayloadOptions:
+    """
+    How images are reduced before being sent to the LLM: downscaled to
+    max_edge (0 keeps the size), converted to single-channel when the scan is
+    grayscale and re-encoded as image_format at quality. Uploads of at most
+    skip_bytes are sent unchanged, as is anything the re-encode doesn't shrink.
+    """
+
+    def __init__(self, enabled=True, max_edge=1536, image_format="jpeg", quality=90, skip_bytes=256 * 1024,
+                 grayscale=True):
+        image_format = (image_format or "jpeg").lower()
+        if image_format == "jpg":
+            image_format = "jpeg"
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format '{image_format}', expected one of {', '.join(IMAGE_FORMATS)}")
+        if not 1 <= quality <= 100:
+            raise ValueError("quality must be between 1 and 100")
+        self.enabled = enabled
+        self.max_edge = max(0, max_edge)
+        self.image_format = image_format
+        self.quality = quality
+        self.skip_bytes = skip_bytes
+        self.grayscale = grayscale
+
+    def cache_key(self) -> str:
+        """Short string identifying these options; part of the LLM stage cache key"""
+        if not self.enabled:
+            return "original"
+        return "-".join(str(v) for v in (
+            self.max_edge, self.image_format, self.quality, self.skip_bytes, int(self.grayscale)
+        ))
+
+    def _params(self):
+        if self.image_format == "jpeg":
+            return [cv2.IMWRITE_JPEG_QUALITY, self.quality]
+        if self.image_format == "webp":
+            return [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+        return []
+
+
+def _is_grayscale(image) -> bool:
+    """True for single-channel files and for RGB files whose channels are identical"""
+    if image.mode in GRAY_MODES:
+        return True
+    rgb = image.rgb
+    return np.array_equal(rgb[..., 0], rgb[..., 1]) and np.array_equal(rgb[..., 1], rgb[..., 2])
+
+
+def reduce_payload(image, options: PayloadOptions):
+    """
+    (data, mime_type, reduced) to send for a DecodedImage. data is the original
+    upload unless the reduced encoding is smaller.
+    """
+    original = len(image.data)
+    if not options.enabled or original <= options.skip_bytes:
+        result = "skipped"
+        data, mime_type = image.data, image.mime_type
+    else:
+        if options.grayscale and _is_grayscale(image):
+            pixels = image.gray
+        else:
+            pixels = cv2.cvtColor(image.rgb, cv2.COLOR_RGB2BGR)
+        height, width = pixels.shape[:2]
+        if options.max_edge and max(height, width) > options.max_edge:
+            scale = options.max_edge / float(max(height, width))
+            size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            pixels = cv2.resize(pixels, size, interpolation=cv2.INTER_AREA)
+        extension, reduced_type = IMAGE_FORMATS[options.image_format]
+        ok, buffer = cv2.imencode(extension, pixels, options._params())
+        if ok and len(buffer) < original:
+            result = "reduced"
+            data, mime_type = buffer.tobytes(), reduced_type
+        else:
+            result = "not_smaller"
+            data, mime_type = image.data, image.mime_type
+
+    LLM_PAYLOADS.inc(result=result)
+    LLM_PAYLOAD_BYTES.inc(original, kind="original")
+    LLM_PAYLOAD_BYTES.inc(len(data), kind="sent")
+    LLM_PAYLOAD_SAVED.inc(original - len(data))
+    return data, mime_type, result == "reduced"
@@ -0,0 +1,275 @@
+"""
+Lightweight Prometheus-style metrics and per-request stage timing.
+
+Counters, gauges and histograms with labels are rendered in the Prometheus
+text exposition format by registry.render(). Gauges and counters may be backed
+by a callback evaluated at scrape time, which is how services expose state they
+already track (cache counters, queue depths, in-flight calls).
+
+stage_timer() records how long a pipeline stage took into the stage histogram
+and into the timings of the current request, which MetricsMiddleware returns in
+a Server-Timing header.
+"""
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Base class: a named family of samples keyed by label values. If func is
+    given it is called at scrape time and returns either a single value (no
+    labels) or a dict mapping label-value tuples to values.
+    """
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.func = func
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _current(self) -> dict:
+        if self.func is None:
+            with self._lock:
+                return dict(self._values)
+        values = self.func()
+        return values if isinstance(values, dict) else {(): values}
+
+    def samples(self):
+        """(name, label pairs, value) for every sample of the family"""
+        for key, value in sorted(self._current().items()):
+            yield self.name, list(zip(self.labelnames, key)), value
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (not cumulative), sum, count
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total, count) for key, (counts, total, count) in self._values.items()}
+        for key, (counts, total, count) in sorted(values.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield f"{self.name}_bucket", labels + [("le", _format_value(bound))], cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class MetricsRegistry:
+    """Holds the metric families of the process and renders them for /metrics."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            # Re-registering (e.g. a module imported twice) keeps the first family
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=(), func=None) -> Counter:
+        return self.register(Counter(name, documentation, labelnames, func))
+
+    def gauge(self, name, documentation, labelnames=(), func=None) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames, func))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        blocks = []
+        for metric in metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception:
+                # A failing callback must not take the whole scrape down
+                continue
+        return "\n".join(blocks) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "scansage_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage", "endpoint", "organ"),
+)
+REQUEST_SECONDS = registry.histogram(
+    "scansage_http_request_duration_seconds", "HTTP request latency.", ("endpoint", "method", "status"),
+)
+
+
+def _resident_memory_bytes():
+    # /proc is Linux only; elsewhere the gauge reads 0
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+registry.gauge("process_resident_memory_bytes", "Resident memory size in bytes.", func=_resident_memory_bytes)
+
+
+# --- Per-request stage timings ------------------------------------------------
+
+class RequestTimings:
+    """Stage durations recorded while handling one HTTP request."""
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.stages = []
+
+    @property
+    def endpoint(self) -> str:
+        # Route template (e.g. /api/predict/{organ_type}) once routing has matched;
+        # unmatched paths share one label so they can't blow up the label space
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "unmatched"
+
+    def add(self, stage, seconds):
+        self.stages.append((stage, seconds))
+
+    def server_timing(self, total) -> str:
+        """Server-Timing header value; repeated stages (several images) are summed"""
+        durations = {}
+        for stage, seconds in self.stages:
+            durations[stage] = durations.get(stage, 0.0) + seconds
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in durations.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+def current_timings():
+    """Timings of the request being handled, or None outside a request"""
+    return _request_timings.get()
+
+
+def record_stage(stage, seconds, organ=""):
+    timings = _request_timings.get()
+    STAGE_SECONDS.observe(seconds, stage=stage, endpoint=timings.endpoint if timings else "", organ=organ)
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+@contextmanager
+def stage_timer(stage, organ=""):
+    """Time the enclosed block as one pipeline stage (works around awaits too)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, organ)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times every HTTP request, makes its RequestTimings
+    available to stage_timer, and (optionally) adds a Server-Timing header with
+    the stages that finished before the response started.
+    """
+
+    def __init__(self, app, server_timing=True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(scope)
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    header = timings.server_timing(time.perf_counter() - start).encode("latin-1")
+                    message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", header)])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start, endpoint=timings.endpoint, method=scope["method"], status=str(status),
+            )
+            _request_timings.reset(token)
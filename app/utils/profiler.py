@@ -0,0 +1,83 @@
+"""
+Low-overhead sampling profiler for hot-path analysis in a running server.
+
+A background thread snapshots the Python stack of every other thread at a
+fixed interval and counts identical stacks. The result is in the "collapsed
+stack" format understood by flamegraph.pl and speedscope:
+
+    thread;module:function;module:function 42
+"""
+import os
+import sys
+import threading
+from collections import Counter
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    return f"{module}:{code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(self, interval_ms=10.0, max_depth=64):
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.max_depth = max_depth
+        self.samples = 0
+        self._stacks = Counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                sampled.append(";".join(reversed(stack)))
+            with self._lock:
+                self.samples += 1
+                self._stacks.update(sampled)
+
+    def collapsed(self, reset=False) -> str:
+        """Sampled stacks in collapsed format, most frequent first"""
+        with self._lock:
+            stacks = self._stacks.most_common()
+            if reset:
+                self._stacks.clear()
+                self.samples = 0
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+
+def start_profiler(interval_ms):
+    """Start a profiler sampling every interval_ms; returns None when disabled (0)."""
+    if not interval_ms or interval_ms <= 0:
+        return None
+    profiler = SamplingProfiler(interval_ms)
+    profiler.start()
+    return profiler
@@ -0,0 +1,129 @@
+import base64
+import json
+import uuid
+from typing import Optional
+from fastapi import HTTPException, Query, Request
+from fastapi.responses import Response
+from app.utils.image_encoding import EncodingOptions
+
+RESPONSE_FORMATS = ("json", "multipart", "image")
+
+
+def encoding_options(
+        image_format: str = Query("png", description="png, webp or jpeg"),
+        quality: Optional[int] = Query(None, description="WebP/JPEG quality (1-100, 101 = lossless WebP)"),
+        png_compression: Optional[int] = Query(None, description="PNG compression level (0-9)"),
+        heatmap_mode: str = Query("colormap", description="colormap, or intensity for a single-channel map the client colours"),
+        heatmap_max_edge: Optional[int] = Query(None, description="Downscale the heatmap so its longest edge is at most this"),
+) -> EncodingOptions:
+    """FastAPI dependency building the image encoding options from query parameters."""
+    try:
+        return EncodingOptions(image_format, quality, png_compression, heatmap_mode, heatmap_max_edge)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _media_ranges(accept: str):
+    """(media range, q) for each entry of an Accept header; malformed q-values count as 0."""
+    ranges = []
+    for entry in accept.split(","):
+        media, *params = [part.strip() for part in entry.split(";")]
+        if not media:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    q = 0.0
+        ranges.append((media.lower(), q))
+    return ranges
+
+
+def _quality(ranges, media_type: str) -> float:
+    """q of media_type under the most specific matching range (exact, then type/*, then */*)."""
+    main = media_type.split("/")[0]
+    for candidate in (media_type, f"{main}/*", "*/*"):
+        matches = [q for media, q in ranges if media == candidate]
+        if matches:
+            return max(matches)
+    return 0.0
+
+
+def _binary_format(media: str) -> Optional[str]:
+    if media in ("multipart/mixed", "multipart/*"):
+        return "multipart"
+    if media.startswith("image/"):
+        return "image"
+    return None
+
+
+def negotiate_response_format(request: Request, response_format: Optional[str] = None) -> str:
+    """
+    Pick json, multipart or image from the explicit response_format parameter,
+    falling back to the Accept header. JSON stays the default: a binary format
+    is only chosen when the client's most preferred media ranges are all
+    multipart/mixed or image types and rank above application/json. A browser
+    listing text/html and image/webp next to */*;q=0.8 therefore still gets JSON.
+    """
+    if response_format:
+        if response_format not in RESPONSE_FORMATS:
+            raise HTTPException(status_code=400, detail=f"response_format must be one of {', '.join(RESPONSE_FORMATS)}")
+        return response_format
+
+    ranges = _media_ranges(request.headers.get("accept", ""))
+    listed = [(media, q) for media, q in ranges if q > 0 and media != "*/*"]
+    if not listed:
+        return "json"
+    best = max(q for _, q in listed)
+    preferred = {_binary_format(media) for media, q in listed if q == best}
+    if None in preferred or best <= _quality(ranges, "application/json"):
+        return "json"
+    return "multipart" if "multipart" in preferred else "image"
+
+
+def negotiate_stream_type(request: Request, media_types) -> Optional[str]:
+    """
+    The one of media_types (streaming formats) that the Accept header lists by
+    name with the highest q, if that q ranks above application/json; else None.
+    Wildcards alone never start a stream.
+    """
+    ranges = _media_ranges(request.headers.get("accept", ""))
+    best, best_q = None, 0.0
+    for media_type in media_types:
+        q = max((q for media, q in ranges if media == media_type), default=0.0)
+        if q > best_q:
+            best, best_q = media_type, q
+    if best is None or best_q <= _quality(ranges, "application/json"):
+        return None
+    return best
+
+
+def multipart_response(metadata: dict, parts, status_code: int = 200) -> Response:
+    """
+    multipart/mixed response: a JSON part with the metadata, followed by one
+    binary part per (name, data, mime_type), without any base64 overhead.
+    """
+    boundary = uuid.uuid4().hex
+    chunks = [
+        f"--{boundary}\r\nContent-Type: application/json\r\nContent-Disposition: inline; name=\"metadata\"\r\n\r\n".encode(),
+        json.dumps(metadata).encode(),
+        b"\r\n",
+    ]
+    for name, data, mime_type in parts:
+        if data is None:
+            continue
+        chunks.append(
+            f"--{boundary}\r\nContent-Type: {mime_type}\r\nContent-Disposition: inline; name=\"{name}\"\r\n"
+            f"Content-Length: {len(data)}\r\n\r\n".encode()
+        )
+        chunks.append(data)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return Response(b"".join(chunks), status_code=status_code, media_type=f"multipart/mixed; boundary={boundary}")
+
+
+def to_base64(data: Optional[bytes]) -> Optional[str]:
+    return base64.b64encode(data).decode("utf-8") if data is not None else None
@@ -0,0 +1,141 @@
+import base64
+import binascii
+import struct
+
+# Compact tagged binary encoding for cached stage results.
+# Only plain JSON-like values are supported (None, bool, int, float, str, bytes,
+# list, tuple, dict), so loading data from a shared store can never execute code.
+# Base64 encoded images (PNG/JPEG/WebP) are stored as their raw bytes and
+# re-encoded on load, which saves the 33% base64 overhead.
+
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _BYTES, _B64, _LIST, _TUPLE, _DICT = b"NTFifsbplt" + b"d"
+_FLOAT_STRUCT = struct.Struct(">d")
+
+# Base64 prefixes of PNG, JPEG and WebP (RIFF) files
+_B64_IMAGE_PREFIXES = ("iVBORw0KGg", "/9j/", "UklGR")
+
+
+def _write_varint(out: bytearray, n: int) -> None:
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varint(data: memoryview, pos: int):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _as_image_bytes(value: str):
+    # Only treat a string as an image if it decodes and re-encodes to exactly the same text
+    if len(value) < 64 or not value.startswith(_B64_IMAGE_PREFIXES):
+        return None
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    return raw if base64.b64encode(raw).decode("ascii") == value else None
+
+
+def _encode(value, out: bytearray) -> None:
+    if value is None:
+        out.append(_NONE)
+    elif value is True:
+        out.append(_TRUE)
+    elif value is False:
+        out.append(_FALSE)
+    elif isinstance(value, int):
+        out.append(_INT)
+        # Zigzag so negative numbers stay short
+        _write_varint(out, (value << 1) if value >= 0 else ((-value << 1) - 1))
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _FLOAT_STRUCT.pack(value)
+    elif isinstance(value, str):
+        raw = _as_image_bytes(value)
+        if raw is not None:
+            out.append(_B64)
+        else:
+            out.append(_STR)
+            raw = value.encode("utf-8")
+        _write_varint(out, len(raw))
+        out += raw
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out.append(_BYTES)
+        _write_varint(out, len(value))
+        out += value
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST if isinstance(value, list) else _TUPLE)
+        _write_varint(out, len(value))
+        for item in value:
+            _encode(item, out)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            _encode(key, out)
+            _encode(item, out)
+    else:
+        raise TypeError(f"Cannot serialize value of type {type(value).__name__}")
+
+
+def _decode(data: memoryview, pos: int):
+    tag = data[pos]
+    pos += 1
+    if tag == _NONE:
+        return None, pos
+    if tag == _TRUE:
+        return True, pos
+    if tag == _FALSE:
+        return False, pos
+    if tag == _INT:
+        n, pos = _read_varint(data, pos)
+        return (n >> 1) if not n & 1 else -((n + 1) >> 1), pos
+    if tag == _FLOAT:
+        return _FLOAT_STRUCT.unpack_from(data, pos)[0], pos + 8
+    if tag in (_STR, _BYTES, _B64):
+        length, pos = _read_varint(data, pos)
+        raw = bytes(data[pos:pos + length])
+        pos += length
+        if tag == _STR:
+            return raw.decode("utf-8"), pos
+        if tag == _B64:
+            return base64.b64encode(raw).decode("ascii"), pos
+        return raw, pos
+    if tag in (_LIST, _TUPLE):
+        length, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(length):
+            item, pos = _decode(data, pos)
+            items.append(item)
+        return (items if tag == _LIST else tuple(items)), pos
+    if tag == _DICT:
+        length, pos = _read_varint(data, pos)
+        result = {}
+        for _ in range(length):
+            key, pos = _decode(data, pos)
+            result[key], pos = _decode(data, pos)
+        return result, pos
+    raise ValueError(f"Corrupt cache entry: unknown tag {tag!r}")
+
+
+def dumps(value) -> bytes:
+    out = bytearray()
+    _encode(value, out)
+    return bytes(out)
+
+
+def loads(data: bytes):
+    value, _ = _decode(memoryview(data), 0)
+    return value
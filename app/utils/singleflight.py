@@ -0,0 +1,72 @@
+import asyncio
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one execution: the first
+    caller starts the work in its own task, later callers with the same key
+    await that task instead of starting it again. Every caller gets the result
+    or the exception of the shared run; nothing is remembered once it finishes
+    (results are cached by ImageCache, failures are retried by the next call).
+
+    A cancelled caller only stops waiting. The work is cancelled when every
+    caller waiting on it has been cancelled.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        # Statistics
+        self.started = 0
+        self.shared = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key, func):
+        """
+        Await func() for key, sharing a run already in progress for the same key.
+        Returns (result, shared) where shared is True if another caller started the run.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if shared:
+            self.shared += 1
+        else:
+            self.started += 1
+            # The task copies the starting caller's context (request timings, priority)
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._finish(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        except asyncio.CancelledError:
+            if not flight.task.done() and flight.waiters == 1:
+                # Nobody else wants the result. Forget the run now rather than when the task
+                # finishes cancelling, so the next caller starts afresh instead of joining it
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _finish(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled():
+            # Mark a failure as retrieved even if every waiter left before it happened
+            flight.task.exception()
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "started": self.started, "shared": self.shared}
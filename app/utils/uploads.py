@@ -0,0 +1,200 @@
+"""
+Upload ingestion with size limits and without extra copies of the image bytes.
+
+Starlette's multipart parser streams every file part into a SpooledTemporaryFile
+(kept in memory up to 1 MB, written to disk beyond that). UploadLimitMiddleware
+counts the request body, and the bytes of each multipart part, as they stream
+in and rejects an oversized request or file with 413 before the rest of it is
+buffered. read_image() then hashes the part's spooled data chunk by chunk,
+stopping at the file limit, and hands the pipeline a view of it, either the
+in-memory buffer itself or a read-only mmap of the spool file, so a large
+multi-image post costs page cache rather than several private copies of every
+image.
+"""
+import asyncio
+import hashlib
+import io
+import mmap
+import os
+import re
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+from app.config import UPLOAD_MAX_FILE_BYTES, UPLOAD_MAX_REQUEST_BYTES, VOLUME_MAX_BYTES
+from app.utils.decoded_image import DecodedImage
+from app.utils.metrics import registry
+
+# Digest is computed in slices of this size so a mapped file is paged in progressively
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Per-file limits of endpoints that take something other than a single image
+# (0 = only the request limit): /batch takes archives of many images, and
+# /volume whole studies, bounded by the volume limit instead
+PATH_FILE_LIMITS = (
+    (re.compile(r"/api/predict/[^/]+/batch/?"), 0),
+    (re.compile(r"/api/predict/[^/]+/volume/?"), VOLUME_MAX_BYTES),
+)
+
+UPLOADS_REJECTED = registry.counter(
+    "scansage_uploads_rejected_total", "Uploads rejected for exceeding a size limit.", ("limit",),
+)
+
+
+class UploadTooLarge(HTTPException):
+    """413: a file or the whole request body is over its configured limit."""
+
+    def __init__(self, what, limit):
+        UPLOADS_REJECTED.inc(limit=what)
+        super().__init__(status_code=413, detail=f"{what.capitalize()} exceeds the {limit} byte upload limit")
+
+
+def upload_too_large_response(error: UploadTooLarge) -> JSONResponse:
+    return JSONResponse(content={"error": error.detail}, status_code=error.status_code)
+
+
+def spooled_buffer(file):
+    """The bytes of a spooled upload without copying them: shared in-memory bytes or an mmap view."""
+    # SpooledTemporaryFile keeps its data in a BytesIO until it rolls over to a real file
+    raw = getattr(file, "_file", file)
+    if isinstance(raw, io.BytesIO):
+        # getvalue() shares the BytesIO's internal buffer instead of copying it
+        return raw.getvalue()
+    try:
+        raw.flush()
+        size = os.fstat(raw.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        file.seek(0)
+        return file.read()
+    if size == 0:
+        return b""
+    # The mapping stays valid after FastAPI closes (and deletes) the spool file
+    return memoryview(mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def upload_buffer(file, max_bytes=UPLOAD_MAX_FILE_BYTES):
+    """spooled_buffer() of an upload, or UploadTooLarge if it is over max_bytes."""
+    data = spooled_buffer(file)
+    if max_bytes and len(data) > max_bytes:
+        raise UploadTooLarge("file", max_bytes)
+    return data
+
+
+def ingest(file, max_bytes=UPLOAD_MAX_FILE_BYTES):
+    """
+    (data, sha256 hex digest) of a spooled upload. The data is counted and
+    hashed in one pass, HASH_CHUNK_BYTES at a time, and UploadTooLarge is raised
+    as soon as the count passes max_bytes, before the rest is paged in.
+    """
+    data = spooled_buffer(file)
+    view = memoryview(data)
+    digest = hashlib.sha256()
+    size = 0
+    for start in range(0, len(view), HASH_CHUNK_BYTES):
+        chunk = view[start:start + HASH_CHUNK_BYTES]
+        size += len(chunk)
+        if max_bytes and size > max_bytes:
+            raise UploadTooLarge("file", max_bytes)
+        digest.update(chunk)
+    return data, digest.hexdigest()
+
+
+async def read_image(upload: UploadFile, max_bytes=UPLOAD_MAX_FILE_BYTES) -> DecodedImage:
+    """DecodedImage over an uploaded file, with its digest already computed."""
+    data, digest = await asyncio.get_running_loop().run_in_executor(None, ingest, upload.file, max_bytes)
+    return DecodedImage(data, upload.filename, digest)
+
+
+class _PartCounter:
+    """
+    Bytes received so far for the current part of a multipart body, found by
+    scanning each chunk for the boundary delimiter as it streams in.
+    """
+
+    def __init__(self, boundary: bytes):
+        self.delimiter = b"\r\n--" + boundary
+        self.size = 0
+        # End of the previous chunk, in case a delimiter straddles two chunks
+        self._tail = b""
+
+    def feed(self, chunk: bytes) -> int:
+        """Largest part size seen in this chunk, including any parts it holds entirely."""
+        data = self._tail + chunk
+        # The tail was already counted as part of the current part
+        start, largest = len(self._tail), 0
+        found = data.find(self.delimiter)
+        while found >= 0:
+            largest = max(largest, self.size + max(found - start, 0))
+            self.size, start = 0, found + len(self.delimiter)
+            found = data.find(self.delimiter, start)
+        self.size += len(data) - max(start, len(self._tail))
+        self._tail = data[-(len(self.delimiter) - 1):]
+        return max(largest, self.size)
+
+
+def _multipart_boundary(headers: dict):
+    content_type = headers.get(b"content-type", b"")
+    if not content_type.lower().startswith(b"multipart/form-data"):
+        return None
+    for param in content_type.split(b";")[1:]:
+        name, _, value = param.strip().partition(b"=")
+        if name.lower() == b"boundary" and value:
+            return value.strip(b'"')
+    return None
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware capping the request body at max_bytes and each multipart
+    part at max_file_bytes (plus PART_HEADER_BYTES for the part's headers): a
+    larger Content-Length is answered with 413 straight away, and a body or
+    part that streams past its limit stops being read and gets 413 from the
+    endpoint. Paths matching a pattern of path_file_limits use its limit
+    instead of max_file_bytes.
+    """
+
+    # Allowance for a part's own headers; ingest() checks the exact file size
+    PART_HEADER_BYTES = 16 * 1024
+
+    def __init__(self, app, max_bytes=UPLOAD_MAX_REQUEST_BYTES, max_file_bytes=UPLOAD_MAX_FILE_BYTES,
+                 path_file_limits=PATH_FILE_LIMITS):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.path_file_limits = path_file_limits
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if (self.max_bytes and content_length is not None and content_length.isdigit()
+                and int(content_length) > self.max_bytes):
+            await upload_too_large_response(UploadTooLarge("request", self.max_bytes))(scope, receive, send)
+            return
+
+        max_file_bytes = next(
+            (limit for pattern, limit in self.path_file_limits if pattern.fullmatch(scope["path"])),
+            self.max_file_bytes,
+        )
+        boundary = _multipart_boundary(headers) if max_file_bytes else None
+        parts = _PartCounter(boundary) if boundary is not None else None
+        if not (self.max_bytes or parts):
+            await self.app(scope, receive, send)
+            return
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                body = message.get("body", b"")
+                received += len(body)
+                # An HTTPException passes through FastAPI's form parsing unchanged
+                if self.max_bytes and received > self.max_bytes:
+                    raise UploadTooLarge("request", self.max_bytes)
+                if parts is not None and parts.feed(body) > max_file_bytes + self.PART_HEADER_BYTES:
+                    raise UploadTooLarge("file", max_file_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
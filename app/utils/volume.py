@@ -0,0 +1,327 @@
+"""
+Volumetric scans read one slice at a time.
+
+NIfTI-1 (.nii, .nii.gz) and NumPy (.npy) volumes are viewed in place over the
+spooled upload (an mmap of the spool file once it is on disk), so a slice is
+only paged in when it is read; a gzipped NIfTI is decompressed to a temporary
+file first and mapped the same way, up to VOLUME_MAX_BYTES. A DICOM series is
+a zip/tar archive of one file per slice (or a single .dcm file): only the
+headers are read up front, to order the slices, and each slice's pixels are
+decoded when it is needed. DICOM support needs the optional 'pydicom' package.
+
+Slices come out as float32 (rows, columns) arrays in scanner units (rescale
+slope and intercept applied); window_slice() maps them onto uint8 for the ROI
+and classifier stages.
+"""
+import gzip
+import io
+import mmap
+import os
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import zipfile
+import numpy as np
+from app.config import VOLUME_MAX_BYTES
+from app.utils.archive import ARCHIVE_EXTENSIONS, is_archive
+from app.utils.decoded_image import open_buffer
+
+VOLUME_EXTENSIONS = (".nii", ".nii.gz", ".npy", ".dcm") + ARCHIVE_EXTENSIONS
+
+# Slices and pixels per slice sampled to pick a window when none is given
+AUTO_WINDOW_SLICES = 16
+AUTO_WINDOW_PIXELS = 256 * 256
+
+# NIfTI-1 datatype codes -> numpy type codes (byte order added from the header)
+NIFTI_DTYPES = {
+    2: "u1", 4: "i2", 8: "i4", 16: "f4", 64: "f8",
+    256: "i1", 512: "u2", 768: "u4", 1024: "i8", 1280: "u8",
+}
+NIFTI_HEADER_BYTES = 348
+
+GZIP_MAGIC = b"\x1f\x8b"
+NPY_MAGIC = b"\x93NUMPY"
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+class VolumeTooLarge(ValueError):
+    """The voxel data of a volume, or one file of a series, is over VOLUME_MAX_BYTES."""
+
+    def __init__(self, size, limit):
+        super().__init__(f"Volume data of {size} bytes exceeds the {limit} byte limit")
+
+
+def _check_size(size, max_bytes):
+    if max_bytes and size > max_bytes:
+        raise VolumeTooLarge(size, max_bytes)
+
+
+class Volume:
+    """
+    A stack of slices read lazily. count is the number of slices, shape the
+    (rows, columns) of each, and window the (center, width) suggested by the
+    file itself, or None.
+    """
+
+    def __init__(self, count, shape, window=None):
+        self.count = count
+        self.shape = shape
+        self.window = window
+
+    def slice(self, index) -> np.ndarray:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ArrayVolume(Volume):
+    """A (slices, rows, columns) view over mapped voxel data, rescaled slice by slice."""
+
+    def __init__(self, voxels, slope=1.0, intercept=0.0):
+        if not all(voxels.shape):
+            raise ValueError(f"Empty volume of shape {voxels.shape}")
+        super().__init__(voxels.shape[0], tuple(voxels.shape[1:]))
+        self.voxels = voxels
+        self.slope = float(slope)
+        self.intercept = float(intercept)
+
+    def slice(self, index):
+        values = self.voxels[index].astype(np.float32)
+        if self.slope != 1.0 or self.intercept != 0.0:
+            values *= self.slope
+            values += self.intercept
+        return values
+
+
+def _mapped_copy(stream, max_bytes=VOLUME_MAX_BYTES):
+    # Write a stream to an unnamed temp file and map it; the mapping outlives the file object
+    with tempfile.TemporaryFile() as spool:
+        if max_bytes:
+            # One chunk past the limit at most is read and written
+            while chunk := stream.read(COPY_CHUNK_BYTES):
+                spool.write(chunk)
+                _check_size(spool.tell(), max_bytes)
+        else:
+            shutil.copyfileobj(stream, spool, COPY_CHUNK_BYTES)
+        spool.flush()
+        if not spool.tell():
+            return b""
+        return memoryview(mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def read_nifti(buffer, max_bytes=VOLUME_MAX_BYTES) -> ArrayVolume:
+    """
+    Volume over a single-file NIfTI-1 image; only the first volume of a 4D
+    series is used. A gzipped image is decompressed up to max_bytes.
+    """
+    if bytes(buffer[:2]) == GZIP_MAGIC:
+        with gzip.GzipFile(fileobj=open_buffer(buffer)) as stream:
+            buffer = _mapped_copy(stream, max_bytes)
+    header = bytes(buffer[:NIFTI_HEADER_BYTES])
+    if len(header) < NIFTI_HEADER_BYTES:
+        raise ValueError("Truncated NIfTI header")
+    endian = "<" if struct.unpack("<i", header[:4])[0] == NIFTI_HEADER_BYTES else ">"
+    if struct.unpack(endian + "i", header[:4])[0] != NIFTI_HEADER_BYTES:
+        raise ValueError("Not a NIfTI-1 file")
+    if header[344:348] != b"n+1\x00":
+        raise ValueError("Only single-file NIfTI-1 images (.nii) are supported")
+
+    dims = struct.unpack(endian + "8h", header[40:56])
+    if not 2 <= dims[0] <= 7:
+        raise ValueError(f"Unsupported NIfTI dimensions {dims[0]}")
+    shape = (dims[1], dims[2], dims[3] if dims[0] >= 3 else 1)
+    datatype = struct.unpack(endian + "h", header[70:72])[0]
+    if datatype not in NIFTI_DTYPES:
+        raise ValueError(f"Unsupported NIfTI datatype {datatype}")
+    dtype = np.dtype(endian + NIFTI_DTYPES[datatype])
+    vox_offset, slope, intercept = struct.unpack(endian + "3f", header[108:120])
+
+    count = shape[0] * shape[1] * shape[2]
+    _check_size(count * dtype.itemsize, max_bytes)
+    offset = int(vox_offset)
+    if offset + count * dtype.itemsize > len(buffer):
+        raise ValueError("Truncated NIfTI voxel data")
+    # Voxels are stored x fastest; (x, y, z) -> (z, y, x) so a slice is rows x columns
+    voxels = np.frombuffer(buffer, dtype, count, offset).reshape(shape, order="F").transpose(2, 1, 0)
+    # A zero slope means the values are not scaled
+    return ArrayVolume(voxels, slope or 1.0, intercept if slope else 0.0)
+
+
+def read_npy(buffer, max_bytes=VOLUME_MAX_BYTES) -> ArrayVolume:
+    """Volume over a .npy array of shape (slices, rows, columns), or a single (rows, columns) slice."""
+    reader = open_buffer(buffer)
+    version = np.lib.format.read_magic(reader)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(reader)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(reader)
+    if dtype.hasobject or dtype.kind not in "biuf":
+        raise ValueError(f"Unsupported array dtype {dtype}")
+    if len(shape) not in (2, 3):
+        raise ValueError(f"Expected a 2D or 3D array, got shape {shape}")
+    count = int(np.prod(shape))
+    _check_size(count * dtype.itemsize, max_bytes)
+    if reader.tell() + count * dtype.itemsize > len(buffer):
+        raise ValueError("Truncated .npy data")
+    voxels = np.frombuffer(buffer, dtype, count, reader.tell()).reshape(shape, order="F" if fortran_order else "C")
+    return ArrayVolume(voxels[np.newaxis] if voxels.ndim == 2 else voxels)
+
+
+def _pydicom():
+    try:
+        import pydicom
+    except ImportError:
+        raise ImportError("DICOM series require the 'pydicom' package (pip install pydicom)")
+    return pydicom
+
+
+def _first(value):
+    # Window settings may be multi-valued; the first pair is the primary one
+    if value is None:
+        return None
+    try:
+        return float(value[0])
+    except TypeError:
+        return float(value)
+
+
+class DicomSeries(Volume):
+    """
+    One DICOM file per slice, in a zip/tar archive or a single .dcm file.
+    Slices are ordered along the slice normal (ImagePositionPatient), falling
+    back to InstanceNumber, then to the member name. slice() may be called
+    from several threads: the archive is read under a lock, one member at a
+    time, and only the pixel decoding runs in parallel.
+    """
+
+    def __init__(self, buffer, filename, max_bytes=VOLUME_MAX_BYTES):
+        self.pydicom = _pydicom()
+        self._archive = None
+        # Archive readers share one file position (and a gzip stream's state)
+        self._lock = threading.Lock()
+        members = self._members(buffer, filename, max_bytes)
+
+        slices = []
+        for name, open_member in members:
+            with open_member() as stream:
+                try:
+                    header = self.pydicom.dcmread(stream, stop_before_pixels=True)
+                except self.pydicom.errors.InvalidDicomError:
+                    # Not a DICOM file (DICOMDIR index, readme, ...)
+                    continue
+            if "Rows" not in header or "Columns" not in header:
+                continue
+            slices.append((self._position(header), name, open_member, header))
+        if not slices:
+            self.close()
+            raise ValueError("No DICOM slices found")
+        slices.sort(key=lambda item: (item[0], item[1]))
+
+        first = slices[0][3]
+        center, width = _first(first.get("WindowCenter")), _first(first.get("WindowWidth"))
+        super().__init__(
+            len(slices), (int(first.Rows), int(first.Columns)),
+            (center, width) if center is not None and width else None,
+        )
+        # Rescale per slice: it may differ between the files of a series
+        self._slices = [
+            (open_member, float(header.get("RescaleSlope", 1) or 1), float(header.get("RescaleIntercept", 0) or 0))
+            for _, _, open_member, header in slices
+        ]
+
+    def _members(self, buffer, filename, max_bytes):
+        # (name, opener) per file; an archive member over max_bytes rejects the series before it is read
+        if not is_archive(filename) and not zipfile.is_zipfile(open_buffer(buffer)):
+            return [(filename, lambda: open_buffer(buffer))]
+        fileobj = open_buffer(buffer)
+        if zipfile.is_zipfile(fileobj):
+            fileobj.seek(0)
+            self._archive = zipfile.ZipFile(fileobj)
+            members = [info for info in self._archive.infolist() if not info.is_dir() and not _hidden(info.filename)]
+            for info in members:
+                _check_size(info.file_size, max_bytes)
+            return [(info.filename, lambda info=info: self._archive.open(info)) for info in members]
+        fileobj.seek(0)
+        self._archive = tarfile.open(fileobj=fileobj, mode="r:*")
+        members = [member for member in self._archive.getmembers() if member.isfile() and not _hidden(member.name)]
+        for member in members:
+            _check_size(member.size, max_bytes)
+        return [(member.name, lambda member=member: self._archive.extractfile(member)) for member in members]
+
+    @staticmethod
+    def _position(header):
+        position, orientation = header.get("ImagePositionPatient"), header.get("ImageOrientationPatient")
+        if position is not None and orientation is not None and len(orientation) == 6:
+            normal = np.cross([float(v) for v in orientation[:3]], [float(v) for v in orientation[3:]])
+            return (0, float(np.dot(normal, [float(v) for v in position])), 0)
+        instance = header.get("InstanceNumber")
+        return (1, 0.0, int(instance) if instance is not None else 0)
+
+    def slice(self, index):
+        open_member, slope, intercept = self._slices[index]
+        with self._lock:
+            with open_member() as stream:
+                data = stream.read()
+        dataset = self.pydicom.dcmread(io.BytesIO(data))
+        values = dataset.pixel_array.astype(np.float32)
+        if values.ndim != 2:
+            # Multi-frame or colour file: keep the first frame, as luminance
+            values = values[0] if values.ndim == 3 and values.shape[-1] not in (3, 4) else values.mean(axis=-1)
+        values *= slope
+        values += intercept
+        return values
+
+    def close(self):
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+
+def _hidden(name):
+    # Same members the image archive reader skips
+    base = os.path.basename(name)
+    return not base or base.startswith(".") or "__MACOSX" in name or base.upper() == "DICOMDIR"
+
+
+def open_volume(buffer, filename, max_bytes=VOLUME_MAX_BYTES) -> Volume:
+    """
+    Volume over the bytes of an uploaded .nii(.gz), .npy, .dcm or DICOM archive.
+    VolumeTooLarge is raised when its voxel data, or one file of a series, is
+    over max_bytes.
+    """
+    name = (filename or "").lower()
+    head = bytes(buffer[:4])
+    if name.endswith((".nii", ".nii.gz")):
+        return read_nifti(buffer, max_bytes)
+    if name.endswith(".npy") or bytes(buffer[:6]) == NPY_MAGIC:
+        return read_npy(buffer, max_bytes)
+    if name.endswith(".dcm") or is_archive(name) or head == b"PK\x03\x04":
+        return DicomSeries(buffer, filename, max_bytes)
+    if head[:2] == GZIP_MAGIC or len(buffer) >= NIFTI_HEADER_BYTES and bytes(buffer[344:348]) == b"n+1\x00":
+        return read_nifti(buffer, max_bytes)
+    if bytes(buffer[128:132]) == b"DICM":
+        return DicomSeries(buffer, filename, max_bytes)
+    raise ValueError(f"Unsupported volume format; expected one of {', '.join(VOLUME_EXTENSIONS)}")
+
+
+def auto_window(volume: Volume):
+    """(center, width) spanning the 0.5-99.5th percentiles of a strided sample of the volume."""
+    picks = np.unique(np.linspace(0, volume.count - 1, min(volume.count, AUTO_WINDOW_SLICES)).astype(int))
+    samples = []
+    for index in picks:
+        values = volume.slice(int(index))
+        step = max(1, int(np.sqrt(values.size / AUTO_WINDOW_PIXELS)))
+        samples.append(values[::step, ::step].ravel())
+    low, high = np.percentile(np.concatenate(samples), (0.5, 99.5))
+    return float(low + high) / 2.0, max(float(high - low), 1e-6)
+
+
+def window_slice(values, center, width) -> np.ndarray:
+    """uint8 slice: values across [center - width / 2, center + width / 2] mapped onto 0..255."""
+    scaled = values - np.float32(center - width / 2.0)
+    scaled *= np.float32(255.0 / width)
+    np.clip(scaled, 0, 255, out=scaled)
+    return scaled.astype(np.uint8)
@@ -0,0 +1,117 @@
+"""
+Payload size and latency impact of shrinking scans before they are sent to the LLM.
+
+For each sample image, prepares the LLM payload with reduction off and with
+the given options, and reports the bytes sent (base64 encoded, as in the
+request), the time spent reducing the already decoded image and the estimated
+upload time at --mbps. Without --images a synthetic set is used: grayscale PNGs
+at several sizes, a grayscale scan stored as RGB, an uncompressed BMP, a 16-bit
+PNG and a colour JPEG.
+
+Usage:
+    python -m scripts.bench_llm_payload
+    python -m scripts.bench_llm_payload --images 'samples/*.png' --max-edge 1024 --format webp --quality 85
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import cv2
+import numpy as np
+from app.utils.decoded_image import DecodedImage
+from app.utils.llm_payload import PayloadOptions
+
+
+def _scan(size, seed=0):
+    rng = np.random.default_rng(seed)
+    noise = (rng.random((size, size)) * 255).astype(np.uint8)
+    image = cv2.GaussianBlur(noise, (0, 0), size / 40.0)
+    return cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX)
+
+
+def synthetic_samples():
+    """(name, file bytes) of scans shaped like the uploads the service gets."""
+    def encode(extension, image):
+        return cv2.imencode(extension, image)[1].tobytes()
+
+    scan = _scan(2048)
+    samples = [(f"gray-{size}.png", encode(".png", _scan(size, size))) for size in (256, 512, 1024)]
+    samples += [
+        ("gray-2048.png", encode(".png", scan)),
+        ("gray-as-rgb-2048.png", encode(".png", cv2.cvtColor(scan, cv2.COLOR_GRAY2BGR))),
+        ("gray-2048.bmp", encode(".bmp", scan)),
+        ("gray16-2048.png", encode(".png", scan.astype(np.uint16) * 257)),
+        ("colour-2048.jpg", encode(".jpg", cv2.applyColorMap(scan, cv2.COLORMAP_BONE))),
+    ]
+    return samples
+
+
+def load_samples(pattern):
+    samples = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, "rb") as f:
+            samples.append((os.path.basename(path), f.read()))
+    return samples
+
+
+def measure(name, data, options, mbps, repeat):
+    """Best-of-repeat preparation time, sent size and estimated upload time for one image."""
+    best = None
+    for _ in range(repeat):
+        image = DecodedImage(data, name)
+        # The ROI and classifier stages decode the upload anyway; time only the reduction
+        image.rgb, image.gray
+        start = time.perf_counter()
+        payload, mime_type = image.llm_payload(options)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    upload = len(payload) * 8 / (mbps * 1e6)
+    return {"bytes": len(payload), "mime_type": mime_type, "prepare_ms": best * 1000, "upload_ms": upload * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Glob of sample images (default: synthetic scans)")
+    parser.add_argument("--max-edge", type=int, default=1536)
+    parser.add_argument("--format", default="jpeg")
+    parser.add_argument("--quality", type=int, default=90)
+    parser.add_argument("--skip-bytes", type=int, default=256 * 1024)
+    parser.add_argument("--no-grayscale", action="store_true")
+    parser.add_argument("--mbps", type=float, default=20.0, help="Uplink bandwidth used to estimate upload time")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    samples = load_samples(args.images) if args.images else synthetic_samples()
+    original = PayloadOptions(enabled=False)
+    reduced = PayloadOptions(
+        max_edge=args.max_edge, image_format=args.format, quality=args.quality, skip_bytes=args.skip_bytes,
+        grayscale=not args.no_grayscale,
+    )
+
+    print(f"{'image':<24}{'orig KB':>9}{'sent KB':>9}{'saved':>8}{'prep ms':>9}"
+          f"{'upload ms':>11}{'net ms':>9}  type")
+    results = []
+    for name, data in samples:
+        before = measure(name, data, original, args.mbps, args.repeat)
+        after = measure(name, data, reduced, args.mbps, args.repeat)
+        # Time saved per call: shorter upload minus the extra preparation
+        net = (before["upload_ms"] + before["prepare_ms"]) - (after["upload_ms"] + after["prepare_ms"])
+        saved = 1 - after["bytes"] / before["bytes"]
+        results.append({"image": name, "original": before, "reduced": after, "net_saved_ms": net})
+        print(f"{name:<24}{before['bytes'] / 1024:>9.0f}{after['bytes'] / 1024:>9.0f}{saved:>8.0%}"
+              f"{after['prepare_ms']:>9.1f}{after['upload_ms']:>11.1f}{net:>9.1f}  {after['mime_type']}")
+
+    total_before = sum(r["original"]["bytes"] for r in results)
+    total_after = sum(r["reduced"]["bytes"] for r in results)
+    print(f"total: {total_before / 1024:.0f} KB -> {total_after / 1024:.0f} KB "
+          f"({1 - total_after / total_before:.0%} saved) at {args.mbps:g} Mbit/s")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
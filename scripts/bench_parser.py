@@ -0,0 +1,107 @@
+"""
+Check and time the single-pass LLM response parser against the original
+per-field regex parser.
+
+Every response in the corpus (scripts/data/llm_responses by default) is parsed
+by both implementations; any difference in output is reported and makes the
+script exit non-zero. Then each parser is timed over the whole corpus.
+
+Usage:
+    python -m scripts.bench_parser --iterations 2000
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+from app.utils.ResponseParser import EXPECTED_FIELDS, parse_medical_scan_result
+
+DEFAULT_CORPUS = Path(__file__).parent / "data" / "llm_responses"
+
+
+def legacy_parse_medical_scan_result(raw_result: str) -> dict:
+    """The original parser: one uncompiled regex search per field."""
+    result_dict = {}
+    alternatives = "|".join([re.escape(f) for f in EXPECTED_FIELDS])
+
+    for field in EXPECTED_FIELDS:
+        pattern = rf"\*?\*?\s*{re.escape(field)}\s*:?\*?\*?\s*(.*?)(?=\*?\*?\s*(?:{alternatives})\s*:|\Z)"
+        match = re.search(pattern, raw_result, re.DOTALL)
+        field_key = field.lower().replace(' ', '_')
+        if match:
+            value = match.group(1).strip()
+            value = re.sub(r'\*\*|\*|\n+', ' ', value)
+            value = re.sub(r'\s+', ' ', value).strip()
+            value = re.sub(r'\s*-+\s*$', '', value)
+            result_dict[field_key] = value
+        else:
+            result_dict[field_key] = ""
+
+    disclaimer_pattern = r"(?:Disclaimer|Important\s+Disclaimer)\s*:?\s*(.*?)(?=\Z)"
+    disclaimer_match = re.search(disclaimer_pattern, raw_result, re.DOTALL)
+    if disclaimer_match:
+        disclaimer_text = disclaimer_match.group(1).strip()
+        disclaimer_text = re.sub(r'\*\*|\*|\n+', ' ', disclaimer_text)
+        disclaimer_text = re.sub(r'\s+', ' ', disclaimer_text).strip()
+        disclaimer_text = re.sub(r'\s*-+\s*$', '', disclaimer_text)
+        result_dict["disclaimer"] = disclaimer_text
+
+    user_response_pattern = r"(?:To answer your question|In response to your question|Regarding your question).*?:(.*?)(?=\Z)"
+    user_response_match = re.search(user_response_pattern, raw_result, re.DOTALL)
+    if user_response_match:
+        response_text = user_response_match.group(1).strip()
+        response_text = re.sub(r'\s+', ' ', response_text).strip()
+        result_dict["llm_response"] = response_text
+
+    return result_dict
+
+
+def load_corpus(directory):
+    return {path.name: path.read_text(encoding="utf-8") for path in sorted(Path(directory).glob("*.txt"))}
+
+
+def check(corpus):
+    """Names of the responses on which the two parsers disagree."""
+    mismatches = []
+    for name, text in corpus.items():
+        if parse_medical_scan_result(text) != legacy_parse_medical_scan_result(text):
+            mismatches.append(name)
+    return mismatches
+
+
+def bench(parse, texts, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for text in texts:
+            parse(text)
+    return (time.perf_counter() - start) / (iterations * len(texts)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS), help="Directory of captured responses (*.txt)")
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        sys.exit(f"No responses found in {args.corpus}")
+
+    mismatches = check(corpus)
+    for name in mismatches:
+        print(f"MISMATCH {name}")
+    print(f"{len(corpus) - len(mismatches)}/{len(corpus)} responses parse identically")
+
+    texts = list(corpus.values())
+    legacy = bench(legacy_parse_medical_scan_result, texts, args.iterations)
+    single_pass = bench(parse_medical_scan_result, texts, args.iterations)
+    print(f"{'parser':<14}{'us/response':>14}")
+    print(f"{'legacy':<14}{legacy:>14.1f}")
+    print(f"{'single-pass':<14}{single_pass:>14.1f}")
+    print(f"speedup {legacy / single_pass:.2f}x")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Convert the Keras organ classifiers to TFLite and report accuracy drift.
+
+For every organ this writes float32, float16 and int8 variants to
+TFLITE_MODEL_DIR (see app/config.py). The int8 variant is calibrated on the
+images found in --calibration-dir. With --report, each variant is compared
+against the Keras baseline on --eval-dir and a JSON drift report is written.
+
+Usage:
+    python -m scripts.convert_models --calibration-dir samples/brain --organs Brain
+    python -m scripts.convert_models --calibration-dir samples/ --eval-dir samples/ --report drift.json
+"""
+import argparse
+import json
+import os
+import time
+import numpy as np
+import tensorflow as tf
+from app.config import TFLITE_MODEL_DIR
+from app.services.classification_service import preprocess_image_from_memory
+from app.services.model_registry import MODEL_SPECS
+from app.services.tflite_backend import TFLiteModel, tflite_model_path
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff")
+VARIANTS = ("float32", "float16", "int8")
+
+
+def list_images(directory, limit=None):
+    paths = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                paths.append(os.path.join(root, name))
+    paths.sort()
+    return paths[:limit] if limit else paths
+
+
+def load_inputs(paths, img_size):
+    for path in paths:
+        with open(path, "rb") as f:
+            yield path, preprocess_image_from_memory(f.read(), img_size)
+
+
+def convert(model, variant, calibration_paths, img_size):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if variant == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        if not calibration_paths:
+            raise ValueError("int8 quantization needs calibration images (--calibration-dir)")
+
+        def representative_dataset():
+            for _, img_array in load_inputs(calibration_paths, img_size):
+                yield [img_array]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    return converter.convert()
+
+
+def drift_report(keras_model, variant_models, eval_paths, img_size, class_labels):
+    """Compare predicted classes, confidence scores and latency of each variant against Keras."""
+    baseline = {}
+    keras_time = 0.0
+    for path, img_array in load_inputs(eval_paths, img_size):
+        start = time.perf_counter()
+        baseline[path] = keras_model.predict(img_array, verbose=0)[0]
+        keras_time += time.perf_counter() - start
+
+    report = {
+        "images": len(baseline),
+        "keras": {"mean_latency_ms": 1000.0 * keras_time / max(1, len(baseline))},
+    }
+    for variant, model in variant_models.items():
+        agree = 0
+        abs_diffs = []
+        elapsed = 0.0
+        disagreements = []
+        for path, img_array in load_inputs(eval_paths, img_size):
+            start = time.perf_counter()
+            scores = model.predict(img_array)[0]
+            elapsed += time.perf_counter() - start
+            expected = baseline[path]
+            if np.argmax(scores) == np.argmax(expected):
+                agree += 1
+            else:
+                disagreements.append({
+                    "image": path,
+                    "keras": class_labels[int(np.argmax(expected))],
+                    variant: class_labels[int(np.argmax(scores))],
+                })
+            abs_diffs.append(np.abs(scores - expected))
+        diffs = np.concatenate(abs_diffs) if abs_diffs else np.zeros(1)
+        report[variant] = {
+            "class_agreement": agree / max(1, len(baseline)),
+            "mean_abs_confidence_diff": float(diffs.mean()),
+            "max_abs_confidence_diff": float(diffs.max()),
+            "mean_latency_ms": 1000.0 * elapsed / max(1, len(baseline)),
+            "size_bytes": os.path.getsize(model.model_path),
+            "disagreements": disagreements,
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--organs", default=",".join(MODEL_SPECS), help="Comma separated organs to convert")
+    parser.add_argument("--variants", default=",".join(VARIANTS), help="Comma separated TFLite variants")
+    parser.add_argument("--output-dir", default=TFLITE_MODEL_DIR)
+    parser.add_argument("--calibration-dir", help="Sample images used to calibrate int8 quantization")
+    parser.add_argument("--calibration-limit", type=int, default=200)
+    parser.add_argument("--eval-dir", help="Images used for the drift report (defaults to --calibration-dir)")
+    parser.add_argument("--report", help="Write the accuracy-drift report to this JSON file")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    variants = [v for v in args.variants.split(",") if v]
+    calibration_paths = list_images(args.calibration_dir, args.calibration_limit) if args.calibration_dir else []
+    eval_dir = args.eval_dir or args.calibration_dir
+
+    reports = {}
+    for organ in [o.strip() for o in args.organs.split(",") if o.strip()]:
+        spec = MODEL_SPECS[organ]
+        print(f"[{organ}] loading {spec['path']}")
+        keras_model = tf.keras.models.load_model(spec["path"])
+
+        variant_models = {}
+        for variant in variants:
+            path = tflite_model_path(organ, variant, args.output_dir)
+            with open(path, "wb") as f:
+                f.write(convert(keras_model, variant, calibration_paths, spec["img_size"]))
+            print(f"[{organ}] wrote {path} ({os.path.getsize(path)} bytes)")
+            variant_models[variant] = TFLiteModel(path)
+
+        if args.report and eval_dir:
+            eval_paths = list_images(eval_dir)
+            reports[organ] = drift_report(keras_model, variant_models, eval_paths, spec["img_size"], spec["class_labels"])
+            for variant in variants:
+                r = reports[organ][variant]
+                print(f"[{organ}] {variant}: agreement={r['class_agreement']:.3f} "
+                      f"mean|d|={r['mean_abs_confidence_diff']:.4f} latency={r['mean_latency_ms']:.1f}ms")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"Drift report written to {args.report}")
+
+
+if __name__ == "__main__":
+    main()
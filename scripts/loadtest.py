@@ -0,0 +1,217 @@
+"""
+Offline end-to-end load test.
+
+Starts app.main:app under uvicorn with the fake LLM backend (canned responses,
+configurable latency) and tiny stub Keras models (see scripts.make_stub_models),
+then drives /api/analyze, /api/predict/{organ_type}, /process-image and
+/api/chat with synthetic scans at each requested concurrency and image size.
+Reports p50/p95/p99 latency, throughput and the server's resident memory.
+
+Every request uses a distinct scan unless --distinct-images is set, so by
+default the numbers are for cold caches.
+
+Usage:
+    python -m scripts.loadtest --concurrency 1,8,32 --sizes 256,512 --requests 200
+    python -m scripts.loadtest --url http://localhost:8000 --endpoints predict
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import httpx
+from scripts.bench_executor import synthetic_scans
+
+ENDPOINTS = ["analyze", "predict", "process-image", "chat"]
+# /process-image answers 404 when no tumor region is found; that is a valid result
+EXPECTED_STATUS = {"process-image": {200, 404}}
+
+
+def build_request(endpoint, scan, organ):
+    """Method, path and multipart payload for one request against endpoint."""
+    file = ("scan.png", scan, "image/png")
+    if endpoint == "analyze":
+        return "/api/analyze", {"files": {"file": file}}
+    if endpoint == "predict":
+        return f"/api/predict/{organ}", {"files": {"file": file}}
+    if endpoint == "process-image":
+        return "/process-image", {"files": {"file": file}}
+    if endpoint == "chat":
+        return "/api/chat", {"data": {"message": "Is this tumor likely to be benign?"}, "files": [("images", file)]}
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+def percentile(sorted_values, q):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def read_rss_mb(pid):
+    """Current and peak resident set size of pid in MB (Linux only)."""
+    if pid is None:
+        return None, None
+    values = {}
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, value = line.split(":", 1)
+                    values[name] = int(value.split()[0]) / 1024
+    except OSError:
+        return None, None
+    return values.get("VmRSS"), values.get("VmHWM")
+
+
+async def run_load(client, endpoint, scans, concurrency, organ):
+    """Send one request per scan with at most concurrency in flight."""
+    latencies, statuses = [], {}
+    next_index = iter(range(len(scans)))
+
+    async def worker():
+        for i in next_index:
+            path, payload = build_request(endpoint, scans[i], organ)
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, **payload)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    expected = EXPECTED_STATUS.get(endpoint, {200})
+    return {
+        "requests": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if status not in expected),
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+    }
+
+
+def ensure_stub_models(models_dir):
+    """Environment overrides for the stub models, building them on first use."""
+    output = subprocess.run(
+        [sys.executable, "-m", "scripts.make_stub_models", "--out-dir", models_dir],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    return dict(line.split("=", 1) for line in output.splitlines() if "=" in line)
+
+
+def start_server(port, env_overrides, timeout):
+    """Run uvicorn in a subprocess and wait until its models are loaded."""
+    env = {**os.environ, **env_overrides}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            if httpx.get(url + "/health/ready", timeout=1).status_code == 200:
+                return server, url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"Server did not become ready within {timeout}s")
+
+
+async def run_suite(url, pid, args):
+    results = []
+    endpoints = [e for e in args.endpoints.split(",") if e]
+    concurrencies = [int(c) for c in args.concurrency.split(",") if c]
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    seed = 0
+
+    limits = httpx.Limits(max_connections=max(concurrencies))
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        for size in sizes:
+            for concurrency in concurrencies:
+                for endpoint in endpoints:
+                    # Fresh scans for every run so earlier runs don't warm the caches
+                    distinct = args.distinct_images or args.requests
+                    scans = synthetic_scans(distinct + concurrency, size, seed=seed)
+                    seed += 1
+                    await run_load(client, endpoint, scans[distinct:], concurrency, args.organ)  # warm-up
+                    scans = [scans[i % distinct] for i in range(args.requests)]
+
+                    result = await run_load(client, endpoint, scans, concurrency, args.organ)
+                    result["rss_mb"], result["peak_rss_mb"] = read_rss_mb(pid)
+                    result.update(endpoint=endpoint, concurrency=concurrency, size=size)
+                    results.append(result)
+                    print_row(result)
+    return results
+
+
+def print_header():
+    print(f"{'endpoint':<15}{'size':>6}{'conc':>6}{'reqs':>6}{'errs':>6}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'RSS MB':>9}")
+
+
+def print_row(r):
+    rss = f"{r['rss_mb']:.0f}" if r["rss_mb"] is not None else "-"
+    print(f"{r['endpoint']:<15}{r['size']:>6}{r['concurrency']:>6}{r['requests']:>6}{r['errors']:>6}"
+          f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['throughput_rps']:>9.1f}{rss:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS))
+    parser.add_argument("--concurrency", default="8", help="Comma separated in-flight request counts")
+    parser.add_argument("--sizes", default="512", help="Comma separated edge lengths of the synthetic scans")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint and setting")
+    parser.add_argument("--distinct-images", type=int, default=0,
+                        help="Cycle through this many scans (cache hits); 0 means one scan per request")
+    parser.add_argument("--organ", default="Brain")
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--llm-response-file", help="Canned LLM response (default: built-in sample)")
+    parser.add_argument("--models-dir", default="bench_models", help="Where the stub models are written")
+    parser.add_argument("--url", help="Drive an already running server instead of starting one")
+    parser.add_argument("--pid", type=int, help="Process id of the --url server, for RSS")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request and start-up timeout in seconds")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    url, pid = args.url, args.pid
+    if url is None:
+        env = ensure_stub_models(args.models_dir)
+        env.update(LLM_BACKEND="fake", FAKE_LLM_LATENCY_MS=str(args.llm_latency_ms))
+        if args.llm_response_file:
+            env["FAKE_LLM_RESPONSE_FILE"] = args.llm_response_file
+        server, url = start_server(args.port, env, args.timeout)
+        pid = server.pid
+
+    try:
+        print_header()
+        results = asyncio.run(run_suite(url, pid, args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
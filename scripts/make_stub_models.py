@@ -0,0 +1,64 @@
+"""
+Write tiny randomly initialised Keras classifiers with the same input shapes
+and class counts as the real organ models.
+
+They let the API (and the load test) run without the production .h5 files.
+Predictions are meaningless; only the shapes and the serving path are real.
+
+Usage:
+    python -m scripts.make_stub_models --out-dir bench_models
+    BRAIN_MODEL_PATH=bench_models/brain_model.h5 ... uvicorn app.main:app
+"""
+import argparse
+import os
+import tensorflow as tf
+from app.services.model_registry import MODEL_SPECS
+
+# Environment variable that points the app at each organ's model
+MODEL_PATH_ENV = {
+    "Brain": "BRAIN_MODEL_PATH",
+    "Lung": "LUNG_MODEL_PATH",
+    "Breast": "BREAST_MODEL_PATH",
+}
+
+
+def build_stub_model(img_size, num_classes):
+    """A strided conv, global pooling and a softmax head: milliseconds per batch."""
+    inputs = tf.keras.Input(shape=(*img_size, 3))
+    x = tf.keras.layers.Conv2D(8, 3, strides=4, activation="relu")(inputs)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    outputs = tf.keras.layers.Dense(num_classes, activation="softmax")(x)
+    return tf.keras.Model(inputs, outputs)
+
+
+def stub_model_env(out_dir):
+    """Environment overrides pointing every organ at its stub model in out_dir."""
+    return {
+        MODEL_PATH_ENV[organ]: os.path.join(out_dir, os.path.basename(spec["path"]))
+        for organ, spec in MODEL_SPECS.items()
+    }
+
+
+def write_stub_models(out_dir, seed=0):
+    """Build and save one stub model per organ; returns the environment overrides."""
+    os.makedirs(out_dir, exist_ok=True)
+    tf.keras.utils.set_random_seed(seed)
+    env = stub_model_env(out_dir)
+    for organ, spec in MODEL_SPECS.items():
+        model = build_stub_model(spec["img_size"], len(spec["class_labels"]))
+        model.save(env[MODEL_PATH_ENV[organ]])
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out-dir", default="bench_models")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, path in write_stub_models(args.out_dir, args.seed).items():
+        print(f"{name}={path}")
+
+
+if __name__ == "__main__":
+    main()
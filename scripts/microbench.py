@@ -0,0 +1,107 @@
+"""
+Per-function microbenchmarks for the hot paths of the service.
+
+Times process_mri_image, preprocess_image_from_memory,
+parse_medical_scan_result and ImageCache on synthetic scans and the sample LLM
+responses. Save a run with --json and compare a later run against it with
+--compare to see the change between commits.
+
+Usage:
+    python -m scripts.microbench --json before.json
+    python -m scripts.microbench --compare before.json
+"""
+import argparse
+import json
+import statistics
+import timeit
+from scripts.bench_executor import synthetic_scans
+from scripts.bench_parser import DEFAULT_CORPUS, load_corpus
+
+
+def cache_benchmarks():
+    from app.utils.cache import ImageCache
+
+    cache = ImageCache(max_size=10000)
+    scan = synthetic_scans(1, 256)[0]
+    digest = ImageCache.digest(scan)
+    result = {"predicted_class": "Glioma", "confidence_scores": {"Glioma": 0.9, "Normal": 0.1}}
+    cache.set_stage("predict", digest, "Brain", result=result)
+    counter = iter(range(10 ** 9))
+    return {
+        "cache.digest": lambda: ImageCache.digest(scan),
+        "cache.get_stage.hit": lambda: cache.get_stage("predict", digest, "Brain"),
+        "cache.get_stage.miss": lambda: cache.get_stage("predict", digest, "Lung"),
+        "cache.set_stage": lambda: cache.set_stage("predict", str(next(counter)), "Brain", result=result),
+    }
+
+
+def image_benchmarks(sizes):
+    from app.services.classification_service import preprocess_image_from_memory
+    from app.utils.RegionOfIntrest import process_mri_image
+
+    benchmarks = {}
+    for size in sizes:
+        scan = synthetic_scans(1, size)[0]
+        benchmarks[f"process_mri_image.{size}"] = lambda scan=scan: process_mri_image(scan)
+        benchmarks[f"preprocess_image_from_memory.{size}"] = \
+            lambda scan=scan: preprocess_image_from_memory(scan, (299, 299))
+    return benchmarks
+
+
+def parser_benchmarks():
+    from app.utils.ResponseParser import parse_medical_scan_result
+
+    texts = list(load_corpus(DEFAULT_CORPUS).values())
+
+    def parse_corpus():
+        for text in texts:
+            parse_medical_scan_result(text)
+
+    return {f"parse_medical_scan_result.x{len(texts)}": parse_corpus}
+
+
+def measure(func, repeat):
+    """Median microseconds per call over repeat runs of an auto-sized loop."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return statistics.median(t / number for t in timer.repeat(repeat, number)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="256,512", help="Comma separated edge lengths of the synthetic scans")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Results file of an earlier run to compare against")
+    args = parser.parse_args()
+
+    benchmarks = {}
+    benchmarks.update(image_benchmarks([int(s) for s in args.sizes.split(",") if s]))
+    benchmarks.update(parser_benchmarks())
+    benchmarks.update(cache_benchmarks())
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    print(f"{'benchmark':<42}{'us/call':>12}{'baseline':>12}{'change':>9}")
+    for name, func in benchmarks.items():
+        if args.filter not in name:
+            continue
+        results[name] = measure(func, args.repeat)
+        line = f"{name:<42}{results[name]:>12.1f}"
+        if name in baseline:
+            change = (results[name] / baseline[name] - 1) * 100
+            line += f"{baseline[name]:>12.1f}{change:>+8.1f}%"
+        print(line)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
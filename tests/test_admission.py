@@ -0,0 +1,235 @@
+import asyncio
+from random import Random
+import pytest
+from fastapi.responses import JSONResponse
+from app.services.admission import (
+    PRIORITY_CLASSES, AdmissionController, AdmissionLimiter, AdmissionMiddleware, Overloaded,
+)
+
+
+@pytest.mark.parametrize("method, path, endpoint", [
+    ("POST", "/api/predict/Brain", "predict"),
+    ("POST", "/api/predict/Brain/", "predict"),
+    ("POST", "/api/predict/Brain/batch", "predict-bulk"),
+    ("POST", "/api/predict/Lung/volume", "predict-bulk"),
+    ("GET", "/api/predict/stats", None),
+    ("POST", "/api/chat", "chat"),
+    ("POST", "/api/analyze", "analyze"),
+    ("POST", "/process-image", "process-image"),
+    ("POST", "/api/jobs/chat", None),
+    ("GET", "/health/ready", None),
+    ("POST", "/api/chatter", None),
+])
+def test_endpoint_routes(method, path, endpoint):
+    assert AdmissionController.endpoint_for(path, method) == endpoint
+
+
+def _limiter(max_concurrency=1, max_queue=10, timeout=5.0):
+    return AdmissionLimiter("test", max_concurrency, max_queue, timeout)
+
+
+def test_queue_full_is_rejected_with_429():
+    async def run():
+        limiter = _limiter(max_queue=1)
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as rejected:
+            await limiter.acquire()
+        limiter.release()
+        await waiter
+        limiter.release()
+        return rejected.value, limiter
+
+    error, limiter = asyncio.run(run())
+    assert (error.status_code, error.reason) == (429, "queue_full")
+    assert error.retry_after >= 1
+    assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+
+def test_timeout_is_rejected_with_503():
+    async def run():
+        limiter = _limiter(timeout=0.05)
+        await limiter.acquire()
+        with pytest.raises(Overloaded) as rejected:
+            await limiter.acquire()
+        queued = limiter.queued
+        limiter.release()
+        return rejected.value, queued, limiter
+
+    error, queued, limiter = asyncio.run(run())
+    assert (error.status_code, error.reason) == (503, "timeout")
+    assert queued == 0
+    assert limiter.in_flight == 0
+    assert limiter.rejected == {"queue_full": 0, "timeout": 1}
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def run():
+        limiter = _limiter()
+        await limiter.acquire()
+        served = []
+
+        async def wait(name, cls):
+            await limiter.acquire(PRIORITY_CLASSES[cls])
+            served.append(name)
+
+        tasks = []
+        for name, cls in [("batch", "batch"), ("standard", "standard"), ("first", "interactive"),
+                          ("second", "interactive"), ("standard2", "standard")]:
+            tasks.append(asyncio.create_task(wait(name, cls)))
+            await asyncio.sleep(0)
+        for _ in tasks:
+            limiter.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        limiter.release()
+        return served, limiter
+
+    served, limiter = asyncio.run(run())
+    assert served == ["first", "second", "standard", "standard2", "batch"]
+    assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+
+async def _wait_for_cancellation_wins(future, timeout):
+    # asyncio.wait_for of Python 3.12+: a cancellation is raised even if the future already has its result
+    async with asyncio.timeout(timeout):
+        return await asyncio.shield(future)
+
+
+@pytest.mark.parametrize("strict_wait_for", [False, True])
+def test_slot_handed_to_a_waiter_cancelled_at_the_same_time_is_not_leaked(monkeypatch, strict_wait_for):
+    if strict_wait_for:
+        monkeypatch.setattr(asyncio, "wait_for", _wait_for_cancellation_wins)
+
+    async def run():
+        limiter = _limiter()
+        await limiter.acquire()
+        waiter = asyncio.create_task(limiter.acquire())
+        second = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0)
+        # The slot goes to the first waiter, which is cancelled before it resumes
+        limiter.release()
+        waiter.cancel()
+        try:
+            await waiter
+            # Some Python versions let the acquisition win over the cancellation
+            limiter.release()
+        except asyncio.CancelledError:
+            pass
+        # Either way the slot ends up with the next waiter, not lost
+        async with asyncio.timeout(1):
+            await second
+        assert limiter.in_flight == 1
+        limiter.release()
+        return limiter
+
+    limiter = asyncio.run(run())
+    assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+
+@pytest.mark.parametrize("strict_wait_for", [False, True])
+def test_timeouts_and_cancellations_racing_hand_offs_keep_counts_exact(monkeypatch, strict_wait_for):
+    if strict_wait_for:
+        monkeypatch.setattr(asyncio, "wait_for", _wait_for_cancellation_wins)
+
+    async def run():
+        limiter = _limiter(max_concurrency=2, max_queue=100, timeout=0.004)
+        random = Random(7)
+        peak = 0
+
+        async def request():
+            nonlocal peak
+            try:
+                async with limiter.slot(random.randrange(3)):
+                    peak = max(peak, limiter.in_flight)
+                    await asyncio.sleep(random.choice([0, 0.001, 0.003]))
+            except Overloaded:
+                pass
+
+        tasks = []
+        for _ in range(400):
+            tasks.append(asyncio.create_task(request()))
+            if random.random() < 0.3:
+                random.choice(tasks).cancel()
+            await asyncio.sleep(random.choice([0, 0, 0.001]))
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return peak, limiter
+
+    peak, limiter = asyncio.run(run())
+    assert peak <= 2
+    assert (limiter.in_flight, limiter.queued) == (0, 0)
+
+
+def _controller(timeout=5.0, queue=0):
+    return AdmissionController({"chat": 1}, {"chat": queue}, timeout=timeout)
+
+
+def _scope(path="/api/chat"):
+    return {"type": "http", "method": "POST", "path": path, "headers": []}
+
+
+async def _call(middleware, scope):
+    messages = []
+    body_read = False
+
+    async def receive():
+        nonlocal body_read
+        body_read = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages, body_read
+
+
+def test_middleware_rejects_before_reading_the_body():
+    async def run():
+        controller = _controller()
+        release = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await receive()
+            await release.wait()
+            await JSONResponse({"ok": True})(scope, receive, send)
+
+        middleware = AdmissionMiddleware(app, controller)
+        holder = asyncio.create_task(_call(middleware, _scope()))
+        await asyncio.sleep(0.01)
+        rejected, body_read = await _call(middleware, _scope())
+        release.set()
+        await holder
+        return rejected, body_read, controller
+
+    rejected, body_read, controller = asyncio.run(run())
+    assert rejected[0]["status"] == 429
+    assert (b"retry-after", b"1") in rejected[0]["headers"]
+    assert not body_read
+    assert controller.endpoints["chat"].in_flight == 0
+
+
+def test_middleware_answers_503_with_retry_after_on_timeout():
+    async def run():
+        controller = _controller(timeout=0.05, queue=1)
+        release = asyncio.Event()
+
+        async def app(scope, receive, send):
+            await release.wait()
+            await JSONResponse({"ok": True})(scope, receive, send)
+
+        middleware = AdmissionMiddleware(app, controller)
+        holder = asyncio.create_task(_call(middleware, _scope()))
+        await asyncio.sleep(0.01)
+        timed_out, _ = await _call(middleware, _scope())
+        release.set()
+        await holder
+        # The slot is free again
+        other, _ = await _call(middleware, _scope())
+        return timed_out, other
+
+    timed_out, other = asyncio.run(run())
+    assert timed_out[0]["status"] == 503
+    assert any(name == b"retry-after" for name, _ in timed_out[0]["headers"])
+    assert other[0]["status"] == 200
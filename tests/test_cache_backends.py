@@ -0,0 +1,97 @@
+import asyncio
+import time
+import pytest
+from app.utils.cache import ImageCache
+from app.utils.cache_backends import MemoryBackend, RedisBackend, SQLiteBackend
+
+RESULT = {"predicted_class": "Glioma", "confidence_scores": [0.9, 0.1], "roi": b"\x89PNG" * 64}
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend(max_entries=100)
+    if request.param == "sqlite":
+        return SQLiteBackend(str(tmp_path / "cache.sqlite3"), max_entries=100)
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisBackend(client=fakeredis.FakeRedis(), prefix="test:")
+
+
+def test_round_trip(backend):
+    backend.set("a", RESULT, ttl=60)
+    assert backend.get("a") == RESULT
+    assert backend.get("missing") is None
+    backend.delete("a")
+    assert backend.get("a") is None
+
+
+def test_expiry(backend):
+    backend.set("a", RESULT, ttl=0.05)
+    time.sleep(0.1)
+    assert backend.get("a") is None
+
+
+def test_clear(backend):
+    for i in range(5):
+        backend.set(f"k{i}", RESULT, ttl=60)
+    backend.clear()
+    assert all(backend.get(f"k{i}") is None for i in range(5))
+
+
+def test_redis_keys_are_prefixed():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    client.set("other:key", b"kept")
+    backend = RedisBackend(client=client, prefix="scansage:")
+    backend.set("a", RESULT, ttl=60)
+    assert client.exists("scansage:a")
+    assert 0 < client.pttl("scansage:a") <= 60000
+    backend.clear()
+    assert client.get("other:key") == b"kept"
+
+
+def test_sqlite_evicts_least_recently_used(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"), max_entries=20)
+    for i in range(20):
+        backend.set(f"k{i}", i, ttl=60)
+    time.sleep(0.01)
+    backend.get("k0")
+    backend.set("k20", 20, ttl=60)
+    stats = backend.stats()
+    # One batch down to 90% of the limit, keeping the most recently used rows
+    assert stats["entries"] == 18
+    assert stats["evictions"] == 3
+    assert backend.get("k0") == 0 and backend.get("k20") == 20
+    assert backend.get("k1") is None
+
+
+def test_sqlite_byte_limit(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite3"), max_entries=1000, max_bytes=10000)
+    for i in range(50):
+        backend.set(f"k{i}", b"x" * 500, ttl=60)
+    assert backend.stats()["bytes"] <= 10000
+    assert backend.get("k49") is not None
+
+
+def test_sqlite_notices_rows_from_other_workers(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first, second = SQLiteBackend(path, max_entries=300), SQLiteBackend(path, max_entries=300)
+    first.RECOUNT_EVERY = second.RECOUNT_EVERY = 16
+    for i in range(400):
+        (first if i % 2 else second).set(f"k{i}", i, ttl=60)
+    # Each worker only counts its own inserts, but recounts the table every 16 of them
+    assert first.stats()["entries"] <= 300 + 2 * 16
+
+
+@pytest.mark.parametrize("blocking", [False, True])
+def test_async_stage_helpers(tmp_path, blocking):
+    backend = SQLiteBackend(str(tmp_path / "cache.sqlite3")) if blocking else MemoryBackend()
+    cache = ImageCache(backend=backend)
+
+    async def run():
+        assert await cache.get_stage_async("predict", "d", "Brain") is None
+        await cache.set_stage_async("predict", "d", "Brain", result=RESULT)
+        return await cache.get_stage_async("predict", "d", "Brain")
+
+    assert asyncio.run(run()) == RESULT
+    assert cache.stats()["stages"]["predict"] == {"hits": 1, "misses": 1, "hit_ratio": 0.5}
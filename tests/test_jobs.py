@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from app.services.job_store import FAILED, MemoryJobStore, SQLiteJobStore
+from app.services.jobs import JobManager
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return MemoryJobStore() if request.param == "memory" else SQLiteJobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def test_concurrent_identical_submissions_share_one_job(store):
+    async def run():
+        manager = JobManager(store, workers=1, max_queue=16)
+        gate = asyncio.Event()
+
+        async def runner(payload):
+            await gate.wait()
+            return {"ok": True}
+
+        manager.register("chat", runner)
+        await manager.start()
+        try:
+            results = await asyncio.gather(*(manager.submit("chat", ["d"], "hi", {"n": n}) for n in range(5)))
+        finally:
+            gate.set()
+            await manager.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert len({job["id"] for job, _ in results}) == 1
+    assert sorted(deduplicated for _, deduplicated in results) == [False] + [True] * 4
+
+
+def test_store_add_returns_live_job_with_same_key(store):
+    def job(job_id, **fields):
+        return {
+            "id": job_id, "kind": "chat", "dedup_key": "k", "status": "queued", "payload": None, "result": None,
+            "error": None, "owner": None, "created_at": 1.0, "started_at": None, "finished_at": None,
+            "expires_at": None, **fields,
+        }
+
+    assert store.add(job("a")) is None
+    assert store.add(job("b"))["id"] == "a"
+    # A failed job does not hold its key
+    store.finish("a", FAILED, error="boom")
+    assert store.add(job("c")) is None
+    # Nor does an expired result
+    store.finish("c", "succeeded", result={}, ttl=-1)
+    assert store.add(job("d")) is None
+    assert store.find("k")["id"] == "d"
+
+
+@pytest.mark.parametrize("stale_owner", ["previous-boot", "legacy"])
+def test_start_recovers_job_left_running_by_earlier_process_with_same_pid(tmp_path, stale_owner):
+    path = str(tmp_path / "jobs.sqlite")
+    crashed = JobManager(SQLiteJobStore(path))
+    owner = crashed.owner if stale_owner == "previous-boot" else crashed.owner.rsplit(":", 1)[0]
+    job = {
+        "id": "a", "kind": "chat", "dedup_key": "k", "status": "queued", "payload": {"n": 1}, "result": None,
+        "error": None, "owner": None, "created_at": 1.0, "started_at": None, "finished_at": None, "expires_at": None,
+    }
+    crashed.store.add(job)
+    assert crashed.store.claim("a", owner)["status"] == "running"
+
+    async def run():
+        # The restarted server: same host and pid, new manager
+        manager = JobManager(SQLiteJobStore(path), workers=1)
+
+        async def runner(payload):
+            return payload
+
+        manager.register("chat", runner)
+        await manager.start()
+        try:
+            return await manager.get("a", wait=5)
+        finally:
+            await manager.stop()
+
+    recovered = asyncio.run(run())
+    assert recovered["status"] == "succeeded"
+    assert recovered["result"] == {"n": 1}
+
+
+def test_running_job_of_live_manager_is_not_taken():
+    manager = JobManager(MemoryJobStore())
+    assert not manager._owner_gone(manager.owner)
+    assert JobManager(MemoryJobStore())._owner_gone(manager.owner)
@@ -0,0 +1,70 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+from app.utils.image_encoding import EncodingOptions
+from app.utils.responses import negotiate_response_format, negotiate_stream_type
+
+BROWSER = "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8"
+
+
+def _request(accept=None):
+    headers = [(b"accept", accept.encode())] if accept is not None else []
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": headers})
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, "json"),
+    ("", "json"),
+    ("*/*", "json"),
+    ("application/json", "json"),
+    (BROWSER, "json"),
+    ("image/webp,*/*;q=0.8", "image"),
+    ("image/png", "image"),
+    ("image/*", "image"),
+    ("image/png, application/json", "json"),
+    ("image/png, application/json;q=0.5", "image"),
+    ("application/json;q=0.9, image/png", "image"),
+    ("image/png;q=0.5, application/*", "json"),
+    ("image/png;q=0", "json"),
+    ("multipart/mixed", "multipart"),
+    ("multipart/mixed, image/png", "multipart"),
+    ("multipart/mixed;q=0.5, application/json", "json"),
+    ("image/png;q=oops", "json"),
+])
+def test_accept_negotiation(accept, expected):
+    assert negotiate_response_format(_request(accept)) == expected
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, None),
+    ("*/*", None),
+    ("text/*", None),
+    ("application/json", None),
+    ("application/x-ndjson", "application/x-ndjson"),
+    ("text/event-stream", "text/event-stream"),
+    ("application/json, text/event-stream;q=0", None),
+    ("text/event-stream, application/json", None),
+    ("text/event-stream, application/json;q=0.5", "text/event-stream"),
+    ("text/event-stream;q=0.5, application/x-ndjson;q=0.8, */*;q=0.1", "application/x-ndjson"),
+    ("text/event-stream;q=0.5, application/*", None),
+])
+def test_stream_negotiation(accept, expected):
+    stream_types = ("application/x-ndjson", "text/event-stream")
+    assert negotiate_stream_type(_request(accept), stream_types) == expected
+
+
+def test_explicit_format_wins():
+    assert negotiate_response_format(_request(BROWSER), "image") == "image"
+    with pytest.raises(HTTPException):
+        negotiate_response_format(_request(), "xml")
+
+
+@pytest.mark.parametrize("image_format, quality, valid", [
+    ("jpeg", 100, True), ("jpeg", 101, False), ("png", 101, False), ("webp", 101, True), ("webp", 0, False),
+])
+def test_quality_range(image_format, quality, valid):
+    if valid:
+        EncodingOptions(image_format, quality)
+    else:
+        with pytest.raises(ValueError):
+            EncodingOptions(image_format, quality)
@@ -0,0 +1,93 @@
+import base64
+import cv2
+import numpy as np
+import pytest
+from app.utils.RegionOfIntrest import process_mri_image, tumor_mask, TUMOR_LUT
+from app.utils.decoded_image import DecodedImage
+
+
+def reference_process_mri_image(image_data):
+    """The original JET -> HSV -> inRange pipeline that the lookup table replaced."""
+    mri_image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    jet_colored = cv2.applyColorMap(mri_image, cv2.COLORMAP_JET)
+    hsv_image = cv2.cvtColor(jet_colored, cv2.COLOR_BGR2HSV)
+
+    mask_orange = cv2.inRange(hsv_image, np.array([10, 100, 100]), np.array([25, 255, 255]))
+    mask_red1 = cv2.inRange(hsv_image, np.array([0, 100, 100]), np.array([10, 255, 255]))
+    mask_red2 = cv2.inRange(hsv_image, np.array([170, 100, 100]), np.array([180, 255, 255]))
+    combined_mask = cv2.bitwise_or(mask_orange, cv2.bitwise_or(mask_red1, mask_red2))
+
+    kernel = np.ones((5, 5), np.uint8)
+    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_CLOSE, kernel)
+    combined_mask = cv2.morphologyEx(combined_mask, cv2.MORPH_OPEN, kernel)
+
+    contours, _ = cv2.findContours(combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    max_area, max_contour = 0, None
+    for contour in contours:
+        area = cv2.contourArea(contour)
+        if area > max_area:
+            max_area, max_contour = area, contour
+
+    roi_base64 = None
+    if max_contour is not None and max_area > 50:
+        x, y, w, h = cv2.boundingRect(max_contour)
+        roi_base64 = base64.b64encode(cv2.imencode(".png", mri_image[y:y + h, x:x + w])[1]).decode("utf-8")
+    heatmap_base64 = base64.b64encode(cv2.imencode(".png", jet_colored)[1]).decode("utf-8")
+    return roi_base64, heatmap_base64
+
+
+def _scan(seed, size, channels):
+    # Blurred noise plus a few bright blobs, so there are regions of several sizes
+    rng = np.random.default_rng(seed)
+    image = cv2.GaussianBlur((rng.random((size, size)) * 255).astype(np.uint8), (0, 0), size / 30.0)
+    image = cv2.normalize(image, None, 0, 255, cv2.NORM_MINMAX)
+    for _ in range(rng.integers(0, 4)):
+        center = tuple(int(v) for v in rng.integers(0, size, 2))
+        cv2.circle(image, center, int(rng.integers(3, size // 6)), int(rng.integers(150, 256)), -1)
+    if channels == 3:
+        tint = rng.integers(-30, 30, 3)
+        image = np.clip(cv2.cvtColor(image, cv2.COLOR_GRAY2BGR).astype(int) + tint, 0, 255).astype(np.uint8)
+    return image
+
+
+def _decode(png_base64, flags=cv2.IMREAD_UNCHANGED):
+    return cv2.imdecode(np.frombuffer(base64.b64decode(png_base64), np.uint8), flags)
+
+
+def test_lut_matches_colour_pipeline_for_every_level():
+    levels = np.arange(256, dtype=np.uint8).reshape(16, 16)
+    hsv = cv2.cvtColor(cv2.applyColorMap(levels, cv2.COLORMAP_JET), cv2.COLOR_BGR2HSV)
+    expected = cv2.bitwise_or(
+        cv2.inRange(hsv, np.array([10, 100, 100]), np.array([25, 255, 255])),
+        cv2.bitwise_or(cv2.inRange(hsv, np.array([0, 100, 100]), np.array([10, 255, 255])),
+                       cv2.inRange(hsv, np.array([170, 100, 100]), np.array([180, 255, 255]))),
+    )
+    assert np.array_equal(TUMOR_LUT[levels], expected)
+
+
+@pytest.mark.parametrize("channels", [1, 3])
+@pytest.mark.parametrize("extension", [".png", ".jpg"])
+@pytest.mark.parametrize("seed", range(10))
+def test_outputs_are_pixel_identical_to_reference(seed, extension, channels):
+    data = cv2.imencode(extension, _scan(seed, 96 + 32 * (seed % 4), channels))[1].tobytes()
+    roi, heatmap = reference_process_mri_image(data)
+
+    for image_data in (data, DecodedImage(data, "scan" + extension)):
+        new_roi, new_heatmap = process_mri_image(image_data)
+        assert np.array_equal(_decode(new_heatmap), _decode(heatmap))
+        assert (new_roi is None) == (roi is None)
+        if roi is not None:
+            assert np.array_equal(_decode(new_roi), _decode(roi))
+
+
+def test_tumor_mask_shape_and_values():
+    mask = tumor_mask(_scan(1, 128, 1))
+    assert mask.shape == (128, 128) and mask.dtype == np.uint8
+    assert set(np.unique(mask)) <= {0, 255}
+
+
+def test_no_region_matches_reference():
+    data = cv2.imencode(".png", np.full((64, 64), 20, np.uint8))[1].tobytes()
+    roi, heatmap = process_mri_image(data)
+    assert roi is None and reference_process_mri_image(data)[0] is None
+    assert np.array_equal(_decode(heatmap), _decode(reference_process_mri_image(data)[1]))
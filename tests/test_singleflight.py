@@ -0,0 +1,117 @@
+import asyncio
+import pytest
+from app.utils.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_run():
+    async def run():
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("k", work) for _ in range(5)))
+        return results, calls, flights
+
+    results, calls, flights = asyncio.run(run())
+    assert len(calls) == 1
+    assert [result for result, _ in results] == ["result"] * 5
+    assert sorted(shared for _, shared in results) == [False] + [True] * 4
+    assert flights.in_flight == 0
+
+
+def test_exception_reaches_every_caller_and_is_not_cached():
+    async def run():
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            if len(calls) == 1:
+                raise RuntimeError("boom")
+            return "ok"
+
+        failures = await asyncio.gather(*(flights.do("k", work) for _ in range(3)), return_exceptions=True)
+        # The failure is not remembered: the next call runs again
+        retried = await flights.do("k", work)
+        return failures, retried, calls
+
+    failures, retried, calls = asyncio.run(run())
+    assert all(isinstance(error, RuntimeError) for error in failures)
+    assert retried == ("ok", False)
+    assert len(calls) == 2
+
+
+def test_cancelled_follower_does_not_cancel_the_run():
+    async def run():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        leader = asyncio.create_task(flights.do("k", work))
+        follower = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert asyncio.run(run()) == ("result", False)
+
+
+def test_cancelled_sole_caller_cancels_the_run():
+    async def run():
+        flights = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.wait_for(cancelled.wait(), 1)
+        return flights.in_flight
+
+    assert asyncio.run(run()) == 0
+
+
+def test_caller_arriving_while_cancelled_run_cleans_up_starts_afresh():
+    async def run():
+        flights = SingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            try:
+                await asyncio.sleep(10 if len(runs) == 1 else 0)
+            except asyncio.CancelledError:
+                # Cleanup that awaits, keeping the cancelled task alive for a while
+                await asyncio.sleep(0.05)
+                raise
+            return "fresh"
+
+        first = asyncio.create_task(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0)
+        second = await flights.do("k", work)
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return second, runs
+
+    second, runs = asyncio.run(run())
+    assert second == ("fresh", False)
+    assert len(runs) == 2
@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import io
+import re
+import tempfile
+import httpx
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from app.utils.uploads import UploadLimitMiddleware, UploadTooLarge, _PartCounter, ingest
+
+
+def _multipart(*parts, boundary=b"xyz"):
+    body = b""
+    for name, data in parts:
+        body += b"--" + boundary + b'\r\nContent-Disposition: form-data; name="file"; filename="' + name + b'"\r\n\r\n'
+        body += data + b"\r\n"
+    return body + b"--" + boundary + b"--\r\n"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 4096])
+def test_part_counter_any_chunking(chunk_size):
+    body = _multipart((b"a.png", b"A" * 1000), (b"b.png", b"B" * 300))
+    counter = _PartCounter(b"xyz")
+    largest = 0
+    for start in range(0, len(body), chunk_size):
+        largest = max(largest, counter.feed(body[start:start + chunk_size]))
+    # The first part plus its headers; never the whole body
+    assert 1000 < largest < 1100
+    # Only the closing delimiter's tail is left in the last part
+    assert counter.size <= 4
+
+
+def test_ingest_hashes_in_one_pass():
+    data = bytes(range(256)) * 20000
+    with tempfile.SpooledTemporaryFile(max_size=1024) as spool:
+        spool.write(data)
+        view, digest = ingest(spool, max_bytes=len(data))
+        assert digest == hashlib.sha256(data).hexdigest()
+        assert bytes(view) == data
+
+
+def test_ingest_rejects_over_limit():
+    with pytest.raises(UploadTooLarge):
+        ingest(io.BytesIO(b"x" * 5000), max_bytes=4999)
+
+
+def _limited_app(**limits):
+    app = FastAPI()
+
+    @app.post("/upload")
+    @app.post("/api/predict/{organ}/batch")
+    @app.post("/api/predict/{organ}/volume")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+
+    app.add_middleware(UploadLimitMiddleware, **limits)
+    return app
+
+
+def _post(app, path, chunks):
+    async def body():
+        for chunk in chunks:
+            yield chunk
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, content=body(), headers={"content-type": "multipart/form-data; boundary=xyz"})
+
+    return asyncio.run(run())
+
+
+def test_middleware_rejects_file_while_streaming():
+    app = _limited_app(max_bytes=0, max_file_bytes=64 * 1024)
+    body = _multipart((b"big.png", b"x" * 1024 * 1024))
+    read = []
+    chunks = [body[i:i + 8192] for i in range(0, len(body), 8192)]
+    response = _post(app, "/upload", (read.append(c) or c for c in chunks))
+    assert response.status_code == 413
+    assert "File exceeds" in response.json()["detail"]
+    # Rejected after the limit (plus header allowance), well before the end of the body
+    assert len(read) < len(chunks) // 4
+
+
+def test_middleware_allows_files_under_limit_and_exempt_paths():
+    app = _limited_app(max_bytes=0, max_file_bytes=64 * 1024)
+    small = _multipart((b"a.png", b"a" * 60 * 1024))
+    assert _post(app, "/upload", [small]).json() == {"size": 60 * 1024}
+    big = _multipart((b"a.zip", b"z" * 256 * 1024))
+    assert _post(app, "/api/predict/Brain/batch", [big]).json() == {"size": 256 * 1024}
+
+
+def test_middleware_applies_path_file_limits():
+    volume_limit = ((re.compile(r"/api/predict/[^/]+/volume/?"), 256 * 1024),)
+    app = _limited_app(max_bytes=0, max_file_bytes=64 * 1024, path_file_limits=volume_limit)
+    study = _multipart((b"scan.npy", b"v" * 200 * 1024))
+    assert _post(app, "/api/predict/Brain/volume", [study]).json() == {"size": 200 * 1024}
+    assert _post(app, "/upload", [study]).status_code == 413
+    too_big = _multipart((b"scan.npy", b"v" * 400 * 1024))
+    assert _post(app, "/api/predict/Brain/volume", [too_big]).status_code == 413
@@ -0,0 +1,76 @@
+import gzip
+import io
+import struct
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from app.utils.volume import VolumeTooLarge, open_volume
+
+
+def _nifti(voxels):
+    # Minimal single-file NIfTI-1 image of int16 voxels stored (x, y, z)
+    header = bytearray(352)
+    struct.pack_into("<i", header, 0, 348)
+    struct.pack_into("<8h", header, 40, 3, *voxels.shape, 1, 1, 1, 1)
+    struct.pack_into("<h", header, 70, 4)
+    struct.pack_into("<3f", header, 108, 352.0, 1.0, 0.0)
+    header[344:348] = b"n+1\x00"
+    return bytes(header) + voxels.astype("<i2").tobytes(order="F")
+
+
+def test_nifti_gz_decompression_is_capped():
+    data = gzip.compress(_nifti(np.zeros((64, 64, 64))))
+    assert open_volume(data, "scan.nii.gz").count == 64
+    # A small gzip does not get to expand past the limit
+    with pytest.raises(VolumeTooLarge):
+        open_volume(data, "scan.nii.gz", max_bytes=100_000)
+
+
+def test_npy_voxel_count_is_capped():
+    buffer = io.BytesIO()
+    np.save(buffer, np.zeros((8, 32, 32), dtype=np.float32))
+    with pytest.raises(VolumeTooLarge):
+        open_volume(buffer.getvalue(), "scan.npy", max_bytes=8 * 32 * 32 * 4 - 1)
+
+
+def _dicom_tgz(count):
+    pydicom = pytest.importorskip("pydicom")
+    from pydicom.dataset import Dataset, FileMetaDataset
+    from pydicom.uid import ExplicitVRLittleEndian, generate_uid
+
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w:gz") as tar:
+        for z in range(count):
+            meta = FileMetaDataset()
+            meta.TransferSyntaxUID = ExplicitVRLittleEndian
+            meta.MediaStorageSOPClassUID = pydicom.uid.MRImageStorage
+            meta.MediaStorageSOPInstanceUID = generate_uid()
+            ds = Dataset()
+            ds.file_meta = meta
+            ds.Rows, ds.Columns = 64, 64
+            ds.BitsAllocated, ds.BitsStored, ds.HighBit = 16, 16, 15
+            ds.PixelRepresentation, ds.SamplesPerPixel, ds.PhotometricInterpretation = 0, 1, "MONOCHROME2"
+            ds.InstanceNumber = z
+            ds.PixelData = np.full((64, 64), z, dtype=np.uint16).tobytes()
+            data = io.BytesIO()
+            ds.save_as(data, enforce_file_format=True)
+            info = tarfile.TarInfo(f"IM{z:03d}.dcm")
+            info.size = len(data.getvalue())
+            tar.addfile(info, io.BytesIO(data.getvalue()))
+    return archive.getvalue()
+
+
+def test_dicom_archive_slices_read_concurrently():
+    volume = open_volume(_dicom_tgz(40), "series.tgz")
+    # Out-of-order reads from several threads, as the slice preparation pool does
+    order = [index for _ in range(5) for index in reversed(range(volume.count))]
+    with ThreadPoolExecutor(8) as pool:
+        values = list(pool.map(lambda index: float(volume.slice(index).mean()), order))
+    volume.close()
+    assert values == [float(index) for index in order]
+
+
+def test_dicom_archive_member_size_is_capped():
+    with pytest.raises(VolumeTooLarge):
+        open_volume(_dicom_tgz(2), "series.tgz", max_bytes=1024)